@@ -1,14 +1,36 @@
-from flask import Flask, render_template, url_for, flash, redirect, request
+from flask import Flask, render_template, url_for, flash, redirect, request, abort, jsonify, g, session, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, TextAreaField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import tuple_, event, func, table, column, literal_column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+from markupsafe import Markup, escape
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime
+import base64
+import hashlib
+import itertools
+import random
+import shlex
+import sqlite3
+import sys
+import threading
+import time
 from config import Config
 import os
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 app = Flask(__name__)
 app.config.from_object(Config)
 
@@ -17,9 +39,239 @@ if not os.path.exists('instance'):
 
 db = SQLAlchemy(app)
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+def is_busy_error(error):
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+def retry_on_busy(view):
+    """Повторяет view с записью в БД, если SQLite занят другим писателем."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        retries = app.config['DB_BUSY_RETRIES']
+        for attempt in range(retries + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if attempt == retries or not is_busy_error(e):
+                    raise
+                delay = app.config['DB_BUSY_RETRY_DELAY'] * 2 ** attempt * random.uniform(0.5, 1.5)
+                app.logger.warning(f"{request.endpoint}: БД занята, повтор {attempt + 1}/{retries} через {delay:.2f}с")
+                time.sleep(delay)
+    return wrapper
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные в текущем потоке, пока счетчик активен."""
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+_query_counters = threading.local()
+
+def _active_query_counters():
+    if not hasattr(_query_counters, 'stack'):
+        _query_counters.stack = []
+    return _query_counters.stack
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_query_counters():
+        counter.count += 1
+        counter.statements.append(statement)
+
+@contextmanager
+def query_budget(max_queries):
+    """Для тестов: падает с QueryBudgetExceeded, если блок выполнил больше max_queries запросов."""
+    counter = QueryCounter()
+    _active_query_counters().append(counter)
+    try:
+        yield counter
+    finally:
+        _active_query_counters().remove(counter)
+    if counter.count > max_queries:
+        statements = '\n'.join(counter.statements)
+        raise QueryBudgetExceeded(f"{counter.count} SQL-запросов при бюджете {max_queries}:\n{statements}")
+
+@app.before_request
+def start_query_counter():
+    if app.config['QUERY_BUDGET']:
+        g.query_counter = QueryCounter()
+        _active_query_counters().append(g.query_counter)
+
+@app.after_request
+def check_query_budget(response):
+    counter = g.get('query_counter')
+    if counter is not None:
+        budget = app.config['QUERY_BUDGET']
+        response.headers['X-Query-Count'] = str(counter.count)
+        if counter.count > budget:
+            app.logger.warning(f"{request.method} {request.path} ({request.endpoint}): "
+                               f"{counter.count} SQL-запросов при бюджете {budget}")
+    return response
+
+@app.teardown_request
+def stop_query_counter(exc):
+    counter = g.pop('query_counter', None)
+    if counter is not None:
+        _active_query_counters().remove(counter)
+
+class LRUCache:
+    """Кэш в памяти процесса: строки по ключу со сроком жизни, вытеснение самых старых по обращению."""
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at или None)
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        # Вызывается под self._lock; просроченная запись удаляется при чтении
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return [entry[0] if entry is not None else None for entry in (self._get(key, now) for key in keys)]
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._put(key, value, time.monotonic() + timeout if timeout else None)
+
+    def incr(self, key):
+        with self._lock:
+            # Как INCR в Redis: срок жизни существующего ключа сохраняется
+            entry = self._get(key, time.monotonic())
+            value = int(entry[0] if entry is not None else 0) + 1
+            self._put(key, str(value), entry[1] if entry is not None else None)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class NullCache:
+    """Ничего не хранит: кэширование выключено."""
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def clear(self):
+        pass
+
+class RedisCache:
+    """Тот же интерфейс поверх Redis: кэш общий для всех процессов приложения."""
+    def __init__(self, url, prefix='blog:'):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        return self.client.mget([self.prefix + key for key in keys]) if keys else []
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.prefix + key, value, ex=timeout)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+def configured_workers(argv=None):
+    """Число воркеров gunicorn: -w/--workers из командной строки или GUNICORN_CMD_ARGS, иначе WEB_CONCURRENCY."""
+    argv = sys.argv if argv is None else argv
+    args = shlex.split(os.environ.get('GUNICORN_CMD_ARGS', ''))
+    if argv and os.path.basename(argv[0]).startswith('gunicorn'):
+        args += argv[1:]  # в воркерах gunicorn sys.argv - командная строка мастера
+    workers = os.environ.get('WEB_CONCURRENCY', '1')
+    for i, arg in enumerate(args):
+        if arg in ('-w', '--workers') and i + 1 < len(args):
+            workers = args[i + 1]
+        elif arg.startswith('--workers='):
+            workers = arg.split('=', 1)[1]
+        elif arg.startswith('-w') and arg[2:].isdigit():
+            workers = arg[2:]
+    return int(workers) if workers.isdigit() else 1
+
+def create_cache(config):
+    if config['CACHE_REDIS_URL']:
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL задан, но пакет redis не установлен")
+        return RedisCache(config['CACHE_REDIS_URL'])
+    workers = configured_workers()
+    if workers > 1:
+        # Версии в памяти увеличиваются только в воркере, сделавшем запись: остальные отдавали бы
+        # устаревшие страницы до истечения CACHE_TIMEOUT
+        app.logger.warning(f"{workers} воркеров без CACHE_REDIS_URL: кэш страниц и фрагментов выключен")
+        return NullCache()
+    return LRUCache(config['CACHE_MAX_ENTRIES'])
+
+cache = create_cache(app.config)
+
+# Ключи кэша содержат версии ('feed', 'post:<id>'). Коммит, меняющий посты, увеличивает версии,
+# и старые записи становятся недостижимыми. Версии читаются до запроса к БД, поэтому
+# страница, собранная из данных до коммита, не попадет под новый ключ.
+def get_versions(names):
+    return [int(value or 0) for value in cache.get_many([f"version:{name}" for name in names])]
+
+def bump_versions(names):
+    for name in names:
+        cache.incr(f"version:{name}")
+
+def cached_page(*version_names):
+    """Кэширует GET-ответы анонимным пользователям. Имена версий форматируются аргументами view."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # Flash-сообщения принадлежат одному пользователю - такую страницу не кэшируем
+            if current_user.is_authenticated or '_flashes' in session:
+                return view(**kwargs)
+            names = [name.format(**kwargs) for name in version_names]
+            versions = '.'.join(str(version) for version in get_versions(names))
+            key = f"page:{versions}:{request.full_path}"
+            cached = cache.get_many([key])[0]
+            if cached is not None:
+                mimetype, body = cached.split('\n', 1)
+                return app.response_class(body, mimetype=mimetype)
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                cache.set(key, f"{response.mimetype}\n{response.get_data(as_text=True)}", app.config['CACHE_TIMEOUT'])
+            return response
+        return wrapper
+    return decorator
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
@@ -37,6 +289,9 @@ class User(db.Model, UserMixin):
         return f"User('{self.username}', '{self.email}')"
     
 class Post(db.Model):
+    # Индекс под ленту: сортировка и курсор идут по (data_posted, id)
+    __table_args__ = (db.Index('ix_post_data_posted_id', 'data_posted', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     data_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -45,6 +300,128 @@ class Post(db.Model):
 
     def __repr__(self):
         return f"Post('{self.title}', '{self.data_posted}')"
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_posts(session, flush_context):
+    changed = session.info.setdefault('changed_posts', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Post):
+            changed.add(obj.id)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_posts(session):
+    changed = session.info.pop('changed_posts', None)
+    if changed:
+        bump_versions(['feed'] + [f"post:{post_id}" for post_id in changed])
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def forget_changed_posts(session, previous_transaction):
+    session.info.pop('changed_posts', None)
+
+# Полнотекстовый индекс FTS5 над post(title, content). Таблица external content: тексты не
+# дублируются, индекс держат в синхроне триггеры, так что его видит любая запись в post.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE post_fts USING fts5(
+        title, content, content='post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ai AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ad AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_au AFTER UPDATE OF title, content ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+post_fts = table('post_fts', column('rowid'), column('title'), column('content'))
+
+def create_search_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'").first()
+    if not exists:
+        connection.exec_driver_sql(SEARCH_INDEX_DDL[0])
+        # Индексируем посты, написанные до появления поиска
+        connection.exec_driver_sql("INSERT INTO post_fts(post_fts) VALUES ('rebuild')")
+    for statement in SEARCH_INDEX_DDL[1:]:
+        connection.exec_driver_sql(statement)
+
+@event.listens_for(Post.__table__, 'after_create')
+def create_search_index_with_table(target, connection, **kw):
+    create_search_index(connection)
+
+SearchResult = namedtuple('SearchResult', ['post', 'title', 'snippet'])
+
+# Маркеры подсветки из FTS5 заменяются на <mark> уже после экранирования текста поста
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'
+
+def highlighted(text):
+    return Markup(str(escape(text)).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+def build_match_query(query_text):
+    # Пользовательский ввод не должен разбираться как синтаксис FTS5: каждое слово в кавычках.
+    # Префиксный поиск не включаем: короткий префикс раскрывается в тысячи терминов,
+    # и bm25 приходится считать почти по всей таблице
+    terms = ['"' + term.replace('"', '""') + '"' for term in query_text.split()]
+    return ' '.join(terms) or None
+
+def search_posts(query_text, page=1, per_page=None):
+    """Посты по релевантности bm25 (заголовок весит больше текста) и признак следующей страницы."""
+    per_page = per_page or app.config['SEARCH_RESULTS_PER_PAGE']
+    if db.engine.dialect.name != 'sqlite':
+        return search_posts_like(query_text, page, per_page)
+    match_query = build_match_query(query_text)
+    if match_query is None:
+        return [], False
+    fts = literal_column('post_fts')
+    rows = (db.session.query(
+                Post,
+                func.highlight(fts, 0, HIGHLIGHT_START, HIGHLIGHT_END),
+                func.snippet(fts, 1, HIGHLIGHT_START, HIGHLIGHT_END, '…', app.config['SEARCH_SNIPPET_TOKENS']))
+            .options(joinedload(Post.author))
+            .join(post_fts, post_fts.c.rowid == Post.id)
+            .filter(fts.op('MATCH')(match_query))
+            .order_by(func.bm25(fts, 10.0, 1.0), Post.id)
+            .limit(per_page + 1)
+            .offset((page - 1) * per_page)
+            .all())
+    results = [SearchResult(post, highlighted(title), highlighted(snippet)) for post, title, snippet in rows[:per_page]]
+    return results, len(rows) > per_page
+
+def search_posts_like(query_text, page, per_page):
+    # Запасной вариант для Postgres без FTS5: все слова должны встречаться в заголовке или тексте.
+    # Для больших объемов стоит перейти на tsvector + GIN
+    terms = query_text.split()
+    if not terms:
+        return [], False
+    query = Post.query.options(joinedload(Post.author))
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.filter(Post.title.ilike(pattern) | Post.content.ilike(pattern))
+    posts = (query.order_by(Post.data_posted.desc(), Post.id.desc())
+             .limit(per_page + 1).offset((page - 1) * per_page).all())
+    snippet_length = app.config['SEARCH_SNIPPET_TOKENS'] * 8
+    results = [SearchResult(post, escape(post.title), escape(post.content[:snippet_length])) for post in posts[:per_page]]
+    return results, len(posts) > per_page
+
+def post_fragment_key(post):
+    # Ключ из самих отображаемых полей, а не из версии: версия, прочитанная после загрузки поста,
+    # могла уже учесть правку, которой нет в загруженном объекте, и старый HTML лег бы под новый ключ
+    rendered = '\0'.join([post.title, post.content, post.data_posted.isoformat(), post.author.username])
+    return f"fragment:post:{post.id}:{hashlib.sha1(rendered.encode()).hexdigest()}"
+
+def render_post_fragments(posts):
+    """HTML карточек постов; каждая карточка кэшируется под хешем своего содержимого."""
+    keys = [post_fragment_key(post) for post in posts]
+    fragments = cache.get_many(keys)
+    for i, post in enumerate(posts):
+        if fragments[i] is None:
+            fragments[i] = render_template('_post.html', post=post)
+            cache.set(keys[i], fragments[i], app.config['CACHE_TIMEOUT'])
+    return [Markup(fragment) for fragment in fragments]
     
 @login_manager.user_loader
 def load_user(user_id):
@@ -73,13 +450,88 @@ class PostForm(FlaskForm):
     content = TextAreaField('Содержание', validators=[DataRequired()])
     submit = SubmitField('Опубликовать')
 
+FeedPage = namedtuple('FeedPage', ['posts', 'next_cursor', 'prev_cursor'])
+
+def encode_cursor(post):
+    raw = f"{post.data_posted.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        posted, post_id = raw.split('|')
+        return datetime.fromisoformat(posted), int(post_id)
+    except ValueError:
+        abort(400)
+
+def get_feed_page(after=None, before=None, per_page=None):
+    """Keyset-пагинация ленты: страница постов старше `after` или новее `before`."""
+    per_page = per_page or app.config['POSTS_PER_PAGE']
+    feed_key = tuple_(Post.data_posted, Post.id)
+    # Авторов грузим тем же запросом, иначе каждый post.author - отдельный SELECT
+    query = Post.query.options(joinedload(Post.author))
+    if before:
+        # Назад идем по возрастанию от курсора, потом разворачиваем страницу
+        query = query.filter(feed_key > decode_cursor(before)).order_by(Post.data_posted.asc(), Post.id.asc())
+    else:
+        if after:
+            query = query.filter(feed_key < decode_cursor(after))
+        query = query.order_by(Post.data_posted.desc(), Post.id.desc())
+    # Лишняя строка показывает, есть ли страница дальше, без COUNT(*)
+    posts = query.limit(per_page + 1).all()
+    has_more = len(posts) > per_page
+    posts = posts[:per_page]
+    if before:
+        posts.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = bool(after), has_more
+    if not posts:
+        return FeedPage(posts, None, None)
+    return FeedPage(posts,
+                    next_cursor=encode_cursor(posts[-1]) if has_older else None,
+                    prev_cursor=encode_cursor(posts[0]) if has_newer else None)
+
+def feed_page_from_request():
+    per_page = request.args.get('per_page', type=int)
+    if per_page is not None:
+        per_page = min(max(per_page, 1), app.config['POSTS_PER_PAGE_MAX'])
+    return get_feed_page(after=request.args.get('after'), before=request.args.get('before'), per_page=per_page)
+
 @app.route("/")
 @app.route("/home")
+@cached_page('feed')
 def home():
-    posts = Post.query.order_by(Post.data_posted.desc()).all()
-    return render_template('index.html', posts=posts)
+    page = feed_page_from_request()
+    return render_template('index.html', fragments=render_post_fragments(page.posts), page=page)
+
+@app.route("/api/posts")
+@cached_page('feed')
+def api_posts():
+    page = feed_page_from_request()
+    return jsonify({
+        'posts': [{
+            'id': post.id,
+            'title': post.title,
+            'author': post.author.username,
+            'data_posted': post.data_posted.isoformat(),
+            'url': url_for('post', post_id=post.id),
+        } for post in page.posts],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+@app.route("/search")
+@cached_page('feed')
+def search():
+    query_text = request.args.get('q', '').strip()
+    page = min(max(request.args.get('page', 1, type=int), 1), app.config['SEARCH_MAX_PAGE'])
+    results, has_next = search_posts(query_text, page)
+    return render_template('search.html', title='Поиск', query=query_text, results=results,
+                           page=page, has_next=has_next)
 
 @app.route("/register", methods=['GET', 'POST'])
+@retry_on_busy
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('home'))
@@ -116,6 +568,7 @@ def logout():
 
 @app.route("/post/new", methods=['GET', 'POST'])
 @login_required
+@retry_on_busy
 def create_post():
     form = PostForm()
     if form.validate_on_submit():
@@ -127,12 +580,15 @@ def create_post():
     return render_template('create_post.html', title='Новый пост', form=form)
 
 @app.route("/post/<int:post_id>")
+@cached_page('post:{post_id}')
 def post(post_id):
     post = Post.query.get_or_404(post_id)
-    return render_template(url_for('post_detail.html', title=post.title, post=post))
+    return render_template('post_detail.html', title=post.title, post=post,
+                           fragment=render_post_fragments([post])[0])
 
 @app.route("/post/<int:post_id>/update", methods=['GET', 'POST'])
 @login_required
+@retry_on_busy
 def update_post(post_id):
     post = Post.query.get_or_404(post_id)
     if post.author != current_user:
@@ -153,6 +609,7 @@ def update_post(post_id):
 
 @app.route("/post/<int:post_id>/delete", methods=['POST'])
 @login_required
+@retry_on_busy
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
     if post.author != current_user:
@@ -163,8 +620,25 @@ def delete_post(post_id):
     flash('Пост удален!', 'success')
     return redirect(url_for('home'))
 
+def init_db():
+    """Создает недостающие таблицы, индексы и поисковый индекс; уже написанные посты индексируются."""
+    db.create_all()
+    # create_all не добавляет новые индексы к уже существующим таблицам
+    for index in Post.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+
+# Схема готовится при импорте, а не только в __main__: под gunicorn и на старой blog.db иначе нет post_fts
+with app.app_context():
+    try:
+        init_db()
+    except OperationalError as e:
+        # Воркеры gunicorn импортируют приложение одновременно: таблицу мог только что создать соседний
+        if 'already exists' not in str(e.orig):
+            raise
+        init_db()
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     app.run(debug=True)
     
\ No newline at end of file
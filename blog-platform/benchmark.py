@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+
+# Нагрузочный тест БД: читатели листают ленту, пока писатели создают и правят посты.
+# Каждый читатель и писатель - отдельный процесс со своим движком, как воркеры gunicorn.
+
+READER_EMAIL = 'reader{}@example.com'
+WRITER_EMAIL = 'writer{}@example.com'
+PASSWORD = 'bench-password'
+RESULTS_GRACE = 60  # сверх длительности прогона: запуск процессов, импорт приложения, последний запрос
+
+
+def load_app(db_path, mode):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    if mode == 'default':
+        # Движок создается при импорте app, поэтому настройки меняются в Config до импорта.
+        # По умолчанию: журнал отката, без повторов при занятой БД, timeout и пул SQLAlchemy/sqlite3
+        from config import Config
+        Config.SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+        Config.DB_BUSY_RETRIES = 0
+        Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+    import app as blog
+    blog.app.config['WTF_CSRF_ENABLED'] = False
+    return blog
+
+
+def seed(db_path, mode, posts, readers, writers):
+    blog = load_app(db_path, mode)
+    with blog.app.app_context():
+        blog.db.create_all()
+        users = []
+        for email in [READER_EMAIL.format(i) for i in range(readers)] + [WRITER_EMAIL.format(i) for i in range(writers)]:
+            user = blog.User(username=email.split('@')[0], email=email)
+            user.set_password(PASSWORD)
+            users.append(user)
+        blog.db.session.add_all(users)
+        blog.db.session.flush()
+        blog.db.session.add_all(blog.Post(title=f"Пост {i}", content=f"Текст поста номер {i}. " * 20, user_id=users[i % len(users)].id)
+                                for i in range(posts))
+        blog.db.session.commit()
+
+
+def run_client(db_path, mode, role, number, duration, start_at, read_path, results):
+    # Результат кладется в очередь при любом исходе, иначе родитель ждал бы его вечно
+    done = errors = 0
+    latencies = []
+    failure = 'interrupted'
+    try:
+        blog = load_app(db_path, mode)
+        client = blog.app.test_client()
+        email = (READER_EMAIL if role == 'reader' else WRITER_EMAIL).format(number)
+        # Залогиненный пользователь обходит кэш страниц, так что каждое чтение идет в БД
+        if client.post('/login', data={'email': email, 'password': PASSWORD}).status_code != 302:
+            raise RuntimeError(f"login failed for {email}")
+        time.sleep(max(0.0, start_at - time.time()))
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            started_at = time.perf_counter()
+            try:
+                if role == 'reader':
+                    status = client.get(read_path).status_code
+                    ok = status == 200
+                else:
+                    status = client.post('/post/new', data={'title': f"Новый пост {number}-{done}",
+                                                            'content': "Текст под нагрузкой. " * 20}).status_code
+                    ok = status == 302
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started_at)
+            if ok:
+                done += 1
+            else:
+                errors += 1
+        failure = None
+    except Exception as e:
+        failure = f"{type(e).__name__}: {e}"
+    finally:
+        results.put((role, number, done, errors, sorted(latencies), failure))
+
+
+def run_mode(mode, args):
+    # Каталог с базой удаляется после прогона режима, даже если он упал
+    with tempfile.TemporaryDirectory(prefix='blog-bench-') as db_dir:
+        db_path = os.path.join(db_dir, 'blog.db')
+        context = multiprocessing.get_context('spawn')
+        seeder = context.Process(target=seed, args=(db_path, mode, args.posts, args.readers, args.writers))
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode != 0:
+            raise RuntimeError(f"seeding the {mode} database failed (exit code {seeder.exitcode})")
+
+        results = context.Queue()
+        start_at = time.time() + 3  # время на запуск процессов и импорт приложения
+        clients = [context.Process(target=run_client, args=(db_path, mode, 'reader', i, args.duration, start_at, args.read_path, results))
+                   for i in range(args.readers)]
+        clients += [context.Process(target=run_client, args=(db_path, mode, 'writer', i, args.duration, start_at, args.read_path, results))
+                    for i in range(args.writers)]
+        for client in clients:
+            client.start()
+        totals = {'reader': [0, 0, []], 'writer': [0, 0, []]}
+        # Процесс, убитый до finally (OOM, сигнал), ничего не пришлет: ждем не дольше прогона с запасом
+        results_deadline = start_at + args.duration + RESULTS_GRACE
+        for reported in range(len(clients)):
+            try:
+                role, number, done, errors, latencies, failure = results.get(timeout=max(0.0, results_deadline - time.time()))
+            except queue.Empty:
+                print(f"  {mode:<8} {len(clients) - reported} clients did not report in time, results are partial")
+                break
+            if failure:
+                print(f"  {mode:<8} {role} {number} failed: {failure}")
+            totals[role][0] += done
+            totals[role][1] += errors
+            totals[role][2].extend(latencies)
+        for client in clients:
+            client.join(timeout=5)
+            if client.is_alive():
+                client.terminate()
+                client.join()
+
+        for role, (done, errors, latencies) in totals.items():
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+            print(f"  {mode:<8} {role + 's':<8} {done / args.duration:8.1f} req/s  errors {errors:<5} p95 {p95:7.1f} ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Read throughput of the blog while posts are being written.")
+    arg_parser.add_argument('--readers', type=int, default=4, help="reader processes")
+    arg_parser.add_argument('--writers', type=int, default=2, help="writer processes")
+    arg_parser.add_argument('--posts', type=int, default=5000, help="posts seeded before the run")
+    arg_parser.add_argument('--duration', type=float, default=10, help="seconds per mode")
+    arg_parser.add_argument('--read-path', default='/', help="page the readers request, e.g. '/search?q=текст' for longer reads")
+    arg_parser.add_argument('--modes', nargs='+', default=['default', 'tuned'], choices=['default', 'tuned'])
+    args = arg_parser.parse_args()
+    print(f"{args.readers} readers of {args.read_path}, {args.writers} writers, {args.posts} posts, {args.duration:.0f}s per mode")
+    for mode in args.modes:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def blog(tmp_path_factory):
+    # config читает DATABASE_URL при импорте, поэтому база подменяется до import app
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'blog.db')
+    import app as blog
+    blog.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with blog.app.app_context():
+        blog.db.create_all()
+    return blog
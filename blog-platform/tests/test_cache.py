@@ -0,0 +1,29 @@
+def test_lru_cache_entries_expire(blog, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(blog.time, 'monotonic', lambda: now[0])
+    cache = blog.LRUCache(max_entries=10)
+    cache.set('page', 'body', timeout=300)
+    cache.set('version:feed', '3')
+    assert cache.get_many(['page', 'version:feed']) == ['body', '3']
+    now[0] += 301
+    assert cache.get_many(['page', 'version:feed']) == [None, '3']
+    assert cache.incr('version:feed') == 4
+
+
+def test_configured_workers(blog, monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    monkeypatch.delenv('GUNICORN_CMD_ARGS', raising=False)
+    assert blog.configured_workers(['pytest']) == 1
+    assert blog.configured_workers(['/usr/bin/gunicorn', '-w', '4', 'app:app']) == 4
+    assert blog.configured_workers(['gunicorn', '--workers=2', 'app:app']) == 2
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    assert blog.configured_workers(['pytest']) == 3
+    monkeypatch.setenv('GUNICORN_CMD_ARGS', '--bind 0.0.0.0:8000 -w2')
+    assert blog.configured_workers(['pytest']) == 2
+
+
+def test_memory_cache_is_disabled_with_several_workers(blog, monkeypatch):
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert isinstance(blog.create_cache(blog.app.config), blog.NullCache)
+    monkeypatch.setenv('WEB_CONCURRENCY', '1')
+    assert isinstance(blog.create_cache(blog.app.config), blog.LRUCache)
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def author_id(blog):
+    with blog.app.app_context():
+        user = blog.User(username='editor', email='editor@example.com')
+        user.set_password('password')
+        blog.db.session.add(user)
+        blog.db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def post_id(blog, author_id):
+    # Самый новый пост: всегда на первой странице ленты
+    with blog.app.app_context():
+        post = blog.Post(title='Исходный заголовок', content='Исходный текст', user_id=author_id,
+                         data_posted=datetime(2040, 1, 1))
+        blog.db.session.add(post)
+        blog.db.session.commit()
+        return post.id
+
+
+@pytest.fixture
+def anonymous(blog):
+    blog.cache.clear()
+    return blog.app.test_client()
+
+
+@pytest.fixture
+def author(blog, author_id):
+    client = blog.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(author_id)
+        session['_fresh'] = True
+    return client
+
+
+def page_texts(client, post_id):
+    api_titles = ' '.join(post['title'] for post in client.get('/api/posts').get_json()['posts'])
+    return [client.get(path).get_data(as_text=True) for path in ('/', f'/post/{post_id}')] + [api_titles]
+
+
+def test_cached_pages_show_edited_post(blog, anonymous, author, post_id):
+    # Первый проход кладет страницы и фрагменты в кэш, второй отдается из него
+    for _ in range(2):
+        assert all('Исходный заголовок' in text for text in page_texts(anonymous, post_id))
+
+    response = author.post(f'/post/{post_id}/update', data={'title': 'Новый заголовок', 'content': 'Новый текст'})
+    assert response.status_code == 302
+
+    feed, detail, api = page_texts(anonymous, post_id)
+    for text in (feed, detail):
+        assert 'Новый заголовок' in text and 'Новый текст' in text
+        assert 'Исходный' not in text
+    assert 'Новый заголовок' in api and 'Исходный' not in api
+
+
+def test_cached_pages_drop_deleted_post(blog, anonymous, author, post_id):
+    assert all('Исходный заголовок' in text for text in page_texts(anonymous, post_id))
+
+    assert author.post(f'/post/{post_id}/delete').status_code == 302
+
+    assert 'Исходный заголовок' not in anonymous.get('/').get_data(as_text=True)
+    assert anonymous.get(f'/post/{post_id}').status_code == 404
+
+
+def test_fragment_rendered_before_concurrent_edit_is_not_served_after_it(blog, anonymous, post_id):
+    with blog.app.test_request_context():
+        stale_post = blog.db.session.get(blog.Post, post_id)
+        stale_post.author  # как в ленте: автор загружен вместе с постом
+        # Правка другого запроса коммитится между загрузкой поста и рендером его карточки
+        with blog.app.app_context():
+            blog.db.session.get(blog.Post, post_id).title = 'Новый заголовок'
+            blog.db.session.commit()
+        assert 'Исходный заголовок' in blog.render_post_fragments([stale_post])[0]
+
+    feed, detail, _ = page_texts(anonymous, post_id)
+    assert 'Новый заголовок' in feed and 'Исходный заголовок' not in feed
+    assert 'Новый заголовок' in detail and 'Исходный заголовок' not in detail
@@ -0,0 +1,92 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+TIED_POSTS = 7
+PER_PAGE = 3
+
+
+@pytest.fixture(scope='module')
+def tied_post_ids(blog):
+    with blog.app.app_context():
+        user = blog.User(username='pager', email='pager@example.com')
+        user.set_password('password')
+        blog.db.session.add(user)
+        blog.db.session.flush()
+        # Одинаковый data_posted: порядок внутри группы держится только на id в курсоре
+        posted = datetime(2030, 1, 1, 12, 0, 0)
+        posts = [blog.Post(title=f'Одновременный {i}', content='Текст', user_id=user.id, data_posted=posted)
+                 for i in range(TIED_POSTS)]
+        posts.append(blog.Post(title='Ранний', content='Текст', user_id=user.id, data_posted=datetime(2029, 1, 1)))
+        blog.db.session.add_all(posts)
+        blog.db.session.commit()
+        return [post.id for post in posts]
+
+
+@pytest.fixture
+def client(blog, tied_post_ids):
+    blog.cache.clear()
+    return blog.app.test_client()
+
+
+def feed_ids(blog):
+    with blog.app.app_context():
+        return [post.id for post in blog.Post.query.order_by(blog.Post.data_posted.desc(), blog.Post.id.desc())]
+
+
+def get_page(client, **params):
+    response = client.get('/api/posts', query_string={'per_page': PER_PAGE, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_pages_through_tied_posts_without_gaps_or_repeats(blog, client, tied_post_ids):
+    pages, cursor = [], None
+    while True:
+        page = get_page(client, **({'after': cursor} if cursor else {}))
+        pages.append(page)
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    seen = [post['id'] for page in pages for post in page['posts']]
+    assert seen == feed_ids(blog)
+    assert set(tied_post_ids) <= set(seen)
+
+    # Обратно по prev_cursor получаются те же страницы
+    for newer, older in zip(pages, pages[1:]):
+        assert get_page(client, before=older['prev_cursor'])['posts'] == newer['posts']
+
+
+def test_last_page(blog, client, tied_post_ids):
+    ids = feed_ids(blog)
+    with blog.app.app_context():
+        before_oldest = blog.encode_cursor(blog.db.session.get(blog.Post, ids[-PER_PAGE - 1]))
+        oldest = blog.encode_cursor(blog.db.session.get(blog.Post, ids[-1]))
+    page = get_page(client, after=before_oldest)
+    assert [post['id'] for post in page['posts']] == ids[-PER_PAGE:]
+    assert page['next_cursor'] is None
+    assert page['prev_cursor'] is not None
+
+    page = get_page(client, after=oldest)
+    assert page == {'posts': [], 'next_cursor': None, 'prev_cursor': None}
+    assert client.get('/', query_string={'after': oldest}).status_code == 200
+
+
+def b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'garbage!',
+    'a',
+    b64(b'2030-01-01T12:00:00'),
+    b64(b'not-a-date|1'),
+    b64(b'2030-01-01T12:00:00|x'),
+    b64(b'2030-01-01T12:00:00|1|2'),
+    b64(b'\xff\xfe|1'),
+])
+@pytest.mark.parametrize('direction', ['after', 'before'])
+def test_bad_cursor_is_rejected(client, cursor, direction):
+    assert client.get('/api/posts', query_string={direction: cursor}).status_code == 400
+    assert client.get('/', query_string={direction: cursor}).status_code == 400
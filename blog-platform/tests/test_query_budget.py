@@ -0,0 +1,45 @@
+import pytest
+
+AUTHORS = 3
+POSTS = 25
+
+
+@pytest.fixture(scope='module')
+def post_ids(blog):
+    with blog.app.app_context():
+        users = []
+        for i in range(AUTHORS):
+            user = blog.User(username=f'author{i}', email=f'author{i}@example.com')
+            user.set_password('password')
+            users.append(user)
+        blog.db.session.add_all(users)
+        blog.db.session.flush()
+        posts = [blog.Post(title=f'Пост {i}', content=f'Текст поста номер {i} про запросы', user_id=users[i % AUTHORS].id)
+                 for i in range(POSTS)]
+        blog.db.session.add_all(posts)
+        blog.db.session.commit()
+        return [post.id for post in posts]
+
+
+@pytest.fixture
+def client(blog, post_ids):
+    client = blog.app.test_client()
+    # Залогиненный пользователь обходит кэш страниц: каждый рендер идет в БД
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    # Без кэша фрагментов: N+1 по авторам не должен прятаться за прогретым кэшем
+    blog.cache.clear()
+    return client
+
+
+@pytest.mark.parametrize('path, max_queries', [
+    ('/', 2),
+    ('/post/{post_id}', 3),  # пользователь сессии, пост, автор
+    ('/search?q=запросы', 2),
+])
+def test_page_fits_query_budget(blog, client, post_ids, path, max_queries):
+    with blog.query_budget(max_queries) as counter:
+        response = client.get(path.format(post_id=post_ids[1]))
+    assert response.status_code == 200
+    assert counter.count > 0
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Схема блога до появления поиска и индекса ленты
+OLD_SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(20) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+                   password_hash VARCHAR(128) NOT NULL);
+CREATE TABLE post (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL, data_posted DATETIME NOT NULL, content TEXT NOT NULL,
+                   user_id INTEGER NOT NULL REFERENCES user (id));
+INSERT INTO user VALUES (1, 'old', 'old@example.com', 'x');
+INSERT INTO post VALUES (1, 'Старый пост', '2020-01-01 00:00:00.000000', 'Написан до поиска', 1);
+"""
+
+SEARCH_REQUEST = """
+import app
+client = app.app.test_client()
+response = client.get('/search?q=старый')
+print(response.status_code, '/post/1"' in response.get_data(as_text=True))
+"""
+
+
+def test_search_works_on_existing_database_without_main(tmp_path):
+    db_path = tmp_path / 'blog.db'
+    connection = sqlite3.connect(db_path)
+    connection.executescript(OLD_SCHEMA)
+    connection.close()
+
+    # Как под gunicorn: приложение только импортируется, блок __main__ не выполняется
+    env = {**os.environ, 'DATABASE_URL': f'sqlite:///{db_path}'}
+    result = subprocess.run([sys.executable, '-c', SEARCH_REQUEST], cwd=APP_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['200', 'True']
+
+    connection = sqlite3.connect(db_path)
+    names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master")}
+    connection.close()
+    assert {'post_fts', 'post_fts_ai', 'post_fts_ad', 'post_fts_au', 'ix_post_data_posted_id'} <= names
+
+
+def test_search_index_follows_post_edits(blog):
+    with blog.app.app_context():
+        user = blog.User(username='searcher', email='searcher@example.com')
+        user.set_password('password')
+        post = blog.Post(title='Черновик', content='Про черепах', author=user)
+        blog.db.session.add(post)
+        blog.db.session.commit()
+        assert [result.post.id for result in blog.search_posts('черепах')[0]] == [post.id]
+
+        post.content = 'Про жирафов'
+        blog.db.session.commit()
+        assert blog.search_posts('черепах')[0] == []
+        assert [result.post.id for result in blog.search_posts('жирафов')[0]] == [post.id]
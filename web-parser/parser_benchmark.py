@@ -0,0 +1,159 @@
+import argparse
+import http.server
+import logging
+import os
+import threading
+import time
+
+from bs4 import BeautifulSoup
+
+from universal_web_parser_multi_browser import WebParser, create_extraction_pool
+
+# Поля в том же формате, что собирает parser_gui.py: {имя: (селектор, атрибут)}
+LISTING_FIELDS = {
+    'title': ('a.item__title', None),
+    'link': ('a.item__title', 'href'),
+    'date': ('span.item__date', None),
+    'image_src': ('img.item__img', 'src'),
+    'price': ('div.item__meta span.item__price', None),
+}
+
+
+def build_listing_page(item_count):
+    items = []
+    for i in range(item_count):
+        items.append(
+            f'<div class="item"><div class="item__body">'
+            f'<a class="item__title" href="/news/{i}">Item title number {i}</a>'
+            f'<span class="item__date">2024-01-{i % 28 + 1:02d}</span>'
+            f'<img class="item__img" src="/img/{i}.jpg" alt="">'
+            f'<div class="item__meta"><span class="item__price">{i * 10} UZS</span><p>Some description text {i}</p></div>'
+            f'</div></div>'
+        )
+    return f'<html><head><title>Listing</title></head><body><div class="list">{"".join(items)}</div>' \
+           f'<ul class="pager"><li class="next"><a href="/page/2">Next</a></li></ul></body></html>'
+
+
+def legacy_extract(html_content):
+    # Старый путь: полный BeautifulSoup(html.parser) и разбор CSS-селекторов для каждого поля каждого элемента
+    soup = BeautifulSoup(html_content, 'html.parser')
+    items = []
+    for item_element in soup.select('div.item'):
+        item_data = {}
+        for field_name, (field_selector, field_attribute) in LISTING_FIELDS.items():
+            found_element = item_element.select_one(field_selector)
+            if found_element:
+                item_data[field_name] = found_element.get(field_attribute) if field_attribute else found_element.get_text(strip=True)
+        if item_data:
+            items.append(item_data)
+    return items
+
+
+def time_it(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_parsing(args):
+    html_content = build_listing_page(args.items)
+    print(f"Listing page: {args.items} items, {len(html_content) / 1024:.0f} KiB, best of {args.repeat} x {args.pages} pages")
+
+    def run_pages(extract):
+        return lambda: [extract() for _ in range(args.pages)]
+
+    baseline, baseline_items = time_it(run_pages(lambda: legacy_extract(html_content)), args.repeat)
+    print(f"  {'legacy (bs4, per-item selectors)':<36} {baseline:8.3f}s")
+
+    for backend in WebParser.PARSER_BACKENDS:
+        parser = WebParser(parsing_mode='requests', parser_backend=backend)
+        if parser.parser_backend != backend:
+            print(f"  {backend:<36} skipped (not installed)")
+            continue
+        extract = lambda: parser.extract_multiple_items(parser.parse_html(html_content), 'div.item', LISTING_FIELDS)
+        elapsed, items = time_it(run_pages(extract), args.repeat)
+        status = "ok" if items == baseline_items else "MISMATCH"
+        print(f"  {backend + ' (compiled selectors)':<36} {elapsed:8.3f}s  x{baseline / elapsed:5.2f}  {status}")
+
+
+def serve_listing_pages(html_content):
+    # Локальный сервер, чтобы мерить весь конвейер (загрузка + разбор), а не только разбор
+    body = html_content.encode('utf-8')
+
+    class ListingHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ListingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_processes(args):
+    html_content = build_listing_page(args.items)
+    server = serve_listing_pages(html_content)
+    urls = [f"http://127.0.0.1:{server.server_port}/page/{i}" for i in range(args.pages)]
+    parser = WebParser(parsing_mode='requests', parser_backend=args.backend)
+    worker_counts = sorted({1, 2, 4, 8, os.cpu_count() or 1} | set(args.workers or []))
+    print(f"{args.pages} pages x {args.items} items, backend {parser.parser_backend}, {os.cpu_count()} CPUs")
+
+    def run(process_pool):
+        results = parser.iter_pages_parallel(urls, 'div.item', LISTING_FIELDS, process_pool=process_pool,
+                                             concurrency=args.fetch_threads, per_host_limit=args.fetch_threads, delay=0)
+        return sorted(len(items or []) for _, items in results)
+
+    try:
+        baseline, baseline_counts = time_it(lambda: run(None), args.repeat)
+        print(f"  {'threads only (GIL-bound extraction)':<38} {args.pages / baseline:8.1f} pages/s")
+        for worker_count in worker_counts:
+            with create_extraction_pool(worker_count) as process_pool:
+                run(process_pool) # Прогрев: запуск процессов и компиляция селекторов не входят в замер
+                elapsed, counts = time_it(lambda: run(process_pool), args.repeat)
+            status = "ok" if counts == baseline_counts else "MISMATCH"
+            label = f"process pool, {worker_count} workers"
+            print(f"  {label:<38} {args.pages / elapsed:8.1f} pages/s  x{baseline / elapsed:5.2f}  {status}")
+    finally:
+        parser.close_driver()
+        server.shutdown()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks for the web parser pipeline.")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    parsing = subparsers.add_parser('parsing', help="HTML parsing + extraction on large listing pages")
+    parsing.add_argument('--items', type=int, default=2000, help="items per listing page")
+    parsing.add_argument('--pages', type=int, default=5, help="pages per measurement")
+    parsing.add_argument('--repeat', type=int, default=3)
+    parsing.set_defaults(func=bench_parsing)
+
+    processes = subparsers.add_parser('processes', help="scaling of the process-pool parsing stage on a multi-URL job")
+    processes.add_argument('--items', type=int, default=2000, help="items per listing page")
+    processes.add_argument('--pages', type=int, default=32, help="URLs per job")
+    processes.add_argument('--backend', default='html.parser', choices=WebParser.PARSER_BACKENDS)
+    processes.add_argument('--workers', type=int, nargs='*', help="extra process counts to measure")
+    processes.add_argument('--fetch-threads', type=int, default=8)
+    processes.add_argument('--repeat', type=int, default=2)
+    processes.set_defaults(func=bench_processes)
+
+    args = arg_parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,10 @@ import os
 import logging
 import json
 import time
+import itertools
 
 # Импортируем классы из нашего парсера
-from universal_web_parser_multi_browser import WebParser, save_data_to_csv, save_data_to_json, ApiSender, DuplicateChecker
+from universal_web_parser_multi_browser import METRICS, AdaptiveRateLimiter, HttpResponseCache, SourceNotModified, create_extraction_pool, WebParser, StreamingCsvWriter, JsonArrayWriter, ColumnarWriter, ApiSender, DuplicateChecker, SeleniumDriverPool, DeliveryOutbox
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO,
@@ -43,9 +44,22 @@ class ParserApp:
         sys.stderr = self.text_handler
 
         self.parser = None
+        self.driver_pool = None # Пул "теплых" браузеров, живет между запусками и циклами мониторинга
+        self.driver_pool_key = None
+        self.driver_pool_lock = threading.Lock()
+        self.process_pool = None # Процессы для разбора страниц пагинации, запускаются при первой необходимости
         self.monitoring_timer = None
         self.stop_event = threading.Event()
-        self.duplicate_checker = DuplicateChecker(history_file="processed_items_history.json", id_field='link')
+        # История в SQLite: запись инкрементальная, при старте ничего не загружается. Старый JSON импортируется один раз.
+        self.duplicate_checker = DuplicateChecker(history_file="processed_items_history.sqlite3", id_field='link',
+                                                  backend='sqlite', migrate_from="processed_items_history.json",
+                                                  bloom_capacity=100000)
+        # Очередь доставки на диске: сбои целевого API не тормозят парсинг, повторы идут в фоне
+        self.outbox = DeliveryOutbox(outbox_file="delivery_outbox.sqlite3", dead_letter_file="delivery_dead_letter.jsonl")
+        # ETag/Last-Modified и хеш страницы: циклы мониторинга пропускают неизменившийся источник
+        self.http_cache = HttpResponseCache()
+        # Скорость запросов подстраивается под каждый хост (429/503, Retry-After, задержка ответа)
+        self.rate_limiter = AdaptiveRateLimiter()
 
         # --- Раздел 1: Основные настройки парсинга ---
         self.general_settings_frame = ttk.LabelFrame(master, text="1. Основные настройки (Источник данных)", padding=(10, 10))
@@ -182,6 +196,17 @@ class ParserApp:
         self.api_headers_text.grid(row=3, column=1, padx=5, pady=2, sticky="ew")
         self.api_headers_text.insert(tk.END, '{}')
         ttk.Label(self.api_sending_frame, text="*В формате JSON, для аутентификации или типа контента", font=('Helvetica', 7), foreground='gray').grid(row=4, column=1, sticky="w", padx=5)
+
+        ttk.Label(self.api_sending_frame, text="Элементов в запросе:").grid(row=5, column=0, sticky="w", pady=2, padx=5)
+        self.api_batch_size_entry = ttk.Entry(self.api_sending_frame, width=10)
+        self.api_batch_size_entry.grid(row=5, column=1, sticky="w", padx=5, pady=2)
+        self.api_batch_size_entry.insert(0, "1")
+        ttk.Label(self.api_sending_frame, text="*Больше 1 — элементы отправляются массивом (если целевой API принимает массивы)", font=('Helvetica', 7), foreground='gray').grid(row=6, column=1, sticky="w", padx=5)
+
+        ttk.Label(self.api_sending_frame, text="Параллельных запросов:").grid(row=7, column=0, sticky="w", pady=2, padx=5)
+        self.api_concurrency_entry = ttk.Entry(self.api_sending_frame, width=10)
+        self.api_concurrency_entry.grid(row=7, column=1, sticky="w", padx=5, pady=2)
+        self.api_concurrency_entry.insert(0, "4")
         self.api_sending_frame.grid_columnconfigure(1, weight=1)
 
         # --- Раздел 5: Мониторинг в реальном времени ---
@@ -215,6 +240,10 @@ class ParserApp:
         self.save_json_var.set(True)
         ttk.Checkbutton(self.save_options_frame, text="Сохранить в JSON", variable=self.save_json_var).pack(side="left", padx=5)
 
+        self.save_parquet_var = tk.BooleanVar(master)
+        self.save_parquet_var.set(False)
+        ttk.Checkbutton(self.save_options_frame, text="Сохранить в Parquet", variable=self.save_parquet_var).pack(side="left", padx=5)
+
         # --- Раздел 7: Действия ---
         self.button_frame = ttk.Frame(master, padding=(10, 5))
         self.button_frame.pack(padx=15, pady=8, fill="x", expand=False)
@@ -242,7 +271,7 @@ class ParserApp:
         self._on_parsing_type_change()
         self._on_pagination_change()
         
-    def _add_field(self, field_name_default="", selector_default="", attribute_default=""):
+    def _add_field(self, field_name_default="", selector_default="", attribute_default="", type_default="auto"):
         row = self.current_field_row
 
         frame = ttk.Frame(self.field_entries_container)
@@ -267,10 +296,15 @@ class ParserApp:
         attribute_entry.grid(row=0, column=5, padx=2, sticky="ew")
         attribute_entry.insert(0, attribute_default)
 
+        # Тип колонки для Parquet; 'auto' - определить по первым извлеченным значениям
+        type_var = tk.StringVar(frame)
+        type_menu = ttk.OptionMenu(frame, type_var, type_default, *ColumnarWriter.TYPES)
+        type_menu.grid(row=0, column=6, padx=2)
+
         remove_button = ttk.Button(frame, text="X", command=lambda: self._remove_field(frame), width=3)
-        remove_button.grid(row=0, column=6, padx=2)
+        remove_button.grid(row=0, column=7, padx=2)
 
-        self.field_entries.append({'frame': frame, 'name': field_name_entry, 'selector': selector_entry, 'attribute': attribute_entry,
+        self.field_entries.append({'frame': frame, 'name': field_name_entry, 'selector': selector_entry, 'attribute': attribute_entry, 'type': type_var,
                                    'selector_label': self.selector_label, 'attribute_label': self.attribute_label})
         self.current_field_row += 1
         self._update_field_labels() # Обновить тексты меток после добавления поля
@@ -386,10 +420,13 @@ class ParserApp:
             'max_pages': self.max_pages_entry.get(),
             'save_csv': self.save_csv_var.get(),
             'save_json': self.save_json_var.get(),
+            'save_parquet': self.save_parquet_var.get(),
             'enable_api': self.enable_api_var.get(),
             'api_url': self.api_url_entry.get(),
             'api_method': self.api_method_var.get(),
             'api_headers': self.api_headers_text.get("1.0", tk.END).strip(),
+            'api_batch_size': self.api_batch_size_entry.get(),
+            'api_concurrency': self.api_concurrency_entry.get(),
             'enable_monitoring': self.enable_monitoring_var.get(),
             'monitoring_interval': self.monitoring_interval_entry.get()
         }
@@ -397,7 +434,8 @@ class ParserApp:
             config_data['fields'].append({
                 'name': field['name'].get(),
                 'selector': field['selector'].get(),
-                'attribute': field['attribute'].get()
+                'attribute': field['attribute'].get(),
+                'type': field['type'].get()
             })
 
         file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
@@ -436,7 +474,8 @@ class ParserApp:
                 for field_data in config_data.get('fields', []): # Добавляем новые
                     self._add_field(field_name_default=field_data.get('name', ''),
                                     selector_default=field_data.get('selector', ''),
-                                    attribute_default=field_data.get('attribute', ''))
+                                    attribute_default=field_data.get('attribute', ''),
+                                    type_default=field_data.get('type', 'auto'))
 
                 self.pagination_var.set(config_data.get('pagination_enabled', False))
                 self.next_page_selector_entry.delete(0, tk.END)
@@ -446,6 +485,7 @@ class ParserApp:
 
                 self.save_csv_var.set(config_data.get('save_csv', True))
                 self.save_json_var.set(config_data.get('save_json', True))
+                self.save_parquet_var.set(config_data.get('save_parquet', False))
 
                 self.enable_api_var.set(config_data.get('enable_api', False))
                 self.api_url_entry.delete(0, tk.END)
@@ -453,6 +493,10 @@ class ParserApp:
                 self.api_method_var.set(config_data.get('api_method', 'POST'))
                 self.api_headers_text.delete("1.0", tk.END)
                 self.api_headers_text.insert(tk.END, config_data.get('api_headers', '{}'))
+                self.api_batch_size_entry.delete(0, tk.END)
+                self.api_batch_size_entry.insert(0, config_data.get('api_batch_size', '1'))
+                self.api_concurrency_entry.delete(0, tk.END)
+                self.api_concurrency_entry.insert(0, config_data.get('api_concurrency', '4'))
                 
                 self.enable_monitoring_var.set(config_data.get('enable_monitoring', False))
                 self.monitoring_interval_entry.delete(0, tk.END)
@@ -465,6 +509,37 @@ class ParserApp:
             except Exception as e:
                 messagebox.showerror("Ошибка загрузки", f"Не удалось загрузить настройки: {e}")
 
+    def _get_driver_pool(self, browser, headless):
+        with self.driver_pool_lock:
+            pool_key = (browser, headless)
+            if self.driver_pool is None or self.driver_pool_key != pool_key:
+                if self.driver_pool:
+                    self.driver_pool.close()
+                self.log_message(f"Запускаю пул браузеров ({browser.capitalize()})...")
+                self.driver_pool = SeleniumDriverPool(browser=browser, headless=headless, size=1)
+                self.driver_pool_key = pool_key
+            return self.driver_pool
+
+    def close_driver_pool(self):
+        with self.driver_pool_lock:
+            if self.driver_pool:
+                self.driver_pool.close()
+                self.driver_pool = None
+                self.driver_pool_key = None
+
+    def _get_process_pool(self):
+        with self.driver_pool_lock:
+            if self.process_pool is None:
+                self.log_message(f"Запускаю процессы разбора страниц ({os.cpu_count()} шт.)...")
+                self.process_pool = create_extraction_pool()
+            return self.process_pool
+
+    def close_process_pool(self):
+        with self.driver_pool_lock:
+            if self.process_pool:
+                self.process_pool.shutdown(wait=False, cancel_futures=True)
+                self.process_pool = None
+
     def start_single_parsing(self):
         if self.monitoring_timer:
             self._stop_monitoring()
@@ -485,6 +560,7 @@ class ParserApp:
                 messagebox.showwarning("Предупреждение", "Отправка по API не включена. Новые элементы будут обнаружены, но не отправлены.")
             
             self.stop_event.clear()
+            self.http_cache.forget() # Селекторы могли измениться: первый цикл всегда полный
             self.log_message(f"Запускаю мониторинг каждые {interval_seconds} секунд...")
             self.start_monitoring_button.config(state="disabled")
             self.stop_monitoring_button.config(state="normal")
@@ -527,10 +603,13 @@ class ParserApp:
         max_pages_str = self.max_pages_entry.get()
         save_csv = self.save_csv_var.get()
         save_json = self.save_json_var.get()
+        save_parquet = self.save_parquet_var.get()
         enable_api = self.enable_api_var.get()
         api_url = self.api_url_entry.get()
         api_method = self.api_method_var.get()
         api_headers_str = self.api_headers_text.get("1.0", tk.END).strip()
+        api_batch_size_str = self.api_batch_size_entry.get()
+        api_concurrency_str = self.api_concurrency_entry.get()
 
         if not url:
             self.log_message("Ошибка: URL не введен.")
@@ -538,12 +617,14 @@ class ParserApp:
             return
 
         item_fields_patterns = {}
+        field_types = {}
         for field_dict in self.field_entries:
             field_name = field_dict['name'].get()
             field_selector = field_dict['selector'].get()
             field_attribute = field_dict['attribute'].get() or None # Атрибут используется только для HTML
             if field_name and field_selector:
                 item_fields_patterns[field_name] = (field_selector, field_attribute)
+                field_types[field_name] = field_dict['type'].get()
             elif field_name or field_selector:
                  self.log_message(f"Предупреждение: Поле '{field_name or field_selector}' не будет использовано, так как отсутствует имя или селектор.")
         
@@ -595,8 +676,18 @@ class ParserApp:
                 self.log_message("Ошибка: Неверный формат JSON для заголовков API (Целевой API). Проверьте синтаксис.")
                 self.master.after(0, lambda: self.start_button.config(state="normal"))
                 return
+            try:
+                api_batch_size = int(api_batch_size_str)
+                api_concurrency = int(api_concurrency_str)
+                if api_batch_size <= 0 or api_concurrency <= 0:
+                    raise ValueError("Размер пачки и число параллельных запросов должны быть положительными.")
+            except ValueError:
+                self.log_message("Ошибка: Неверное значение для 'Элементов в запросе' или 'Параллельных запросов'. Введите целое число.")
+                self.master.after(0, lambda: self.start_button.config(state="normal"))
+                return
 
         parser = None
+        exporters = []
         try:
             # Преобразуем имя типа парсинга для WebParser
             parser_mode_map = {
@@ -606,67 +697,114 @@ class ParserApp:
             }
             parser_mode = parser_mode_map.get(parsing_type, "requests")
 
-            parser = WebParser(parsing_mode=parser_mode, headless=headless, browser=browser)
-            all_extracted_items = []
+            driver_pool = self._get_driver_pool(browser, headless) if parser_mode == "selenium" else None
+            # В Selenium ждем появления контейнера элемента вместо фиксированной паузы
+            wait_strategy = "selector" if parser_mode == "selenium" else "fixed"
+            parser = WebParser(parsing_mode=parser_mode, headless=headless, browser=browser, driver_pool=driver_pool,
+                               wait_strategy=wait_strategy, wait_selector=main_container_selector or None,
+                               parser_backend="lxml", http_cache=self.http_cache, rate_limiter=self.rate_limiter)
+            # Счетчики вместо списка всех элементов: в памяти держится только текущая пачка
+            counts = {'extracted': 0, 'new': 0, 'queued': 0}
+
+            # --- Сохранение в CSV/JSON (только при разовом парсинге) ---
+            # Файлы пишутся по мере извлечения страниц, а не одним дампом в конце
+            if not is_monitoring_cycle:
+                if save_csv:
+                    exporters.append(StreamingCsvWriter("parsed_data.csv", item_fields_patterns.keys()))
+                if save_json:
+                    exporters.append(JsonArrayWriter("parsed_data.json"))
+                if save_parquet:
+                    try:
+                        exporters.append(ColumnarWriter("parsed_data.parquet", item_fields_patterns.keys(), field_types=field_types))
+                    except RuntimeError as e:
+                        self.log_message(f"Ошибка: {e}")
+
+            def collect(batch_items):
+                # Пачка сразу уходит в файлы, дедупликацию и очередь доставки
+                counts['extracted'] += len(batch_items)
+                for exporter in exporters:
+                    exporter.write_items(batch_items)
+                new_items = self.duplicate_checker.filter_new_items(batch_items)
+                counts['new'] += len(new_items)
+                if not new_items:
+                    return
+                if enable_api:
+                    if counts['queued'] == 0:
+                        api_sender = ApiSender(api_url, api_headers_for_sending, batch_size=api_batch_size, concurrency=api_concurrency)
+                        self.outbox.set_sender(api_sender, api_method)
+                    counts['queued'] += self.outbox.enqueue(new_items)
+                    # Элементы уже надежно лежат в очереди: повторно их скачивать не нужно
+                    self.duplicate_checker.mark_as_processed(new_items)
+                    self.outbox.start()
+                elif is_monitoring_cycle:
+                    # Без отправки по API в режиме мониторинга элементы все равно отмечаются обработанными
+                    self.duplicate_checker.mark_as_processed(new_items)
 
             if parser_mode == "api":
-                json_data = parser.fetch_api_data(url, headers=source_api_headers)
-                if json_data:
-                    all_extracted_items = parser.extract_multiple_items(json_data, json_root_path, item_fields_patterns, is_json=True)
-                else:
+                # Ответ разбирается потоково: в памяти не держится весь JSON целиком
+                api_items = parser.iter_api_items(url, json_root_path, item_fields_patterns, headers=source_api_headers,
+                                                  only_if_changed=is_monitoring_cycle)
+                for batch_items in iter(lambda: list(itertools.islice(api_items, 500)), []):
+                    collect(batch_items)
+                if not counts['extracted']:
                     self.log_message("Не удалось получить или разобрать JSON данные API.")
             elif pagination_enabled: # HTML/Selenium with pagination
-                soups = parser.follow_pagination(url, next_page_selector, max_pages=max_pages)
-                for i, soup_page in enumerate(soups):
-                    page_items = parser.extract_multiple_items(soup_page, main_container_selector, item_fields_patterns, is_json=False)
-                    all_extracted_items.extend(page_items)
-                    self.log_message(f"Со страницы {i+1} извлечено {len(page_items)} элементов.")
+                # Разбор и извлечение страниц идут в отдельных процессах, пока загружаются следующие
+                process_pool = self._get_process_pool() if max_pages > 1 else None
+                pages = parser.iter_pagination_items(url, next_page_selector, main_container_selector, item_fields_patterns, max_pages=max_pages,
+                                                     only_if_changed=is_monitoring_cycle, process_pool=process_pool)
+                for page_number, page_items in pages:
+                    collect(page_items)
+                    self.log_message(f"Со страницы {page_number} извлечено {len(page_items)} элементов.")
             else: # HTML/Selenium without pagination
-                html_content = parser.fetch_html(url)
+                html_content = parser.fetch_html(url, only_if_changed=is_monitoring_cycle)
                 if html_content:
                     soup = parser.parse_html(html_content)
-                    if soup:
-                        all_extracted_items = parser.extract_multiple_items(soup, main_container_selector, item_fields_patterns, is_json=False)
+                    if soup is not None:
+                        collect(parser.extract_multiple_items(soup, main_container_selector, item_fields_patterns, is_json=False))
             
-            self.log_message(f"Парсинг завершен. Всего извлечено {len(all_extracted_items)} сырых элементов.")
+            self.log_message(f"Парсинг завершен. Всего извлечено {counts['extracted']} сырых элементов.")
+            if parser.parsing_mode == "selenium":
+                self.log_message(parser.latency_report())
+            else:
+                self.log_message(self.rate_limiter.stats_report())
+            self.log_message(self.duplicate_checker.stats_report())
 
-            # --- Логика дедупликации ---
-            new_items = self.duplicate_checker.filter_new_items(all_extracted_items)
-            
-            if new_items:
-                self.log_message(f"Найдено {len(new_items)} новых уникальных элементов после проверки дубликатов.")
-                
-                # --- Логика отправки API ---
+            if counts['new']:
+                self.log_message(f"Найдено {counts['new']} новых уникальных элементов после проверки дубликатов.")
                 if enable_api:
-                    api_sender = ApiSender(api_url, api_headers_for_sending)
-                    successfully_sent_items = api_sender.send_data(new_items, api_method)
-                    self.log_message(f"Успешно отправлено {len(successfully_sent_items)} новых элементов в API.")
-                    self.duplicate_checker.mark_as_processed(successfully_sent_items)
+                    self.log_message(f"В очередь доставки поставлено {counts['queued']} новых элементов (всего в очереди: {self.outbox.pending_count()}).")
                 else:
                     self.log_message("Отправка по API отключена. Новые элементы не будут отправлены.")
                     if is_monitoring_cycle:
                         self.log_message("Отмечены новые элементы как обработанные, даже без отправки через API (режим мониторинга).")
-                        self.duplicate_checker.mark_as_processed(new_items)
             else:
                 self.log_message("Новых уникальных элементов не найдено.")
+            # Валидаторы страницы сохраняются только после дедупликации и постановки в очередь:
+            # при сбое раньше этого места следующая проверка снова скачает и обработает страницу
+            self.http_cache.commit()
 
-            # --- Сохранение в CSV/JSON (только при разовом парсинге) ---
-            if not is_monitoring_cycle:
-                if all_extracted_items:
-                    if save_csv:
-                        save_data_to_csv(all_extracted_items, "parsed_data.csv")
-                    if save_json:
-                        save_data_to_json(all_extracted_items, "parsed_data.json")
-                else:
-                    self.log_message("Данные не извлечены с помощью предоставленных селекторов.")
+            if not is_monitoring_cycle and not counts['extracted']:
+                self.log_message("Данные не извлечены с помощью предоставленных селекторов.")
 
+        except SourceNotModified:
+            self.log_message("Источник не изменился с прошлой проверки. Парсинг и отправка пропущены.")
+            self.log_message(self.http_cache.stats_report())
         except Exception as e:
             self.log_message(f"Произошла непредвиденная ошибка во время парсинга: {e}")
             import traceback
             self.log_message(traceback.format_exc())
         finally:
+            self.http_cache.discard()
+            for exporter in exporters:
+                exporter.close()
             if parser:
                 parser.close_driver()
+            try:
+                # Метрики по этапам (загрузка, разбор, извлечение, дедупликация, отправка) в формате Prometheus
+                METRICS.write_file("parser_metrics.prom")
+            except OSError as e:
+                self.log_message(f"Не удалось записать метрики: {e}")
             
             if is_monitoring_cycle and not self.stop_event.is_set():
                 try:
@@ -693,15 +831,19 @@ class TextHandler(logging.Handler):
         msg = self.format(record)
         self.app_instance.master.after(0, lambda: self.app_instance.log_message(msg))
 
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ParserApp(root)
-    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root, app))
-    root.mainloop()
-
 def on_closing(root_window, app_instance):
     if app_instance.monitoring_timer:
         app_instance._stop_monitoring()
     if app_instance.parser and app_instance.parser.driver:
         app_instance.parser.close_driver()
-    root_window.destroy()
\ No newline at end of file
+    app_instance.close_driver_pool()
+    app_instance.close_process_pool()
+    app_instance.outbox.close()
+    app_instance.duplicate_checker.close()
+    root_window.destroy()
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = ParserApp(root)
+    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root, app))
+    root.mainloop()
\ No newline at end of file
@@ -0,0 +1,350 @@
+import argparse
+import glob
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from universal_web_parser_multi_browser import (WebParser, ApiSender, DuplicateChecker, SeleniumDriverPool, DeliveryOutbox, AdaptiveRateLimiter,
+                                                CrawlFrontier,
+                                                HttpResponseCache, SourceNotModified, create_extraction_pool, METRICS, MetricsRegistry)
+
+# Те же названия режимов, что сохраняет parser_gui.py в файл настроек
+PARSER_MODE_MAP = {
+    "Запросы (Статика)": "requests",
+    "Selenium (Динамика)": "selenium",
+    "API (JSON)": "api"
+}
+
+METRICS.describe('job_runs_total', 'counter', "Scheduled job runs by outcome: ok, unchanged, failed, skipped_overlap.")
+METRICS.describe('job_seconds', 'histogram', "Wall time of one job run.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('job_new_items_total', 'counter', "New (not yet processed) items found per job.")
+
+
+class ScrapeJob:
+    """
+    One monitored source, built from a config file saved by the GUI ("Сохранить настройки").
+    """
+    def __init__(self, name, config_data):
+        self.name = name
+        self.url = config_data.get('url', '')
+        self.parser_mode = PARSER_MODE_MAP.get(config_data.get('parsing_type', 'Запросы (Статика)'), 'requests')
+        self.browser = config_data.get('browser', 'Chrome').lower()
+        self.headless = config_data.get('headless', True)
+        self.main_container_selector = config_data.get('main_container_selector', '')
+        self.json_root_path = config_data.get('json_root_path', '')
+        self.pagination_enabled = config_data.get('pagination_enabled', False)
+        self.next_page_selector = config_data.get('next_page_selector', '')
+        self.enable_api = config_data.get('enable_api', False)
+        self.api_url = config_data.get('api_url', '')
+        self.api_method = config_data.get('api_method', 'POST')
+        # Обход раздела каталога по ссылкам вместо одной цепочки пагинации (только в файле настроек)
+        self.crawl_enabled = config_data.get('crawl_enabled', False)
+        self.crawl_link_selector = config_data.get('crawl_link_selector') or 'a[href]'
+        self.crawl_allow_patterns = config_data.get('crawl_allow_patterns') or []
+        self.crawl_deny_patterns = config_data.get('crawl_deny_patterns') or []
+
+        if not self.url:
+            raise ValueError("URL is not set.")
+
+        self.item_fields_patterns = {}
+        for field_data in config_data.get('fields', []):
+            field_name = field_data.get('name')
+            field_selector = field_data.get('selector')
+            if field_name and field_selector:
+                self.item_fields_patterns[field_name] = (field_selector, field_data.get('attribute') or None)
+        if not self.item_fields_patterns:
+            raise ValueError("No fields to extract are defined.")
+
+        if self.parser_mode == 'api':
+            if not self.json_root_path:
+                raise ValueError("'json_root_path' is required for API (JSON) parsing.")
+            self.pagination_enabled = False
+        elif not self.main_container_selector:
+            raise ValueError("'main_container_selector' is not set.")
+        if self.crawl_enabled and self.parser_mode == 'api':
+            raise ValueError("Crawling is not available for API (JSON) parsing.")
+        if self.pagination_enabled and not self.crawl_enabled and not self.next_page_selector:
+            raise ValueError("'next_page_selector' is required when pagination is enabled.")
+
+        self.source_api_headers = self._parse_json_setting(config_data, 'source_api_headers')
+        self.api_headers = self._parse_json_setting(config_data, 'api_headers')
+        self.max_pages = self._parse_positive_int(config_data, 'max_pages', 3) if self.pagination_enabled else 1
+        self.api_batch_size = self._parse_positive_int(config_data, 'api_batch_size', 1)
+        self.api_concurrency = self._parse_positive_int(config_data, 'api_concurrency', 4)
+        self.interval = self._parse_positive_int(config_data, 'monitoring_interval', 300)
+        self.crawl_max_depth = self._parse_positive_int(config_data, 'crawl_max_depth', 2)
+        self.crawl_max_pages = self._parse_positive_int(config_data, 'crawl_max_pages', 500)
+
+    @classmethod
+    def from_config_file(cls, config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config_data = json.load(f)
+        name = os.path.splitext(os.path.basename(config_path))[0]
+        return cls(name, config_data)
+
+    @staticmethod
+    def _parse_json_setting(config_data, key):
+        value = (config_data.get(key) or '').strip()
+        if not value:
+            return {}
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f"'{key}' is not valid JSON.")
+
+    @staticmethod
+    def _parse_positive_int(config_data, key, default):
+        try:
+            value = int(config_data.get(key, default))
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' must be an integer.")
+        if value <= 0:
+            raise ValueError(f"'{key}' must be a positive number.")
+        return value
+
+    def extract_items(self, parser, process_pool=None, frontier=None):
+        if self.crawl_enabled:
+            if frontier.pending_count() == 0:
+                # Прошлый обход завершен - начинаем новый; прерванный обход продолжается с места остановки
+                frontier.clear()
+                frontier.add_seeds([self.url])
+            all_extracted_items = []
+            for _, page_items in parser.crawl(frontier, self.main_container_selector, self.item_fields_patterns,
+                                              link_selector=self.crawl_link_selector, process_pool=process_pool):
+                all_extracted_items.extend(page_items)
+            return all_extracted_items
+        # Каждая проверка условная: неизменившийся источник поднимает SourceNotModified
+        if self.parser_mode == 'api':
+            return list(parser.iter_api_items(self.url, self.json_root_path, self.item_fields_patterns, headers=self.source_api_headers,
+                                              only_if_changed=True))
+        if self.pagination_enabled:
+            all_extracted_items = []
+            pages = parser.iter_pagination_items(self.url, self.next_page_selector, self.main_container_selector,
+                                                 self.item_fields_patterns, max_pages=self.max_pages, only_if_changed=True,
+                                                 process_pool=process_pool)
+            for _, page_items in pages:
+                all_extracted_items.extend(page_items)
+            return all_extracted_items
+        html_content = parser.fetch_html(self.url, only_if_changed=True)
+        soup = parser.parse_html(html_content)
+        if soup is None:
+            return []
+        return parser.extract_multiple_items(soup, self.main_container_selector, self.item_fields_patterns, is_json=False)
+
+
+class JobScheduler:
+    """
+    Runs many ScrapeJobs from one headless process: each job has its own interval (with jitter),
+    a job never overlaps with its own previous run, and at most `max_workers` jobs run at once.
+    Each job keeps its own duplicate history and delivery outbox under `state_dir`, and its own HTTP cache
+    so unchanged sources are skipped without parsing.
+    """
+    def __init__(self, max_workers=4, jitter=0.1, state_dir="scheduler_state", driver_pool_size=None, extraction_processes=0,
+                 metrics_file=None):
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.state_dir = state_dir
+        self.driver_pool_size = driver_pool_size or max_workers
+        self.metrics_file = metrics_file
+        self.jobs = {}
+        self.running_jobs = set()
+        self.duplicate_checkers = {}
+        self.outboxes = {}
+        self.http_caches = {}
+        self.frontiers = {}
+        self.driver_pools = {}
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape-job")
+        # Общий пул процессов для разбора страниц пагинации всех заданий (0 - разбор в потоке задания)
+        self.process_pool = create_extraction_pool(extraction_processes) if extraction_processes else None
+        # Один лимитер на все задания: несколько источников на одном хосте делят его скорость
+        self.rate_limiter = AdaptiveRateLimiter()
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    def add_job(self, job):
+        if job.name in self.jobs:
+            raise ValueError(f"Duplicate job name: {job.name}")
+        self.jobs[job.name] = job
+        safe_name = re.sub(r'[^\w.-]', '_', job.name)
+        self.duplicate_checkers[job.name] = DuplicateChecker(
+            history_file=os.path.join(self.state_dir, f"{safe_name}.history.sqlite3"), id_field='link',
+            backend='sqlite', bloom_capacity=100000)
+        self.http_caches[job.name] = HttpResponseCache()
+        if job.crawl_enabled:
+            self.frontiers[job.name] = CrawlFrontier(os.path.join(self.state_dir, f"{safe_name}.frontier.sqlite3"),
+                                                     max_depth=job.crawl_max_depth, max_pages=job.crawl_max_pages,
+                                                     allow_patterns=job.crawl_allow_patterns, deny_patterns=job.crawl_deny_patterns)
+        if job.enable_api:
+            outbox = DeliveryOutbox(outbox_file=os.path.join(self.state_dir, f"{safe_name}.outbox.sqlite3"),
+                                    dead_letter_file=os.path.join(self.state_dir, f"{safe_name}.dead_letter.jsonl"))
+            outbox.set_sender(ApiSender(job.api_url, job.api_headers, batch_size=job.api_batch_size,
+                                        concurrency=job.api_concurrency), job.api_method)
+            outbox.start()
+            self.outboxes[job.name] = outbox
+        # Первый запуск тоже разносим по времени, чтобы сотни источников не стартовали разом
+        self._push(job.name, time.time() + random.uniform(0, job.interval * self.jitter))
+        logging.info(f"Scheduled job '{job.name}' every {job.interval}s ({job.parser_mode}).")
+
+    def _push(self, job_name, run_at):
+        with self._lock:
+            heapq.heappush(self._schedule, (run_at, next(self._sequence), job_name))
+        self._wake_event.set()
+
+    def _next_run_at(self, job):
+        return time.time() + job.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _get_driver_pool(self, job):
+        pool_key = (job.browser, job.headless)
+        with self._lock:
+            if pool_key not in self.driver_pools:
+                self.driver_pools[pool_key] = SeleniumDriverPool(browser=job.browser, headless=job.headless,
+                                                                 size=self.driver_pool_size, prewarm=False)
+            return self.driver_pools[pool_key]
+
+    def run_job(self, job):
+        started_at = time.time()
+        parser = None
+        outcome = 'failed'
+        try:
+            driver_pool = self._get_driver_pool(job) if job.parser_mode == 'selenium' else None
+            parser = WebParser(parsing_mode=job.parser_mode, headless=job.headless, browser=job.browser,
+                               driver_pool=driver_pool, wait_strategy='selector' if job.parser_mode == 'selenium' else 'fixed',
+                               wait_selector=job.main_container_selector or None, parser_backend='lxml',
+                               http_cache=self.http_caches[job.name], rate_limiter=self.rate_limiter)
+            all_extracted_items = job.extract_items(parser, self.process_pool, self.frontiers.get(job.name))
+            duplicate_checker = self.duplicate_checkers[job.name]
+            new_items = duplicate_checker.filter_new_items(all_extracted_items)
+            if new_items and job.name in self.outboxes:
+                self.outboxes[job.name].enqueue(new_items)
+            duplicate_checker.mark_as_processed(new_items)
+            # Валидаторы сохраняются только после постановки в очередь, иначе сбой превратил бы следующую проверку в 304
+            self.http_caches[job.name].commit()
+            METRICS.inc('job_new_items_total', len(new_items), job=job.name)
+            outcome = 'ok'
+            logging.info(f"Job '{job.name}': {len(all_extracted_items)} items, {len(new_items)} new, "
+                         f"{time.time() - started_at:.1f}s.")
+        except SourceNotModified:
+            outcome = 'unchanged'
+            logging.info(f"Job '{job.name}': source unchanged, skipped ({time.time() - started_at:.1f}s).")
+        except Exception as e:
+            logging.exception(f"Job '{job.name}' failed: {e}")
+        finally:
+            self.http_caches[job.name].discard()
+            if parser:
+                parser.close_driver()
+            METRICS.inc('job_runs_total', job=job.name, outcome=outcome)
+            METRICS.observe('job_seconds', time.time() - started_at, job=job.name)
+            if self.metrics_file:
+                try:
+                    METRICS.write_file(self.metrics_file)
+                except OSError as e:
+                    logging.error(f"Could not write metrics file {self.metrics_file}: {e}")
+            with self._lock:
+                self.running_jobs.discard(job.name)
+            if not self._stop_event.is_set():
+                self._push(job.name, self._next_run_at(job))
+
+    def run_forever(self):
+        logging.info(f"Scheduler started with {len(self.jobs)} jobs and {self.max_workers} workers.")
+        while not self._stop_event.is_set():
+            with self._lock:
+                next_run_at = self._schedule[0][0] if self._schedule else None
+            wait_for = None if next_run_at is None else next_run_at - time.time()
+            if wait_for is None or wait_for > 0:
+                self._wake_event.wait(timeout=wait_for)
+                self._wake_event.clear()
+                continue
+
+            with self._lock:
+                _, _, job_name = heapq.heappop(self._schedule)
+                already_running = job_name in self.running_jobs
+                if not already_running:
+                    self.running_jobs.add(job_name)
+            if already_running:
+                # Предыдущий запуск еще идет: следующий будет запланирован по его завершении
+                logging.warning(f"Job '{job_name}' is still running. Skipping this run.")
+                METRICS.inc('job_runs_total', job=job_name, outcome='skipped_overlap')
+                continue
+            self.executor.submit(self.run_job, self.jobs[job_name])
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def shutdown(self):
+        self.stop()
+        self.executor.shutdown(wait=True)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=True)
+        for outbox in self.outboxes.values():
+            outbox.close()
+        for duplicate_checker in self.duplicate_checkers.values():
+            duplicate_checker.close()
+        for frontier in self.frontiers.values():
+            frontier.close()
+        for driver_pool in self.driver_pools.values():
+            driver_pool.close()
+        logging.info("Scheduler stopped.")
+
+
+def load_jobs(paths):
+    jobs = []
+    for path in paths:
+        config_paths = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        for config_path in config_paths:
+            try:
+                jobs.append(ScrapeJob.from_config_file(config_path))
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping job config {config_path}: {e}")
+    return jobs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Headless scheduler for job configs saved by parser_gui.py.")
+    arg_parser.add_argument('configs', nargs='+', help="config files or directories with *.json configs")
+    arg_parser.add_argument('--workers', type=int, default=4, help="global cap on concurrently running jobs")
+    arg_parser.add_argument('--jitter', type=float, default=0.1, help="interval jitter as a fraction of the interval")
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="processes for parsing paginated pages (0 parses in the job thread)")
+    arg_parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    arg_parser.add_argument('--metrics-file', help="rewrite this Prometheus text file after every job run")
+    arg_parser.add_argument('--state-dir', default="scheduler_state", help="directory for per-job history and outbox")
+    args = arg_parser.parse_args()
+
+    jobs = load_jobs(args.configs)
+    if not jobs:
+        logging.error("No valid job configs found.")
+        return
+
+    scheduler = JobScheduler(max_workers=args.workers, jitter=args.jitter, state_dir=args.state_dir,
+                             extraction_processes=args.processes, metrics_file=args.metrics_file)
+    for job in jobs:
+        scheduler.add_job(job)
+
+    metrics_server = METRICS.serve(args.metrics_port) if args.metrics_port else None
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.shutdown()
+        if metrics_server:
+            metrics_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
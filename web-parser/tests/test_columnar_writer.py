@@ -0,0 +1,47 @@
+import pytest
+
+from universal_web_parser_multi_browser import ColumnarWriter
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_auto_types_are_inferred_from_first_batch(tmp_path):
+    filename = str(tmp_path / "items.parquet")
+    items = [
+        {"title": "Первый", "price": "10", "rating": "4.5", "in_stock": "true", "published": "2024-01-02T03:04:05", "code": "007", "raw": 3},
+        {"title": "Второй", "price": "", "rating": "5", "in_stock": "false", "published": "2024-02-03", "code": "12", "raw": 2.5},
+    ]
+    with ColumnarWriter(filename, items[0].keys(), field_types={"title": "string"}) as writer:
+        writer.write_items(items)
+        writer.write_items([{"title": "Третий", "price": "n/a", "rating": "1", "in_stock": "true",
+                             "published": "2024-03-04", "code": "1", "raw": 1}])
+
+    table = pq.read_table(filename)
+    types = {field.name: str(field.type) for field in table.schema}
+    assert types == {"title": "string", "price": "string", "rating": "double", "in_stock": "bool",
+                     "published": "timestamp[us]", "code": "string", "raw": "double"}
+    columns = table.to_pydict()
+    assert columns["price"] == ["10", "", "n/a"]
+    assert columns["in_stock"] == [True, False, True]
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_value_that_does_not_fit_widens_written_column(tmp_path, file_format):
+    filename = str(tmp_path / f"items.{file_format}")
+    with ColumnarWriter(filename, ["title", "price"], file_format=file_format, row_group_size=2) as writer:
+        writer.write_items([{"title": "a", "price": "10"}, {"title": "b", "price": "20"}])
+        writer.write_items([{"title": "c", "price": "n/a"}, {"title": "d", "price": None}])
+
+    if file_format == "parquet":
+        table = pq.read_table(filename)
+    else:
+        import pyarrow as pa
+        with pa.memory_map(filename) as source:
+            table = pa.ipc.open_file(source).read_all()
+    assert str(table.schema.field("price").type) == "string"
+    assert table.to_pydict() == {"title": ["a", "b", "c", "d"], "price": ["10", "20", "n/a", None]}
+
+
+def test_unknown_type_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ColumnarWriter(str(tmp_path / "items.parquet"), ["title"], field_types={"title": "decimal"})
@@ -0,0 +1,43 @@
+from universal_web_parser_multi_browser import CrawlFrontier, canonicalize_url
+
+
+def test_canonicalize_url_keeps_reserved_escapes():
+    assert canonicalize_url("http://Example.com/a%2fb") == "http://example.com/a%2Fb"
+    assert canonicalize_url("http://example.com/a%2Fb") != canonicalize_url("http://example.com/a/b")
+    assert canonicalize_url("http://example.com/%7euser/%41/%2E%2E/x") == "http://example.com/~user/x"
+
+
+def test_released_urls_are_claimed_again(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / "frontier.db"))
+    frontier.add_seeds(["http://example.com/"])
+    [(url, fetch_url, depth)] = frontier.claim(10)
+    assert frontier.claim(10) == []
+    frontier.release([url])
+    assert frontier.claim(10) == [(url, fetch_url, depth)]
+    frontier.close()
+
+
+def test_page_limits_survive_restart(tmp_path):
+    frontier_file = str(tmp_path / "frontier.db")
+    frontier = CrawlFrontier(frontier_file, max_pages=3, max_pages_per_domain=2)
+    frontier.add_seeds(["http://example.com/", "http://example.org/"])
+    assert frontier.add_links(["/a", "/b"], "http://example.com/", 0) == 1
+    frontier.close()
+
+    frontier = CrawlFrontier(frontier_file, max_pages=4, max_pages_per_domain=2)
+    assert frontier.add_links(["/c"], "http://example.com/", 0) == 0
+    assert frontier.add_links(["/c", "/d"], "http://example.org/", 0) == 1
+    assert frontier.add_links(["/e"], "http://example.org/", 0) == 0
+    frontier.clear()
+    assert frontier.add_seeds(["http://example.com/", "http://example.com/x"]) == 2
+    frontier.close()
+
+
+def test_found_url_is_fetched_and_canonical_url_dedups(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / "frontier.db"))
+    frontier.add_seeds(["http://Example.com/#top"])
+    assert frontier.claim(10) == [("http://example.com/", "http://Example.com/", 0)]
+    assert frontier.add_links(["list?foo&b=2&a=1#x", "/list?a=1&b=2&foo=", "http://example.com/list?foo=&a=1&b=2"],
+                              "http://Example.com/", 0) == 1
+    assert frontier.claim(10) == [("http://example.com/list?a=1&b=2&foo=", "http://Example.com/list?foo&b=2&a=1", 1)]
+    frontier.close()
@@ -0,0 +1,46 @@
+from universal_web_parser_multi_browser import DeliveryOutbox
+
+
+class RecordingSender:
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.sent = []
+        self.closed = False
+
+    def send_data(self, items, method):
+        self.sent.append((method, [item_data['n'] for item_data in items]))
+        return items
+
+    def close(self):
+        self.closed = True
+
+
+def test_queued_items_keep_their_target(tmp_path):
+    outbox = DeliveryOutbox(str(tmp_path / "outbox.db"), str(tmp_path / "dead.jsonl"))
+    first, second = RecordingSender("http://a.example/api"), RecordingSender("http://b.example/api")
+    outbox.set_sender(first, 'POST')
+    outbox.enqueue([{'n': 1}, {'n': 2}])
+    outbox.set_sender(second, 'PUT')
+    outbox.enqueue([{'n': 3}])
+    assert outbox.drain_once() == (3, 0, 0)
+    assert first.sent == [('POST', [1, 2])]
+    assert second.sent == [('PUT', [3])]
+    assert not first.closed
+    outbox.close()
+    assert first.closed and second.closed
+
+
+def test_rows_without_sender_for_their_target_stay_queued(tmp_path):
+    outbox_file = str(tmp_path / "outbox.db")
+    outbox = DeliveryOutbox(outbox_file, str(tmp_path / "dead.jsonl"))
+    outbox.set_sender(RecordingSender("http://a.example/api"))
+    outbox.enqueue([{'n': 1}])
+    outbox.close()
+
+    outbox = DeliveryOutbox(outbox_file, str(tmp_path / "dead.jsonl"))
+    other = RecordingSender("http://b.example/api")
+    outbox.set_sender(other)
+    assert outbox.drain_once() == (0, 0, 0)
+    assert other.sent == []
+    assert outbox.pending_count() == 1
+    outbox.close()
@@ -0,0 +1,15 @@
+from universal_web_parser_multi_browser import HttpResponseCache
+
+
+def test_changed_response_is_stored_only_after_commit():
+    cache = HttpResponseCache()
+    headers = {"ETag": '"v1"'}
+    assert cache.record_response("http://example.com/", "hash-1", headers)
+    assert cache.conditional_headers("http://example.com/") == {}
+
+    # Обработка не завершилась: следующая проверка снова полная и снова видит изменения
+    cache.discard()
+    assert cache.record_response("http://example.com/", "hash-1", headers)
+    cache.commit("http://example.com/")
+    assert cache.conditional_headers("http://example.com/") == {"If-None-Match": '"v1"'}
+    assert not cache.record_response("http://example.com/", "hash-1", headers)
@@ -0,0 +1,93 @@
+import pytest
+
+from parser_benchmark import LISTING_FIELDS, build_listing_page
+from universal_web_parser_multi_browser import WebParser, lxml_html
+
+pytestmark = pytest.mark.skipif(lxml_html is None, reason="lxml is not installed")
+
+PAGE = """
+<html><head><style>.card { color: red; }</style><script>var tracking = 1;</script></head>
+<body>
+  <div class="card featured  new" data-id="1"><div class="card__body">
+    <h2 class="card__title">Hello <b>World</b><!-- hidden --></h2>
+    <script>window.cardData = {"id": 1};</script>
+    <style>.card__title { margin: 0; }</style>
+    <p class="card__text">First&nbsp;line
+      <br>second line <ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby> tail</p>
+    <template><span class="card__tpl">Template text</span></template>
+    <a class="card__link btn" rel="nofollow noopener" href="/items/1?ref=list&amp;page=2">More</a>
+    <img class="card__img" src="/img/1.jpg" alt="Picture &quot;one&quot;">
+    <script class="card__json" type="application/json">{"price": 10}</script>
+  </div></div>
+  <div class="card" data-id="2">
+    <h2 class="card__title">  Second   </h2>
+    <p class="card__text"></p>
+    <a class="card__link" href="/items/2">More</a>
+  </div>
+</body></html>
+"""
+
+FIELDS = {
+    'title': ('h2.card__title', None),
+    'text': ('p.card__text', None),
+    'body_text': ('div.card__body', None),
+    'link': ('a.card__link', 'href'),
+    'link_class': ('a.card__link', 'class'),
+    'link_rel': ('a.card__link', 'rel'),
+    'img_alt': ('img.card__img', 'alt'),
+    'json': ('script.card__json', None),
+    'template_span': ('span.card__tpl', None),
+    'missing': ('span.nope', None),
+}
+
+
+def extract(backend, html_content, item_selector, fields):
+    parser = WebParser(parsing_mode='requests', parser_backend=backend)
+    assert parser.parser_backend == backend
+    return parser.extract_multiple_items(parser.parse_html(html_content), item_selector, fields)
+
+
+def test_backends_extract_same_values():
+    bs4_items = extract('html.parser', PAGE, 'body div.card', FIELDS)
+    lxml_items = extract('lxml', PAGE, 'body div.card', FIELDS)
+    assert lxml_items == bs4_items
+    assert bs4_items[0]['title'] == 'HelloWorld'
+    assert bs4_items[0]['link_class'] == ['card__link', 'btn']
+    assert bs4_items[0]['body_text'].startswith('HelloWorldFirst')
+    assert 'cardData' not in bs4_items[0]['body_text']
+
+
+def test_backends_match_on_listing_page():
+    html_content = build_listing_page(50)
+    assert extract('lxml', html_content, 'div.item', LISTING_FIELDS) == \
+        extract('html.parser', html_content, 'div.item', LISTING_FIELDS)
+
+
+@pytest.mark.parametrize('item_selector, fields', [
+    ('body div.card:not(.card--hidden, .card--ad)', {'title': ('h2.card__title', None)}),
+    ('body div.card', {'title': ('h2:-soup-contains("Hello")', None), 'link': ('a.card__link', 'href')}),
+    ('body div.card', {'second': ('span:nth-child(2 of .card__tpl)', None), 'title': ('h2.card__title', None)}),
+])
+def test_soupsieve_only_selectors_fall_back_under_lxml(item_selector, fields):
+    bs4_items = extract('html.parser', PAGE, item_selector, fields)
+    assert bs4_items
+    assert extract('lxml', PAGE, item_selector, fields) == bs4_items
+
+
+def test_soupsieve_only_selector_on_lxml_element():
+    parser = WebParser(parsing_mode='requests', parser_backend='lxml')
+    card = parser.select_first(parser.parse_html(PAGE), 'body div.card')
+    assert parser.extract_data_from_html_element(card, 'a:-soup-contains("More")', 'href') == \
+        parser.extract_data_from_html_element(card, 'a.card__link', 'href')
+
+
+@pytest.mark.parametrize("selector", ['a.card__link', 'a[rel~="noopener"]', 'a.btn, img', '[data-id="2"] ', 'img.card__img', 'span.nope'])
+def test_next_page_scan_matches_lxml(selector):
+    parser = WebParser(parsing_mode='requests', parser_backend='lxml')
+    found = parser.select_first(parser.parse_html(PAGE), selector)
+    assert parser._scan_next_page_href(PAGE, selector) == (found.get('href') if found is not None else None, True)
+
+
+def test_next_page_scan_needs_parse_for_combinators():
+    parser = WebParser(parsing_mode='requests', parser_backend='lxml')
+    assert parser._scan_next_page_href(PAGE, 'div.card > a') == (None, False)
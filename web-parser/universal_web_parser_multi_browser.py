@@ -1,21 +1,116 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
+from bs4.builder import HTMLTreeBuilder
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.firefox.service import Service as FirefoxService
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.firefox import GeckoDriverManager
 import time
 import json
 import csv
 import logging
-from urllib.parse import urljoin
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from contextlib import contextmanager, nullcontext
+from email.utils import parsedate_to_datetime
+import http.server
+from abc import ABC, abstractmethod
+from urllib.parse import urljoin, urldefrag, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode, quote
 import os
+from html import unescape as html_unescape
+import posixpath
+import re
 import hashlib
+import math
+import multiprocessing
+import queue
+import random
+import sqlite3
+import tempfile
 import jmespath # Для парсинга JSON по JSONPath
+import asyncio
+from datetime import datetime
+
+try:
+    import aiohttp # Нужен только для режима 'async'
+except ImportError:
+    aiohttp = None
+
+import soupsieve
+
+try:
+    import pyarrow as pa # Колоночный экспорт (Parquet/Arrow)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import ijson # Потоковый разбор больших JSON-ответов API
+except ImportError:
+    ijson = None
+
+try:
+    from lxml import etree as lxml_etree # Быстрый бэкенд разбора HTML и поиск ссылки пагинации
+    from lxml import html as lxml_html
+    from cssselect import HTMLTranslator, SelectorError
+    from cssselect import parser as cssselect_parser
+except ImportError:
+    lxml_etree = None
+    lxml_html = None
+    HTMLTranslator = None
+    SelectorError = None
+    cssselect_parser = None
+
+# Чтобы бэкенд lxml давал те же значения, что и bs4: текст внутри этих тегов bs4 хранит отдельным типом строк
+# и не включает в get_text() внешних элементов, а эти атрибуты возвращает списком
+BS4_STRING_CONTAINERS = ('script', 'style', 'template', 'rt', 'rp')
+BS4_MULTI_VALUED_ATTRIBUTES = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+def lxml_text(element):
+    """
+    Equivalent of bs4 `get_text(strip=True)` for an lxml element.
+    """
+    wanted = element.tag if element.tag in BS4_STRING_CONTAINERS else None
+    context = wanted
+    if context is None:
+        context = next((ancestor.tag for ancestor in element.iterancestors(*BS4_STRING_CONTAINERS)), None)
+        if context is None and next(element.iter(*BS4_STRING_CONTAINERS), None) is None:
+            return ''.join(text.strip() for text in element.itertext())
+
+    parts = []
+    def walk(node, context):
+        if not isinstance(node.tag, str): # Комментарии и PI; их tail добавляет родитель
+            return
+        if node.tag in BS4_STRING_CONTAINERS:
+            context = node.tag
+        if context == wanted and node.text:
+            parts.append(node.text)
+        for child in node:
+            walk(child, context)
+            if context == wanted and child.tail:
+                parts.append(child.tail)
+    walk(element, context)
+    return ''.join(text.strip() for text in parts)
+
+def lxml_attribute(element, attribute):
+    value = element.get(attribute, None)
+    if value is not None and (attribute in BS4_MULTI_VALUED_ATTRIBUTES['*']
+                              or attribute in BS4_MULTI_VALUED_ATTRIBUTES.get(element.tag, ())):
+        return value.split()
+    return value
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -24,94 +119,985 @@ logging.basicConfig(level=logging.INFO,
                         logging.StreamHandler()
                     ])
 
+class AsyncTokenBucket:
+    """
+    Non-blocking token bucket for one host: `rate` requests per second, bursts up to `capacity`.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of latencies in seconds.
+    """
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def format(self, title):
+        lines = [f"{title}: {self.count} pages, mean {self.mean():.2f}s"]
+        lower = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), self.counts):
+            label = f"{lower}-{bound}s" if bound != float('inf') else f">{lower}s"
+            lines.append(f"  {label:>10}: {bucket_count}")
+            lower = bound
+        return "\n".join(lines)
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms for the pipeline stages, rendered in the Prometheus text format.
+    Can be served over HTTP (serve) or written to a file for node_exporter's textfile collector (write_file).
+    """
+    FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+    NETWORK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, prefix='webparser'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._descriptions = {} # имя -> (тип, описание, бакеты)
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, metric_type, help_text, buckets=None):
+        self._descriptions[name] = (metric_type, help_text, buckets)
+
+    def inc(self, name, value=1, **labels):
+        label_key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[label_key] = series.get(label_key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        label_key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(label_key)
+            if histogram is None:
+                description = self._descriptions.get(name)
+                histogram = LatencyHistogram(description[2] if description else self.FAST_BUCKETS)
+                series[label_key] = histogram
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def drain(self):
+        """
+        Returns everything recorded so far as plain data and resets the registry (used by worker processes).
+        """
+        with self._lock:
+            snapshot = {
+                'counters': self._counters,
+                'histograms': {name: {label_key: (h.buckets, h.counts, h.count, h.total) for label_key, h in series.items()}
+                               for name, series in self._histograms.items()},
+            }
+            self._counters = {}
+            self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        if not snapshot:
+            return
+        with self._lock:
+            for name, series in snapshot['counters'].items():
+                target = self._counters.setdefault(name, {})
+                for label_key, value in series.items():
+                    target[label_key] = target.get(label_key, 0) + value
+            for name, series in snapshot['histograms'].items():
+                target = self._histograms.setdefault(name, {})
+                for label_key, (buckets, counts, count, total) in series.items():
+                    histogram = target.get(label_key)
+                    if histogram is None:
+                        histogram = target[label_key] = LatencyHistogram(buckets)
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                    histogram.count += count
+                    histogram.total += total
+
+    @staticmethod
+    def _format_labels(label_key, extra=()):
+        pairs = list(label_key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{key}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms)):
+                metric_type, help_text, _ = self._descriptions.get(name, ('histogram' if name in self._histograms else 'counter', '', None))
+                full_name = f"{self.prefix}_{name}"
+                if help_text:
+                    lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                for label_key, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{full_name}{self._format_labels(label_key)} {value}")
+                for label_key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{full_name}_bucket{self._format_labels(label_key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{full_name}_sum{self._format_labels(label_key)} {histogram.total:.6f}")
+                    lines.append(f"{full_name}_count{self._format_labels(label_key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        # Запись через временный файл: читатель никогда не увидит файл наполовину
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Starts a background HTTP server with the metrics at /metrics. Returns the server (call shutdown() to stop).
+        """
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+        logging.info(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+        return server
+
+METRICS = MetricsRegistry()
+METRICS.describe('fetch_connect_seconds', 'histogram', "New HTTP connection setup: DNS + TCP + TLS.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('fetch_ttfb_seconds', 'histogram', "Time from sending a request to the response headers.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('fetch_download_seconds', 'histogram', "Time to download the response body after the headers.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('fetch_requests_total', 'counter', "Source HTTP requests by host and status ('error' if no response).")
+METRICS.describe('selenium_page_seconds', 'histogram', "Selenium page load including the readiness wait.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('http_cache_total', 'counter', "Conditional fetch results: changed, not_modified (304), unchanged (same body hash).")
+METRICS.describe('parse_seconds', 'histogram', "HTML parse time per page.", MetricsRegistry.FAST_BUCKETS)
+METRICS.describe('extract_container_seconds', 'histogram', "Main item selector time per page.", MetricsRegistry.FAST_BUCKETS)
+METRICS.describe('extract_field_seconds', 'histogram', "Per-field selector time per page, summed over items.", MetricsRegistry.FAST_BUCKETS)
+METRICS.describe('extract_items_total', 'counter', "Items extracted from HTML pages.")
+METRICS.describe('dedupe_checked_items_total', 'counter', "Item IDs checked against the processed history.")
+METRICS.describe('dedupe_duplicate_items_total', 'counter', "Checked item IDs that were already processed.")
+METRICS.describe('dedupe_bloom_skips_total', 'counter', "Item IDs the Bloom prefilter proved new without a store lookup.")
+METRICS.describe('dedupe_lookup_seconds', 'histogram', "History store lookup time per batch.", MetricsRegistry.FAST_BUCKETS)
+METRICS.describe('api_send_seconds', 'histogram', "Target API request time per payload.", MetricsRegistry.NETWORK_BUCKETS)
+METRICS.describe('api_sent_items_total', 'counter', "Items sent to the target API by outcome.")
+METRICS.describe('crawl_pages_total', 'counter', "Crawled pages by outcome: ok, failed.")
+METRICS.describe('crawl_links_total', 'counter', "Links found while crawling: admitted to the frontier or rejected (seen, rules, limits).")
+METRICS.describe('rate_limit_events_total', 'counter', "Adaptive rate limiter adjustments per host: increase, decrease, throttle, retry_after.")
+
+class _TimedConnectMixin:
+    def connect(self):
+        started_at = time.perf_counter()
+        super().connect()
+        METRICS.observe('fetch_connect_seconds', time.perf_counter() - started_at, host=self.host)
+
+class TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections report their setup time (DNS + TCP + TLS) to METRICS.
+    Reused keep-alive connections report nothing.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+class RateLimitSlot:
+    """
+    One request in flight under AdaptiveRateLimiter. The caller stores the response (if any) before the slot is released.
+    """
+    __slots__ = ('host', 'started_at', 'response')
+
+    def __init__(self, host):
+        self.host = host
+        self.started_at = time.perf_counter()
+        self.response = None
+
+class AdaptiveRateLimiter:
+    """
+    Per-host AIMD limiter for the blocking fetchers. Each host has a concurrency limit and a minimum
+    interval between request starts. Healthy responses (latency near the host's baseline) shorten the
+    interval and raise the concurrency by one per window; 429/5xx/connection errors halve the concurrency,
+    or double the interval once it is down to one; Retry-After pauses the host. Thread-safe; share one instance.
+    """
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, initial_concurrency=1, max_concurrency=16, initial_interval=1.0, min_interval=0.0, max_interval=60,
+                 latency_factor=2.0, max_retry_after=600):
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.latency_factor = latency_factor
+        self.max_retry_after = max_retry_after
+        self._hosts = {}
+        self._condition = threading.Condition()
+
+    def _host_state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = {
+                'concurrency': float(self.initial_concurrency),
+                'interval': self.initial_interval,
+                'in_flight': 0,
+                'next_start_at': 0.0,
+                'successes': 0,
+                'latency': None, # EWMA задержки
+                'baseline': None, # медленно растущий минимум EWMA - "здоровая" задержка хоста
+                'last_decrease_at': 0.0,
+            }
+            self._hosts[host] = state
+        return state
+
+    def acquire(self, url):
+        """
+        Blocks until the host of `url` has a free slot and its next start time has come.
+        """
+        host = urlparse(url).hostname
+        with self._condition:
+            state = self._host_state(host)
+            while True:
+                now = time.monotonic()
+                has_capacity = state['in_flight'] < int(state['concurrency'])
+                if has_capacity and now >= state['next_start_at']:
+                    state['in_flight'] += 1
+                    state['next_start_at'] = now + state['interval']
+                    return RateLimitSlot(host)
+                timeout = state['next_start_at'] - now if has_capacity else 1.0
+                self._condition.wait(timeout=max(timeout, 0.001))
+
+    def release(self, slot):
+        latency = time.perf_counter() - slot.started_at
+        status_code = slot.response.status_code if slot.response is not None else None
+        retry_after = self.parse_retry_after(slot.response.headers.get('Retry-After')) if slot.response is not None else None
+        with self._condition:
+            state = self._host_state(slot.host)
+            state['in_flight'] -= 1
+            now = time.monotonic()
+            if status_code is None or status_code in self.THROTTLE_STATUSES or status_code >= 500:
+                self._throttle(slot.host, state, now)
+            elif status_code < 400:
+                self._observe_success(slot.host, state, latency, now)
+            if retry_after:
+                state['next_start_at'] = max(state['next_start_at'], now + min(retry_after, self.max_retry_after))
+                METRICS.inc('rate_limit_events_total', host=slot.host, event='retry_after')
+                logging.warning(f"{slot.host} asked to retry after {retry_after:.0f}s.")
+            self._condition.notify_all()
+
+    def _throttle(self, host, state, now):
+        if state['concurrency'] >= 2:
+            state['concurrency'] = max(1.0, state['concurrency'] / 2)
+        else:
+            # Параллельность уже минимальна: дальше замедляемся интервалом между запросами
+            state['interval'] = min(self.max_interval, max(state['interval'] * 2, 0.5))
+        state['next_start_at'] = max(state['next_start_at'], now + state['interval'])
+        state['successes'] = 0
+        state['last_decrease_at'] = now
+        METRICS.inc('rate_limit_events_total', host=host, event='throttle')
+        logging.info(f"Rate limit for {host}: throttled to {int(state['concurrency'])} concurrent, {state['interval']:.2f}s interval.")
+
+    def _observe_success(self, host, state, latency, now):
+        state['latency'] = latency if state['latency'] is None else 0.7 * state['latency'] + 0.3 * latency
+        state['baseline'] = state['latency'] if state['baseline'] is None else min(state['latency'], state['baseline'] * 1.01)
+        if state['latency'] > self.latency_factor * state['baseline']:
+            # Не чаще одного снижения за время ответа: иначе один медленный всплеск обнулит окно
+            if now - state['last_decrease_at'] > state['latency']:
+                state['concurrency'] = max(1.0, state['concurrency'] * 0.75)
+                state['successes'] = 0
+                state['last_decrease_at'] = now
+                METRICS.inc('rate_limit_events_total', host=host, event='decrease')
+            return
+        state['interval'] = max(self.min_interval, state['interval'] * 0.9)
+        state['successes'] += 1
+        if state['successes'] >= int(state['concurrency']):
+            state['successes'] = 0
+            state['concurrency'] = min(float(self.max_concurrency), state['concurrency'] + 1)
+            METRICS.inc('rate_limit_events_total', host=host, event='increase')
+
+    @contextmanager
+    def request_slot(self, url):
+        slot = self.acquire(url)
+        try:
+            yield slot
+        except requests.exceptions.RequestException as e:
+            if slot.response is None:
+                slot.response = getattr(e, 'response', None)
+            raise
+        finally:
+            self.release(slot)
+
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value) # Retry-After может быть и HTTP-датой
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+
+    def stats_report(self):
+        with self._condition:
+            lines = [f"  {host}: {int(state['concurrency'])} concurrent, {state['interval']:.2f}s interval"
+                     + (f", latency {state['latency']:.2f}s" if state['latency'] is not None else "")
+                     for host, state in sorted(self._hosts.items())]
+        return "\n".join(["Adaptive rate limits:"] + lines)
+
+def _jmespath_field_chain(parsed):
+    # "title" или "a.b.c" -> ['a', 'b', 'c']; для остальных выражений None
+    if parsed['type'] == 'field':
+        return [parsed['value']]
+    if parsed['type'] == 'subexpression':
+        chain = []
+        for child in parsed['children']:
+            child_chain = _jmespath_field_chain(child)
+            if child_chain is None:
+                return None
+            chain.extend(child_chain)
+        return chain
+    return None
+
+def _jmespath_root_key_chain(parsed):
+    # Корневые пути вида "[]", "data.items", "data.items[*]" -> список ключей до массива; иначе None
+    node_type = parsed['type']
+    if node_type in ('identity', 'current'):
+        return []
+    if node_type == 'field':
+        return [parsed['value']]
+    if node_type == 'flatten':
+        return _jmespath_root_key_chain(parsed['children'][0])
+    if node_type == 'projection' and parsed['children'][1]['type'] == 'identity':
+        return _jmespath_root_key_chain(parsed['children'][0])
+    if node_type == 'subexpression':
+        chain = []
+        for child in parsed['children']:
+            child_chain = _jmespath_root_key_chain(child)
+            if child_chain is None:
+                return None
+            chain.extend(child_chain)
+        return chain
+    return None
+
+class JsonExtractionPlan:
+    """
+    JMESPath root path and field paths compiled once and applied to a whole list of items in one pass.
+    Invalid expressions are reported when the plan is built; invalid fields are left out of the plan.
+    """
+    def __init__(self, root_path, item_fields_patterns):
+        self.root_path = root_path
+        self.root = None
+        self.fields = []
+        self.errors = []
+
+        try:
+            self.root = jmespath.compile(root_path)
+        except jmespath.exceptions.JMESPathError as e:
+            self.errors.append(f"Invalid JSON root path '{root_path}': {e}")
+
+        for field_name, (field_path, _) in item_fields_patterns.items(): # Attribute is not used for JSON
+            try:
+                compiled = jmespath.compile(field_path)
+            except jmespath.exceptions.JMESPathError as e:
+                self.errors.append(f"Invalid JMESPath for field '{field_name}' ('{field_path}'): {e}")
+                continue
+            # Простые цепочки ключей обходим напрямую, без интерпретатора JMESPath
+            self.fields.append((field_name, compiled, _jmespath_field_chain(compiled.parsed)))
+
+        for error in self.errors:
+            logging.error(error)
+
+    @property
+    def is_valid(self):
+        return self.root is not None and bool(self.fields)
+
+    def ijson_prefix(self):
+        """
+        ijson prefix of the array selected by the root path, or None if the path cannot be streamed.
+        """
+        if self.root is None:
+            return None
+        chain = _jmespath_root_key_chain(self.root.parsed)
+        if chain is None or any('.' in key for key in chain):
+            return None
+        return '.'.join(chain + ['item'])
+
+    def select_items(self, json_data):
+        try:
+            items_list = self.root.search(json_data)
+        except jmespath.exceptions.JMESPathError as e:
+            # Например, несовпадение типов на неожиданном ответе: один плохой ответ не должен ронять весь прогон
+            logging.error(f"JMESPath error for JSON main item selector '{self.root_path}': {e}")
+            return []
+        if not isinstance(items_list, list):
+            logging.error(f"JSON main item selector '{self.root_path}' did not return a list. Got: {type(items_list)}")
+            return None
+        return items_list
+
+    def extract_item(self, item_data_dict, failed_fields=None):
+        item_data = {}
+        for field_name, compiled, key_chain in self.fields:
+            if key_chain is not None:
+                value = item_data_dict
+                for key in key_chain:
+                    if not isinstance(value, dict):
+                        value = None
+                        break
+                    value = value.get(key)
+            else:
+                try:
+                    value = compiled.search(item_data_dict)
+                except jmespath.exceptions.JMESPathError:
+                    if failed_fields is not None:
+                        failed_fields[field_name] = failed_fields.get(field_name, 0) + 1
+                    continue
+            if value is not None:
+                item_data[field_name] = value
+        return item_data
+
+    def run(self, json_data):
+        items_list = self.select_items(json_data)
+        if items_list is None:
+            return []
+        failed_fields = {}
+        extracted = []
+        for item_data_dict in items_list:
+            item_data = self.extract_item(item_data_dict, failed_fields)
+            if item_data:
+                extracted.append(item_data)
+        for field_name, count in failed_fields.items():
+            logging.warning(f"JMESPath evaluation failed for field '{field_name}' on {count} of {len(items_list)} items.")
+        return extracted
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+def install_selenium_driver_binary(browser):
+    if browser == 'chrome':
+        return ChromeDriverManager().install()
+    elif browser == 'firefox':
+        return GeckoDriverManager().install()
+    raise ValueError(f"Unsupported browser: {browser}. Use 'chrome' or 'firefox'.")
+
+def create_selenium_driver(browser, headless=True, driver_path=None):
+    """
+    Starts a new Chrome or Firefox WebDriver. Pass `driver_path` to skip the webdriver_manager install step.
+    """
+    if driver_path is None:
+        driver_path = install_selenium_driver_binary(browser)
+
+    if browser == 'chrome':
+        options = ChromeOptions()
+        service = ChromeService(driver_path)
+    elif browser == 'firefox':
+        options = FirefoxOptions()
+        service = FirefoxService(driver_path)
+    else:
+        raise ValueError(f"Unsupported browser: {browser}. Use 'chrome' or 'firefox'.")
+
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument(f"user-agent={DEFAULT_USER_AGENT}")
+
+    if browser == 'chrome':
+        return webdriver.Chrome(service=service, options=options)
+    return webdriver.Firefox(service=service, options=options)
+
+class SeleniumDriverPool:
+    """
+    Long-lived pool of warm WebDriver instances shared between parser runs.
+    Drivers are health-checked on checkout and recycled after `max_pages_per_driver` pages.
+    """
+    def __init__(self, browser='chrome', headless=True, size=2, max_pages_per_driver=200, prewarm=True):
+        self.browser = browser.lower()
+        self.headless = headless
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self._driver_path = None
+        self._idle = queue.LifoQueue()
+        self._page_counts = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+        if prewarm:
+            for _ in range(self.size):
+                driver = self._try_create_driver()
+                if driver:
+                    self._idle.put(driver)
+
+    def _try_create_driver(self):
+        with self._lock:
+            if self._closed or self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            if self._driver_path is None:
+                self._driver_path = install_selenium_driver_binary(self.browser)
+            driver = create_selenium_driver(self.browser, self.headless, driver_path=self._driver_path)
+        except Exception as e:
+            with self._lock:
+                self._created -= 1
+            logging.error(f"Error launching pooled Selenium WebDriver for {self.browser.capitalize()}: {e}")
+            return None
+        self._page_counts[id(driver)] = 0
+        logging.info(f"Pooled Selenium WebDriver for {self.browser.capitalize()} launched ({self._created}/{self.size}).")
+        return driver
+
+    def _discard(self, driver):
+        self._page_counts.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Error closing pooled Selenium WebDriver: {e}")
+
+    def is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def checkout(self, timeout=120):
+        """
+        Returns a healthy driver, starting a new one if the pool is not full yet.
+        Blocks up to `timeout` seconds when all drivers are busy, then raises TimeoutError.
+        Raises RuntimeError if the pool cannot start any browser.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._try_create_driver()
+                if driver is None:
+                    if self._closed or self._created == 0:
+                        raise RuntimeError("Selenium driver pool has no drivers available.")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a free Selenium driver.")
+                    # Ждем короткими отрезками: занятый драйвер может быть утилизирован вместо возврата
+                    # в очередь, и тогда освободившееся место нужно занять новым драйвером
+                    try:
+                        driver = self._idle.get(timeout=min(remaining, 1.0))
+                    except queue.Empty:
+                        continue
+            if self.is_healthy(driver):
+                return driver
+            logging.warning("Pooled Selenium WebDriver failed health check. Replacing it.")
+            self._discard(driver)
+
+    def checkin(self, driver, pages=1):
+        count = self._page_counts.get(id(driver), 0) + pages
+        if self._closed or count >= self.max_pages_per_driver:
+            if not self._closed:
+                logging.info(f"Recycling Selenium WebDriver after {count} pages.")
+            self._discard(driver)
+            return
+        self._page_counts[id(driver)] = count
+        self._idle.put(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+        logging.info("Selenium driver pool closed.")
+
+class SourceNotModified(Exception):
+    """
+    Raised by WebParser fetches with only_if_changed=True when the source has not changed since the last check.
+    """
+
+class HttpResponseCache:
+    """
+    Per-URL HTTP validators (ETag / Last-Modified) and body hash from the last conditional fetch.
+    Lives in memory for the lifetime of the GUI / scheduler, so the first check after a restart is always full.
+    A changed response stays pending until the caller commits it after extraction, dedupe and delivery;
+    a run that fails in between is fetched in full again on the next check.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.not_modified_count = 0
+        self.unchanged_body_count = 0
+        self.changed_count = 0
+
+    @staticmethod
+    def hash_body(body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return hashlib.sha256(body).hexdigest()
+
+    def conditional_headers(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record_not_modified(self, url):
+        METRICS.inc('http_cache_total', result='not_modified')
+        with self._lock:
+            self.not_modified_count += 1
+
+    def record_response(self, url, body_hash, response_headers=None):
+        """
+        Compares the body hash of a 200 response with the last committed one. Returns False if the body is
+        the same as last time. The validators of a changed body are kept pending until commit(url).
+        """
+        response_headers = response_headers or {}
+        entry = {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'body_hash': body_hash,
+        }
+        with self._lock:
+            previous = self._entries.get(url)
+            changed = previous is None or previous['body_hash'] != body_hash
+            if changed:
+                self._pending[url] = entry
+                self.changed_count += 1
+            else:
+                # Тело не изменилось: обрабатывать нечего, новые валидаторы можно сохранить сразу
+                self._entries[url] = entry
+                self.unchanged_body_count += 1
+        METRICS.inc('http_cache_total', result='changed' if changed else 'unchanged')
+        return changed
+
+    def commit(self, url=None):
+        """
+        Stores the pending validators of `url` (or of every pending URL) once its items are fully processed.
+        """
+        with self._lock:
+            urls = list(self._pending) if url is None else [url]
+            for pending_url in urls:
+                entry = self._pending.pop(pending_url, None)
+                if entry is not None:
+                    self._entries[pending_url] = entry
+
+    def discard(self, url=None):
+        with self._lock:
+            if url is None:
+                self._pending.clear()
+            else:
+                self._pending.pop(url, None)
+
+    def forget(self, url=None):
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+                self._pending.clear()
+            else:
+                self._entries.pop(url, None)
+                self._pending.pop(url, None)
+
+    def stats_report(self):
+        with self._lock:
+            return (f"HTTP cache: {self.changed_count} changed, {self.not_modified_count} not modified (304), "
+                    f"{self.unchanged_body_count} unchanged body.")
+
 class WebParser:
-    def __init__(self, parsing_mode='requests', headless=True, browser='chrome'):
+    WAIT_STRATEGIES = ('fixed', 'selector', 'network_idle', 'dom_stable')
+    PARSER_BACKENDS = ('html.parser', 'lxml')
+    # Скан открывающих тегов без построения дерева; комментарии и содержимое script/style пропускаются
+    START_TAG_PATTERN = re.compile(r'<!--.*?-->|<(script|style)(?=[\s/>]).*?</\1\s*>|<([a-zA-Z][\w:-]*)(\s[^>]*)?>', re.DOTALL | re.IGNORECASE)
+    ATTRIBUTE_PATTERN = re.compile(r'''([^\s"'=<>/]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?''')
+
+    def __init__(self, parsing_mode='requests', headless=True, browser='chrome', pool_size=10, driver_pool=None,
+                 wait_strategy='fixed', wait_selector=None, wait_timeout=10, parser_backend='html.parser', http_cache=None,
+                 rate_limiter=None):
+        """
+        rate_limiter: an AdaptiveRateLimiter. HTTP fetches then wait for it instead of the fixed `delay`
+        sleeps, and fetch_many ignores per_host_limit.
+        """
         self.parsing_mode = parsing_mode.lower()
+        self.http_cache = http_cache
+        self.rate_limiter = rate_limiter
+        if parser_backend not in self.PARSER_BACKENDS:
+            logging.error(f"Unsupported parser backend: {parser_backend}. Falling back to 'html.parser'.")
+            parser_backend = 'html.parser'
+        if parser_backend == 'lxml' and lxml_html is None:
+            logging.error("lxml/cssselect are not installed. Falling back to 'html.parser' backend.")
+            parser_backend = 'html.parser'
+        self.parser_backend = parser_backend
+        self._compiled_selectors = {}
+        self._soup_fallback_parser = None # html.parser для селекторов, которые cssselect не поддерживает
+        self._scan_matchers = {}
+        self._json_plans = {}
+        if wait_strategy not in self.WAIT_STRATEGIES:
+            logging.error(f"Unsupported wait strategy: {wait_strategy}. Falling back to 'fixed'.")
+            wait_strategy = 'fixed'
+        if wait_strategy == 'selector' and not wait_selector:
+            logging.error("Wait strategy 'selector' needs wait_selector. Falling back to 'fixed'.")
+            wait_strategy = 'fixed'
+        self.wait_strategy = wait_strategy
+        self.wait_selector = wait_selector
+        self.wait_timeout = wait_timeout
+        self.page_latency = LatencyHistogram()
+        self.fixed_sleep_baseline = LatencyHistogram()
+        self._latency_lock = threading.Lock()
         self.driver = None
+        self.driver_pool = driver_pool
         self.browser = browser.lower()
+        self.pool_size = pool_size
+        self.session = None
+        self._session_lock = threading.Lock()
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+        self.async_session = None
+        self._async_loop = None
+        self._host_buckets = {}
 
-        if self.parsing_mode == 'selenium':
+        if self.parsing_mode == 'selenium' and self.driver_pool is None:
             self._setup_selenium_driver(headless)
+        elif self.parsing_mode == 'async' and aiohttp is None:
+            logging.error("aiohttp is not installed. Falling back to 'requests' mode.")
+            self.parsing_mode = 'requests' # Fallback
 
     def _setup_selenium_driver(self, headless):
+        if self.browser not in ('chrome', 'firefox'):
+            logging.error(f"Unsupported browser: {self.browser}. Use 'chrome' or 'firefox'.")
+            self.parsing_mode = 'requests' # Fallback
+            return
         try:
-            if self.browser == 'chrome':
-                options = ChromeOptions()
-                service = ChromeService(ChromeDriverManager().install())
-            elif self.browser == 'firefox':
-                options = FirefoxOptions()
-                service = FirefoxService(GeckoDriverManager().install())
-            else:
-                logging.error(f"Unsupported browser: {self.browser}. Use 'chrome' or 'firefox'.")
-                self.parsing_mode = 'requests' # Fallback
-                return
-
-            if headless:
-                options.add_argument("--headless")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-            
-            if self.browser == 'chrome':
-                self.driver = webdriver.Chrome(service=service, options=options)
-            elif self.browser == 'firefox':
-                self.driver = webdriver.Firefox(service=service, options=options)
-
+            self.driver = create_selenium_driver(self.browser, headless)
             logging.info(f"Selenium WebDriver for {self.browser.capitalize()} launched successfully.")
         except Exception as e:
             logging.error(f"Error launching Selenium WebDriver for {self.browser.capitalize()}: {e}")
             self.parsing_mode = 'requests' # Fallback
             self.driver = None
 
-    def fetch_html(self, url, delay=1, retries=3):
+    def fetch_html(self, url, delay=1, retries=3, only_if_changed=False):
+        """
+        only_if_changed: with an http_cache, send conditional headers and raise SourceNotModified
+        on 304 or when the page body is the same as on the previous conditional fetch.
+        The validators of a changed page are stored only after http_cache.commit(url).
+        """
         logging.info(f"Fetching HTML for: {url}")
-        time.sleep(delay)
+        if self.rate_limiter is None or self.parsing_mode == 'selenium':
+            time.sleep(delay)
+        conditional = only_if_changed and self.http_cache is not None
 
-        if self.parsing_mode == 'selenium' and self.driver:
+        driver = self.driver
+        if self.parsing_mode == 'selenium' and driver is None and self.driver_pool is not None:
             try:
-                self.driver.get(url)
-                time.sleep(delay * 2) # Увеличиваем задержку для динамических сайтов
-                return self.driver.page_source
+                driver = self.driver_pool.checkout()
+            except RuntimeError as e:
+                logging.error(f"Selenium driver pool unavailable: {e} Falling back to 'requests' mode.")
+                self.parsing_mode = 'requests' # Fallback, как и при ошибке запуска одиночного драйвера
+            except TimeoutError as e:
+                logging.error(f"Selenium error fetching {url}: {e}")
+                return None
+
+        if self.parsing_mode == 'selenium' and driver:
+            try:
+                started_at = time.monotonic()
+                driver.get(url)
+                load_time = time.monotonic() - started_at
+                self._wait_until_ready(driver, url, delay)
+                html_content = driver.page_source
+                page_seconds = time.monotonic() - started_at
+                with self._latency_lock:
+                    self.page_latency.observe(page_seconds)
+                    self.fixed_sleep_baseline.observe(load_time + delay * 2)
+                METRICS.observe('selenium_page_seconds', page_seconds, host=urlparse(url).hostname)
+                if conditional:
+                    self._ensure_changed(url, HttpResponseCache.hash_body(html_content))
+                return html_content
+            except SourceNotModified:
+                raise
             except Exception as e:
                 logging.error(f"Selenium error fetching {url}: {e}")
                 return None
-        elif self.parsing_mode == 'requests':
+            finally:
+                if driver is not self.driver:
+                    self.driver_pool.checkin(driver)
+        elif self.parsing_mode in ('requests', 'async'):
             headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+                'User-Agent': DEFAULT_USER_AGENT
             }
+            if conditional:
+                headers.update(self.http_cache.conditional_headers(url))
+            host = urlparse(url).hostname
             for i in range(retries):
                 try:
-                    response = requests.get(url, headers=headers, timeout=15)
-                    response.raise_for_status()
-                    return response.text
+                    with self._request_slot(url) as slot:
+                        started_at = time.perf_counter()
+                        response = slot.response = self._get_session().get(url, headers=headers, timeout=15)
+                        self._observe_fetch(host, response, started_at)
+                        if conditional and response.status_code == 304:
+                            self._raise_not_modified(url)
+                        response.raise_for_status()
+                        if conditional:
+                            self._ensure_changed(url, HttpResponseCache.hash_body(response.content), response.headers)
+                        return response.text
                 except requests.exceptions.RequestException as e:
+                    if getattr(e, 'response', None) is None:
+                        METRICS.inc('fetch_requests_total', host=host, status='error')
                     logging.warning(f"Attempt {i+1}/{retries} Error requesting {url}: {e}")
-                    time.sleep(delay * (i + 1))
+                    self._retry_sleep(delay, i)
             logging.error(f"Failed to fetch HTML for {url} after {retries} attempts.")
             return None
         else:
             logging.error(f"Invalid parsing mode '{self.parsing_mode}' for HTML fetching.")
             return None
 
-    def fetch_api_data(self, url, headers=None, delay=1, retries=3):
+    def _wait_until_ready(self, driver, url, delay):
+        if self.wait_strategy == 'fixed':
+            time.sleep(delay * 2) # Увеличиваем задержку для динамических сайтов
+            return
+        try:
+            if self.wait_strategy == 'selector':
+                WebDriverWait(driver, self.wait_timeout).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, self.wait_selector)))
+            elif self.wait_strategy == 'network_idle':
+                # Сеть считается простаивающей, когда число загруженных ресурсов не меняется 0.5 с
+                probe = "return document.readyState === 'complete' ? performance.getEntriesByType('resource').length : -1"
+                self._wait_for_stable_value(driver, probe)
+            elif self.wait_strategy == 'dom_stable':
+                probe = "return document.getElementsByTagName('*').length + ':' + document.documentElement.innerHTML.length"
+                self._wait_for_stable_value(driver, probe)
+        except TimeoutException:
+            logging.warning(f"Page {url} was not ready after {self.wait_timeout}s ('{self.wait_strategy}'). Using current page source.")
+
+    def _wait_for_stable_value(self, driver, script, quiet_period=0.5, poll_interval=0.1):
+        deadline = time.monotonic() + self.wait_timeout
+        last_value = None
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            value = driver.execute_script(script)
+            now = time.monotonic()
+            if value != last_value or value == -1:
+                last_value = value
+                stable_since = now
+            elif now - stable_since >= quiet_period:
+                return
+            time.sleep(poll_interval)
+        raise TimeoutException()
+
+    def latency_report(self):
+        """
+        Per-page latency histogram for selenium fetches next to the fixed-sleep baseline.
+        """
+        with self._latency_lock:
+            if not self.page_latency.count:
+                return "No selenium page loads recorded."
+            saved = self.fixed_sleep_baseline.total - self.page_latency.total
+            return "\n".join([
+                self.page_latency.format(f"Page latency ('{self.wait_strategy}')"),
+                self.fixed_sleep_baseline.format("Fixed-sleep baseline"),
+                f"Time saved vs fixed sleeps: {saved:.2f}s over {self.page_latency.count} pages",
+            ])
+
+    def fetch_api_data(self, url, headers=None, delay=1, retries=3, only_if_changed=False):
         logging.info(f"Fetching API data from: {url}")
-        time.sleep(delay)
-        
+        if self.rate_limiter is None:
+            time.sleep(delay)
+        conditional = only_if_changed and self.http_cache is not None
+
         req_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'User-Agent': DEFAULT_USER_AGENT,
             'Accept': 'application/json'
         }
         if headers:
             req_headers.update(headers)
+        if conditional:
+            req_headers.update(self.http_cache.conditional_headers(url))
 
+        host = urlparse(url).hostname
         for i in range(retries):
             try:
-                response = requests.get(url, headers=req_headers, timeout=15)
-                response.raise_for_status()
+                with self._request_slot(url) as slot:
+                    started_at = time.perf_counter()
+                    response = slot.response = self._get_session().get(url, headers=req_headers, timeout=15)
+                    self._observe_fetch(host, response, started_at)
+                    if conditional and response.status_code == 304:
+                        self._raise_not_modified(url)
+                    response.raise_for_status()
+                    if conditional:
+                        self._ensure_changed(url, HttpResponseCache.hash_body(response.content), response.headers)
                 return response.json()
             except requests.exceptions.RequestException as e:
+                if getattr(e, 'response', None) is None:
+                    METRICS.inc('fetch_requests_total', host=host, status='error')
                 logging.warning(f"Attempt {i+1}/{retries} Error requesting API {url}: {e}")
-                time.sleep(delay * (i + 1))
+                self._retry_sleep(delay, i)
             except json.JSONDecodeError as e:
                 logging.error(f"Failed to decode JSON from API response for {url}: {e}")
                 logging.error(f"Response content: {response.text[:500]}...") # Log part of response for debugging
@@ -119,109 +1105,1108 @@ class WebParser:
         logging.error(f"Failed to fetch API data for {url} after {retries} attempts.")
         return None
 
-    def parse_html(self, html_content):
-        if not html_content:
-            return None
-        return BeautifulSoup(html_content, 'html.parser')
+    def iter_api_items(self, url, main_item_selector, item_fields_patterns, headers=None, delay=1, retries=3, only_if_changed=False):
+        """
+        Streams a JSON API response and yields extracted items one by one, so peak memory scales
+        with a single item rather than the whole payload. Uses the same field patterns as
+        extract_multiple_items(..., is_json=True). Falls back to fetch_api_data when ijson is
+        missing or the root path is not a plain path to an array.
+        """
+        plan = self.build_json_plan(main_item_selector, item_fields_patterns)
+        if not plan.is_valid:
+            return
+        prefix = plan.ijson_prefix()
+        if ijson is None or prefix is None:
+            if ijson is None:
+                logging.warning("ijson is not installed. Loading the whole API response into memory.")
+            else:
+                logging.warning(f"JSON root path '{main_item_selector}' cannot be streamed. Loading the whole API response into memory.")
+            json_data = self.fetch_api_data(url, headers=headers, delay=delay, retries=retries, only_if_changed=only_if_changed)
+            if json_data is not None:
+                yield from plan.run(json_data)
+            return
+
+        logging.info(f"Streaming API data from: {url}")
+        if self.rate_limiter is None:
+            time.sleep(delay)
+        conditional = only_if_changed and self.http_cache is not None
+        req_headers = {
+            'User-Agent': DEFAULT_USER_AGENT,
+            'Accept': 'application/json'
+        }
+        if headers:
+            req_headers.update(headers)
+        if conditional:
+            req_headers.update(self.http_cache.conditional_headers(url))
+
+        for i in range(retries):
+            items_seen = 0
+            try:
+                with self._request_slot(url) as slot:
+                    response = slot.response = self._get_session().get(url, headers=req_headers, timeout=15, stream=True)
+                # Слот освобождается, как только пришли заголовки: время, пока потребитель обрабатывает
+                # элементы между итерациями генератора, не должно считаться задержкой хоста
+                with response:
+                    if conditional and response.status_code == 304:
+                        self._raise_not_modified(url)
+                    response.raise_for_status()
+                    response.raw.decode_content = True # gzip/deflate распаковываются на лету
+                    source = self._spool_if_changed(url, response) if conditional else response.raw
+                    try:
+                        for item_data_dict in ijson.items(source, prefix, use_float=True):
+                            items_seen += 1
+                            item_data = plan.extract_item(item_data_dict)
+                            if item_data:
+                                yield item_data
+                    finally:
+                        if source is not response.raw:
+                            source.close()
+                logging.info(f"Streamed {items_seen} items from {url}.")
+                return
+            except (requests.exceptions.RequestException, Urllib3HTTPError, ijson.JSONError) as e:
+                # ijson читает response.raw напрямую, поэтому обрыв соединения или таймаут чтения
+                # приходят как исключения urllib3 (ProtocolError, ReadTimeoutError), а не requests
+                if items_seen:
+                    # Часть элементов уже отдана: повтор привел бы к дубликатам
+                    logging.error(f"API stream for {url} broke after {items_seen} items: {e}")
+                    return
+                logging.warning(f"Attempt {i+1}/{retries} Error streaming API {url}: {e}")
+                self._retry_sleep(delay, i)
+        logging.error(f"Failed to stream API data for {url} after {retries} attempts.")
+
+    def _request_slot(self, url):
+        if self.rate_limiter is None:
+            return nullcontext(RateLimitSlot(None))
+        return self.rate_limiter.request_slot(url)
+
+    def _retry_sleep(self, delay, attempt):
+        # С адаптивным лимитером пауза перед повтором берется из его состояния (интервал, Retry-After)
+        if self.rate_limiter is None:
+            time.sleep(delay * (attempt + 1))
+
+    @staticmethod
+    def _observe_fetch(host, response, started_at):
+        # response.elapsed - время до получения заголовков; остальное - загрузка тела
+        total_seconds = time.perf_counter() - started_at
+        ttfb_seconds = min(response.elapsed.total_seconds(), total_seconds)
+        METRICS.observe('fetch_ttfb_seconds', ttfb_seconds, host=host)
+        METRICS.observe('fetch_download_seconds', total_seconds - ttfb_seconds, host=host)
+        METRICS.inc('fetch_requests_total', host=host, status=str(response.status_code))
+
+    def _raise_not_modified(self, url):
+        self.http_cache.record_not_modified(url)
+        logging.info(f"Source not modified (304): {url}")
+        raise SourceNotModified(url)
+
+    def _ensure_changed(self, url, body_hash, response_headers=None):
+        if not self.http_cache.record_response(url, body_hash, response_headers):
+            logging.info(f"Source content unchanged since the last check: {url}")
+            raise SourceNotModified(url)
+
+    def _spool_if_changed(self, url, response, max_memory_size=8 * 1024 * 1024):
+        # Тело нужно целиком, чтобы сравнить хеш до разбора; большие ответы уходят во временный файл
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory_size)
+        body_hash = hashlib.sha256()
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                body_hash.update(chunk)
+                spool.write(chunk)
+            self._ensure_changed(url, body_hash.hexdigest(), response.headers)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def _get_session(self):
+        # Одна сессия на парсер: keep-alive соединения переиспользуются между запросами
+        with self._session_lock:
+            if self.session is None:
+                self.session = requests.Session()
+                adapter = InstrumentedHTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+            return self.session
+
+    def _get_host_semaphore(self, url, per_host_limit):
+        host = urlparse(url).netloc
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(per_host_limit)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def fetch_many(self, urls, concurrency=8, per_host_limit=4, delay=1, retries=3, is_json=False, headers=None):
+        """
+        Fetches many URLs concurrently over the pooled session.
+        Yields (url, content) tuples as soon as each request completes; content is None on failure.
+        At most `per_host_limit` requests run against the same host at once.
+        """
+        urls = list(urls)
+        if not urls:
+            return
+
+        if self.parsing_mode == 'selenium' and self.driver:
+            # Один драйвер нельзя использовать из нескольких потоков
+            for url in urls:
+                yield url, self.fetch_html(url, delay=delay, retries=retries)
+            return
+
+        def fetch_one(url):
+            host_limit = nullcontext() if self.rate_limiter else self._get_host_semaphore(url, per_host_limit)
+            with host_limit:
+                if is_json:
+                    return self.fetch_api_data(url, headers=headers, delay=delay, retries=retries)
+                return self.fetch_html(url, delay=delay, retries=retries)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        try:
+            futures = {executor.submit(fetch_one, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    logging.error(f"Unexpected error fetching {url}: {e}")
+                    content = None
+                yield url, content
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_pages_parallel(self, urls, main_item_selector, item_fields_patterns, process_pool=None, concurrency=8, per_host_limit=4,
+                            delay=1, retries=3):
+        """
+        Multi-URL pipeline: fetch_many threads do the I/O while parsing and extraction run in `process_pool`
+        (a ProcessPoolExecutor), so the CPU-bound stage is not serialized by the GIL.
+        Yields (url, items) as pages finish; items is None if the page could not be fetched or parsed.
+        Without a process pool, pages are extracted in the calling thread.
+        """
+        pending = {}
+
+        def finished(futures):
+            for future in futures:
+                url = pending.pop(future)
+                try:
+                    items, _, worker_metrics = future.result()
+                    METRICS.merge(worker_metrics)
+                except Exception as e:
+                    logging.error(f"Extraction worker failed for {url}: {e}")
+                    items = None
+                yield url, items
+
+        for url, html_content in self.fetch_many(urls, concurrency=concurrency, per_host_limit=per_host_limit, delay=delay, retries=retries):
+            if not html_content:
+                yield url, None
+                continue
+            if process_pool is None:
+                tree = self.parse_html(html_content)
+                yield url, self.extract_multiple_items(tree, main_item_selector, item_fields_patterns, is_json=False) if tree is not None else None
+                continue
+            pending[process_pool.submit(extract_page_in_worker, html_content, main_item_selector, item_fields_patterns, self.parser_backend)] = url
+            yield from finished([future for future in pending if future.done()])
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+
+    def crawl(self, frontier, main_item_selector, item_fields_patterns, link_selector='a[href]', concurrency=8, process_pool=None,
+              delay=1, retries=3, max_pages=None):
+        """
+        Crawls from a CrawlFrontier until it is empty (or `max_pages` pages were fetched in this call).
+        Pages are fetched concurrently with fetch_many, links matching `link_selector` go back into the frontier,
+        and items are extracted with the usual field patterns (in `process_pool` if given).
+        Yields (url, items) per successfully fetched page, with the URL as it was found (not its canonical form).
+        Progress lives in the frontier file, so a stopped crawl continues where it left off.
+        """
+        fetched_pages = 0
+        while max_pages is None or fetched_pages < max_pages:
+            batch_size = concurrency * 2 if max_pages is None else min(concurrency * 2, max_pages - fetched_pages)
+            claimed = frontier.claim(batch_size)
+            if not claimed:
+                break
+            fetched_pages += len(claimed)
+            batch = {url: depth for url, _, depth in claimed}
+            keys = {fetch_url: url for url, fetch_url, _ in claimed} # Запрашивается найденный URL, ключом остается канонический
+            pending = {}
+            # Завершенные URL убираются из batch; то, что осталось при исключении, возвращается в очередь
+            try:
+                for fetch_url, html_content in self.fetch_many(keys, concurrency=concurrency, delay=delay, retries=retries):
+                    url = keys[fetch_url]
+                    if not html_content:
+                        del batch[url]
+                        frontier.mark_failed(url)
+                        METRICS.inc('crawl_pages_total', outcome='failed')
+                        continue
+                    if process_pool is None:
+                        items, hrefs = self._extract_crawl_page(html_content, main_item_selector, item_fields_patterns, link_selector)
+                        yield fetch_url, self._finish_crawl_page(frontier, url, fetch_url, batch.pop(url), items, hrefs)
+                    else:
+                        future = process_pool.submit(crawl_page_in_worker, html_content, main_item_selector, item_fields_patterns,
+                                                     self.parser_backend, link_selector)
+                        pending[future] = fetch_url
+                for future in as_completed(pending):
+                    fetch_url = pending[future]
+                    url = keys[fetch_url]
+                    try:
+                        items, hrefs, worker_metrics = future.result()
+                        METRICS.merge(worker_metrics)
+                    except Exception as e:
+                        logging.error(f"Extraction worker failed for {fetch_url}: {e}")
+                        del batch[url]
+                        frontier.mark_failed(url)
+                        METRICS.inc('crawl_pages_total', outcome='failed')
+                        continue
+                    yield fetch_url, self._finish_crawl_page(frontier, url, fetch_url, batch.pop(url), items, hrefs)
+            except BaseException as e:
+                for future in pending:
+                    future.cancel()
+                if batch:
+                    if isinstance(e, Exception):
+                        # Сбой посреди пачки считается попыткой: страница, которая всегда роняет разбор, уйдет в failed
+                        logging.error(f"Crawl batch failed with {len(batch)} unfinished URLs: {e}")
+                        for url in batch:
+                            frontier.mark_failed(url)
+                    else:
+                        # Потребитель остановил обход (GeneratorExit, KeyboardInterrupt) - попытка не засчитывается
+                        frontier.release(batch)
+                raise
+            logging.info(frontier.stats_report())
+
+    def _finish_crawl_page(self, frontier, url, fetch_url, depth, items, hrefs):
+        # Сначала ссылки, потом отметка: при падении между ними страница просто будет пройдена снова
+        frontier.add_links(hrefs, fetch_url, depth)
+        frontier.mark_done(url)
+        METRICS.inc('crawl_pages_total', outcome='ok')
+        return items
+
+    def _extract_crawl_page(self, html_content, main_item_selector, item_fields_patterns, link_selector):
+        tree = self.parse_html(html_content)
+        if tree is None:
+            return [], []
+        hrefs = [href for href in (element.get('href') for element in self.select_elements(tree, link_selector)) if href]
+        items = self.extract_multiple_items(tree, main_item_selector, item_fields_patterns, is_json=False)
+        if isinstance(tree, BeautifulSoup):
+            tree.decompose()
+        return items, hrefs
+
+    def _bind_event_loop(self):
+        # Сессия aiohttp и asyncio.Lock в бакетах привязаны к loop, в котором созданы.
+        # Новый asyncio.run() с тем же парсером получает свои экземпляры, старые брошены вместе со своим loop
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            if self.async_session is not None and not self.async_session.closed:
+                # Закрыть сессию из чужого loop нельзя; ее соединения умерли вместе с тем loop
+                self.async_session.detach()
+            self._async_loop = loop
+            self.async_session = None
+            self._host_buckets = {}
+
+    def _get_async_session(self):
+        # Сессия создается лазейно внутри работающего event loop
+        self._bind_event_loop()
+        if self.async_session is None or self.async_session.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size)
+            self.async_session = aiohttp.ClientSession(connector=connector)
+        return self.async_session
+
+    def _get_host_bucket(self, url, delay):
+        self._bind_event_loop()
+        host = urlparse(url).netloc
+        bucket = self._host_buckets.get(host)
+        if bucket is None and delay > 0:
+            bucket = AsyncTokenBucket(rate=1 / delay)
+            self._host_buckets[host] = bucket
+        return bucket
+
+    async def _afetch(self, url, headers, delay, retries, timeout, is_json):
+        bucket = self._get_host_bucket(url, delay)
+        session = self._get_async_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        for i in range(retries):
+            if bucket:
+                await bucket.acquire()
+            try:
+                async with session.get(url, headers=headers, timeout=client_timeout) as response:
+                    response.raise_for_status()
+                    if is_json:
+                        return await response.json(content_type=None)
+                    return await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Attempt {i+1}/{retries} Error requesting {url}: {e}")
+                await asyncio.sleep(delay * (i + 1))
+            except json.JSONDecodeError as e:
+                logging.error(f"Failed to decode JSON from API response for {url}: {e}")
+                return None
+        logging.error(f"Failed to fetch {url} after {retries} attempts.")
+        return None
+
+    async def afetch_html(self, url, delay=1, retries=3, timeout=15):
+        logging.info(f"Fetching HTML (async) for: {url}")
+        headers = {'User-Agent': DEFAULT_USER_AGENT}
+        return await self._afetch(url, headers, delay, retries, timeout, is_json=False)
+
+    async def afetch_api_data(self, url, headers=None, delay=1, retries=3, timeout=15):
+        logging.info(f"Fetching API data (async) from: {url}")
+        req_headers = {'User-Agent': DEFAULT_USER_AGENT, 'Accept': 'application/json'}
+        if headers:
+            req_headers.update(headers)
+        return await self._afetch(url, req_headers, delay, retries, timeout, is_json=True)
+
+    async def afetch_many(self, urls, concurrency=1000, delay=1, retries=3, timeout=15, is_json=False, headers=None):
+        """
+        Async generator over many URLs: yields (url, content) as each request completes.
+        Politeness is enforced per host by a token bucket of 1/delay requests per second.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def fetch_one(url):
+            async with semaphore:
+                try:
+                    if is_json:
+                        content = await self.afetch_api_data(url, headers=headers, delay=delay, retries=retries, timeout=timeout)
+                    else:
+                        content = await self.afetch_html(url, delay=delay, retries=retries, timeout=timeout)
+                except Exception as e:
+                    logging.error(f"Unexpected error fetching {url}: {e}")
+                    content = None
+                return url, content
+
+        tasks = [asyncio.ensure_future(fetch_one(url)) for url in urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aclose(self):
+        self._bind_event_loop()
+        if self.async_session and not self.async_session.closed:
+            await self.async_session.close()
+        self.async_session = None
+
+    def parse_html(self, html_content):
+        if not html_content:
+            return None
+        with METRICS.timer('parse_seconds', backend=self.parser_backend):
+            if self.parser_backend == 'lxml':
+                return self._parse_html_lxml(html_content)
+            return BeautifulSoup(html_content, 'html.parser')
+
+    def _parse_html_lxml(self, html_content):
+        try:
+            return lxml_html.document_fromstring(html_content)
+        except ValueError:
+            # lxml не принимает str с XML-декларацией кодировки
+            return lxml_html.document_fromstring(html_content.encode('utf-8'))
+        except lxml_etree.ParserError as e:
+            logging.error(f"lxml could not parse HTML: {e}")
+            return None
+
+    def compile_selector(self, selector):
+        """
+        Compiles a CSS selector once for the active backend and caches it for later items and pages.
+        """
+        key = (self.parser_backend, selector)
+        compiled = self._compiled_selectors.get(key)
+        if compiled is None:
+            if self.parser_backend == 'lxml':
+                try:
+                    # descendant:: повторяет поведение select_one в BeautifulSoup (сам элемент не учитывается)
+                    compiled = lxml_etree.XPath(HTMLTranslator().css_to_xpath(selector, prefix='descendant::'))
+                except (SelectorError, lxml_etree.XPathError) as e:
+                    # :not(.a, .b), :-soup-contains(), :nth-child(2 of .x) есть только в soupsieve
+                    logging.warning(f"Selector '{selector}' is not supported by cssselect ({e}). "
+                                    f"Pages using it are matched with soupsieve.")
+                    compiled = soupsieve.compile(selector)
+            else:
+                compiled = soupsieve.compile(selector)
+            self._compiled_selectors[key] = compiled
+        return compiled
+
+    def _needs_soupsieve(self, selectors):
+        return self.parser_backend == 'lxml' and any(isinstance(self.compile_selector(selector), soupsieve.SoupSieve)
+                                                     for selector in selectors)
+
+    def _lxml_to_soup(self, tree):
+        """
+        BeautifulSoup copy of an lxml document or element, for selectors that cssselect cannot compile.
+        For an element, the returned tag is the element itself, so select() still sees only its descendants.
+        """
+        soup = BeautifulSoup(lxml_html.tostring(tree, encoding='unicode'), 'html.parser')
+        return soup if tree.getparent() is None else soup.find()
+
+    def _soup_parser(self):
+        if self._soup_fallback_parser is None:
+            self._soup_fallback_parser = WebParser(parsing_mode='requests', parser_backend='html.parser')
+        return self._soup_fallback_parser
+
+    def select_elements(self, tree, selector):
+        compiled = self.compile_selector(selector)
+        if self.parser_backend == 'lxml':
+            if isinstance(compiled, soupsieve.SoupSieve):
+                return compiled.select(self._lxml_to_soup(tree))
+            return compiled(tree)
+        return compiled.select(tree)
+
+    def select_first(self, tree, selector):
+        compiled = self.compile_selector(selector)
+        if self.parser_backend == 'lxml':
+            if isinstance(compiled, soupsieve.SoupSieve):
+                return compiled.select_one(self._lxml_to_soup(tree))
+            found = compiled(tree)
+            return found[0] if found else None
+        return compiled.select_one(tree)
+
+    def _element_value(self, found_element, attribute=None):
+        if self.parser_backend == 'lxml' and not isinstance(found_element, Tag):
+            return lxml_attribute(found_element, attribute) if attribute else lxml_text(found_element)
+        if attribute:
+            return found_element.get(attribute, None)
+        return found_element.get_text(strip=True)
+
+    def extract_data_from_html_element(self, element, selector, attribute=None):
+        found_element = self.select_first(element, selector)
+        if found_element is not None:
+            return self._element_value(found_element, attribute)
+        return None
+    
+    def extract_data_from_json_element(self, json_data, json_path):
+        """
+        Extracts data from a JSON object using JMESPath.
+        json_path examples: "title", "data.items[0].name", "results[*].id"
+        """
+        try:
+            return jmespath.search(json_path, json_data)
+        except Exception as e:
+            logging.warning(f"JMESPath error for path '{json_path}': {e}")
+            return None
+
+    def build_json_plan(self, main_item_selector, item_fields_patterns):
+        """
+        Returns a cached JsonExtractionPlan, so expressions are compiled and validated once per job.
+        """
+        key = (main_item_selector, tuple((name, pattern[0]) for name, pattern in item_fields_patterns.items()))
+        plan = self._json_plans.get(key)
+        if plan is None:
+            plan = JsonExtractionPlan(main_item_selector, item_fields_patterns)
+            self._json_plans[key] = plan
+        return plan
+
+    def extract_multiple_items(self, source_data, main_item_selector, item_fields_patterns, is_json=False):
+        all_extracted_items = []
+        if source_data is None or (is_json and not source_data):
+            return all_extracted_items
+
+        if is_json:
+            # Main item selector is now a JMESPath for the list of items
+            plan = self.build_json_plan(main_item_selector, item_fields_patterns)
+            if not plan.is_valid:
+                return all_extracted_items
+            all_extracted_items = plan.run(source_data)
+        else: # HTML parsing
+            if self._needs_soupsieve([main_item_selector] + [pattern[0] for pattern in item_fields_patterns.values()]):
+                # Хотя бы один селектор не переводится в XPath: страница целиком извлекается через bs4
+                return self._soup_parser().extract_multiple_items(self._lxml_to_soup(source_data), main_item_selector,
+                                                                  item_fields_patterns)
+            # Селекторы компилируются один раз и переиспользуются для всех элементов и страниц
+            field_plan = [(field_name, self.compile_selector(field_selector), field_attribute)
+                          for field_name, (field_selector, field_attribute) in item_fields_patterns.items()]
+            is_lxml = self.parser_backend == 'lxml'
+            perf_counter = time.perf_counter
+            started_at = perf_counter()
+            main_elements = self.select_elements(source_data, main_item_selector)
+            METRICS.observe('extract_container_seconds', perf_counter() - started_at)
+            field_seconds = [0.0] * len(field_plan)
+            for item_element in main_elements:
+                item_data = {}
+                for field_index, (field_name, compiled, field_attribute) in enumerate(field_plan):
+                    started_at = perf_counter()
+                    if is_lxml:
+                        found = compiled(item_element)
+                        found_element = found[0] if found else None
+                    else:
+                        found_element = compiled.select_one(item_element)
+                    if found_element is not None:
+                        value = self._element_value(found_element, field_attribute)
+                        if value is not None:
+                            item_data[field_name] = value
+                    field_seconds[field_index] += perf_counter() - started_at
+                if item_data:
+                    all_extracted_items.append(item_data)
+            # Одно наблюдение на поле за страницу, а не на каждый элемент
+            for (field_name, _, _), seconds in zip(field_plan, field_seconds):
+                METRICS.observe('extract_field_seconds', seconds, field=field_name)
+            METRICS.inc('extract_items_total', len(all_extracted_items))
+        return all_extracted_items
+
+    def follow_pagination(self, start_url, next_page_selector, max_pages=5, delay_between_pages=2):
+        all_soups = []
+        current_url = start_url
+        page_count = 0
+
+        while current_url and page_count < max_pages:
+            logging.info(f"Parsing page {page_count + 1}: {current_url}")
+            html_content = self.fetch_html(current_url, delay=delay_between_pages)
+            if not html_content:
+                logging.error(f"Failed to get HTML for {current_url}. Aborting pagination.")
+                break
+            
+            soup = self.parse_html(html_content)
+            if soup is None:
+                logging.error(f"Failed to parse HTML for {current_url}. Aborting pagination.")
+                break
+
+            all_soups.append(soup)
+            page_count += 1
+
+            next_page_href = self._next_page_href(soup, next_page_selector)
+            if next_page_href:
+                current_url = urljoin(current_url, next_page_href)
+                logging.info(f"Next page found: {current_url}")
+            else:
+                logging.info("Next page link not found. Finishing pagination.")
+                current_url = None
+
+        logging.info(f"Pagination parsing completed. Processed {page_count} pages.")
+        return all_soups
+
+    def _next_page_href(self, tree, next_page_selector):
+        next_link_tag = self.select_first(tree, next_page_selector)
+        if next_link_tag is not None:
+            return next_link_tag.get('href')
+        return None
+
+    @staticmethod
+    def _compile_scan_matcher(selector):
+        """
+        Selector as a list of (tag, [(attribute, operator, value), ...]) alternatives, or None if it needs
+        more than one element to match (combinators, pseudo-classes) and so cannot be checked on a single tag.
+        """
+        if cssselect_parser is None:
+            return None
+        try:
+            parsed_selectors = cssselect_parser.parse(selector)
+        except SelectorError:
+            return None
+        alternatives = []
+        for parsed in parsed_selectors:
+            if parsed.pseudo_element is not None:
+                return None
+            node, conditions = parsed.parsed_tree, []
+            while not isinstance(node, cssselect_parser.Element):
+                if isinstance(node, cssselect_parser.Class):
+                    conditions.append(('class', '~=', node.class_name))
+                elif isinstance(node, cssselect_parser.Hash):
+                    conditions.append(('id', '=', node.id))
+                elif isinstance(node, cssselect_parser.Attrib) and node.namespace is None and not getattr(node, 'flag', None):
+                    value = node.value.value if node.value is not None else None
+                    conditions.append((node.attrib.lower(), node.operator, value))
+                else:
+                    return None
+                node = node.selector
+            if node.namespace is not None:
+                return None
+            tag = node.element.lower() if node.element not in (None, '*') else None
+            alternatives.append((tag, conditions))
+        return alternatives
+
+    @staticmethod
+    def _attribute_matches(attributes, name, operator, expected):
+        value = attributes.get(name)
+        if value is None:
+            return False
+        if operator == 'exists':
+            return True
+        if operator == '=':
+            return value == expected
+        if operator == '~=':
+            return expected in value.split()
+        if operator == '|=':
+            return value == expected or value.startswith(expected + '-')
+        if operator == '^=':
+            return bool(expected) and value.startswith(expected)
+        if operator == '$=':
+            return bool(expected) and value.endswith(expected)
+        if operator == '*=':
+            return bool(expected) and expected in value
+        return value != expected # '!='
+
+    def _scan_next_page_href(self, html_content, next_page_selector):
+        """
+        Cheap early scan for the next page link: a regex pass over start tags, no tree is built.
+        Returns (href, True) on success, or (None, False) if the selector needs a real parse.
+        """
+        if next_page_selector not in self._scan_matchers:
+            self._scan_matchers[next_page_selector] = self._compile_scan_matcher(next_page_selector)
+        alternatives = self._scan_matchers[next_page_selector]
+        if alternatives is None:
+            return None, False
+        for match in self.START_TAG_PATTERN.finditer(html_content):
+            tag = match.group(2)
+            if tag is None:
+                continue
+            tag = tag.lower()
+            attributes = None
+            for expected_tag, conditions in alternatives:
+                if expected_tag is not None and expected_tag != tag:
+                    continue
+                if attributes is None:
+                    attributes = {}
+                    for name, raw_value in self.ATTRIBUTE_PATTERN.findall(match.group(3) or ''):
+                        if raw_value[:1] in ('"', "'"):
+                            raw_value = raw_value[1:-1]
+                        attributes.setdefault(name.lower(), html_unescape(raw_value))
+                if all(self._attribute_matches(attributes, *condition) for condition in conditions):
+                    return attributes.get('href') or None, True
+        return None, True
+
+    def iter_pagination_items(self, start_url, next_page_selector, main_item_selector, item_fields_patterns, max_pages=5, delay_between_pages=2,
+                              only_if_changed=False, process_pool=None):
+        """
+        Streaming variant of follow_pagination: yields (page_number, items) page by page.
+        The next page is fetched in the background while the current one is extracted,
+        and parsed trees are released as soon as their items are yielded.
+        With only_if_changed, an unchanged first page raises SourceNotModified and nothing else is fetched.
+        With a process_pool, extraction of each page runs in a worker process while the next pages are fetched.
+        """
+        if process_pool is not None:
+            yield from self._iter_pagination_items_in_pool(start_url, next_page_selector, main_item_selector, item_fields_patterns,
+                                                           max_pages, delay_between_pages, only_if_changed, process_pool)
+            return
+        executor = ThreadPoolExecutor(max_workers=1)
+        current_url = start_url
+        pending = executor.submit(self.fetch_html, current_url, delay_between_pages, 3, only_if_changed)
+        page_count = 0
+        try:
+            while pending is not None:
+                html_content = pending.result()
+                pending = None
+                logging.info(f"Parsing page {page_count + 1}: {current_url}")
+                if not html_content:
+                    logging.error(f"Failed to get HTML for {current_url}. Aborting pagination.")
+                    break
+                page_count += 1
+
+                soup = None
+                if self.parser_backend == 'lxml':
+                    # Разбор lxml и так дешевый: одно дерево и для ссылки, и для извлечения
+                    soup = self.parse_html(html_content)
+                    next_page_href = self._next_page_href(soup, next_page_selector) if soup is not None else None
+                else:
+                    next_page_href, scanned = self._scan_next_page_href(html_content, next_page_selector)
+                    if not scanned:
+                        soup = self.parse_html(html_content)
+                        next_page_href = self._next_page_href(soup, next_page_selector) if soup is not None else None
+
+                next_url = None
+                if next_page_href and page_count < max_pages:
+                    next_url = urljoin(current_url, next_page_href)
+                    logging.info(f"Next page found: {next_url}")
+                    pending = executor.submit(self.fetch_html, next_url, delay_between_pages)
+                elif not next_page_href:
+                    logging.info("Next page link not found. Finishing pagination.")
+
+                if soup is None:
+                    soup = self.parse_html(html_content)
+                del html_content
+                if soup is None:
+                    logging.error(f"Failed to parse HTML for {current_url}. Aborting pagination.")
+                    break
+
+                page_items = self.extract_multiple_items(soup, main_item_selector, item_fields_patterns, is_json=False)
+                if isinstance(soup, BeautifulSoup):
+                    soup.decompose()
+                del soup
+                yield page_count, page_items
+                current_url = next_url
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        logging.info(f"Streaming pagination completed. Processed {page_count} pages.")
+
+    def _iter_pagination_items_in_pool(self, start_url, next_page_selector, main_item_selector, item_fields_patterns,
+                                       max_pages, delay_between_pages, only_if_changed, process_pool):
+        pending = deque() # (номер страницы, URL, future) в порядке страниц
+        current_url = start_url
+        page_count = 0
+        try:
+            while current_url and page_count < max_pages:
+                logging.info(f"Fetching page {page_count + 1}: {current_url}")
+                html_content = self.fetch_html(current_url, delay_between_pages, 3, only_if_changed and page_count == 0)
+                if not html_content:
+                    logging.error(f"Failed to get HTML for {current_url}. Aborting pagination.")
+                    break
+                page_count += 1
+
+                # Ссылка на следующую страницу ищется дешевым сканом здесь, а полный разбор уходит в процесс
+                next_page_href, scanned = self._scan_next_page_href(html_content, next_page_selector)
+                future = process_pool.submit(extract_page_in_worker, html_content, main_item_selector, item_fields_patterns,
+                                             self.parser_backend, None if scanned else next_page_selector)
+                del html_content
+                pending.append((page_count, current_url, future))
+                if not scanned:
+                    # Селектор не проверить по одному тегу: ссылку возвращает процесс вместе с элементами, страница разбирается один раз
+                    next_page_href = self._page_result(current_url, future)[1]
+
+                while pending and pending[0][2].done():
+                    page_number, page_url, done_future = pending.popleft()
+                    yield page_number, self._page_result(page_url, done_future)[0]
+
+                if next_page_href and page_count < max_pages:
+                    current_url = urljoin(current_url, next_page_href)
+                    logging.info(f"Next page found: {current_url}")
+                else:
+                    if not next_page_href:
+                        logging.info("Next page link not found. Finishing pagination.")
+                    current_url = None
+
+            while pending:
+                page_number, page_url, future = pending.popleft()
+                yield page_number, self._page_result(page_url, future)[0]
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+        logging.info(f"Streaming pagination completed. Processed {page_count} pages.")
+
+    def _page_result(self, url, future):
+        try:
+            items, next_page_href, worker_metrics = future.result()
+            METRICS.merge(worker_metrics)
+            return items, next_page_href
+        except Exception as e:
+            logging.error(f"Extraction worker failed for {url}: {e}")
+            return [], None
+
+    def close_driver(self):
+        if self.driver:
+            self.driver.quit()
+            logging.info("Selenium WebDriver closed.")
+        if self.session:
+            self.session.close()
+            self.session = None
+
+_worker_parsers = {} # WebParser на процесс пула: скомпилированные селекторы переживают между страницами
+
+def _get_worker_parser(parser_backend):
+    parser = _worker_parsers.get(parser_backend)
+    if parser is None:
+        parser = WebParser(parsing_mode='requests', parser_backend=parser_backend)
+        _worker_parsers[parser_backend] = parser
+    return parser
+
+def extract_page_in_worker(html_content, main_item_selector, item_fields_patterns, parser_backend='html.parser', next_page_selector=None):
+    """
+    Process-pool task: parses one HTML page and returns (items, next_page_href, metrics) as plain picklable values.
+    metrics is the worker's METRICS.drain(), to be merged into the parent process registry.
+    """
+    parser = _get_worker_parser(parser_backend)
+    tree = parser.parse_html(html_content)
+    if tree is None:
+        return [], None, METRICS.drain()
+    next_page_href = parser._next_page_href(tree, next_page_selector) if next_page_selector else None
+    items = parser.extract_multiple_items(tree, main_item_selector, item_fields_patterns, is_json=False)
+    if isinstance(tree, BeautifulSoup):
+        tree.decompose()
+    return items, next_page_href, METRICS.drain()
+
+def crawl_page_in_worker(html_content, main_item_selector, item_fields_patterns, parser_backend='html.parser', link_selector='a[href]'):
+    """
+    Process-pool task for WebParser.crawl: returns (items, hrefs, metrics) for one page.
+    """
+    parser = _get_worker_parser(parser_backend)
+    items, hrefs = parser._extract_crawl_page(html_content, main_item_selector, item_fields_patterns, link_selector)
+    return items, hrefs, METRICS.drain()
+
+def create_extraction_pool(max_workers=None):
+    """
+    Process pool for extract_page_in_worker. Workers are spawned, not forked, because callers
+    (GUI, scheduler) already run threads and Selenium drivers.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    logging.info(f"Starting extraction process pool with {max_workers} workers.")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+TRACKING_QUERY_PARAMS = ('utm_', 'gclid', 'fbclid', 'yclid', '_openstat')
+SKIPPED_LINK_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.pdf', '.zip', '.rar', '.gz',
+                           '.mp3', '.mp4', '.avi', '.doc', '.docx', '.xls', '.xlsx', '.css', '.js')
+PERCENT_ESCAPE_PATTERN = re.compile(r'(%[0-9A-Fa-f]{2})')
+URL_UNRESERVED_CHARACTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+URL_PATH_SAFE_CHARACTERS = "/:@!$&'()*+,;=~"
+
+def _normalize_percent_encoding(path):
+    # RFC 3986, 6.2.2: декодируются только незарезервированные символы, остальные экранирования
+    # (%2F, %3F, ...) сохраняются с hex в верхнем регистре - иначе /a%2Fb и /a/b стали бы одним URL
+    normalized = []
+    for index, part in enumerate(PERCENT_ESCAPE_PATTERN.split(path)):
+        if index % 2:
+            character = chr(int(part[1:], 16))
+            normalized.append(character if character in URL_UNRESERVED_CHARACTERS else part.upper())
+        else:
+            normalized.append(quote(part, safe=URL_PATH_SAFE_CHARACTERS))
+    return ''.join(normalized)
+
+def canonicalize_url(url, base_url=None):
+    """
+    Canonical form used for crawl dedup: absolute http(s) URL, lowercase host, no default port, userinfo
+    or fragment, dot segments resolved, tracking parameters dropped and the query sorted.
+    Returns None for URLs that cannot be crawled (mailto:, javascript:, malformed).
+    """
+    try:
+        parts = urlsplit(urljoin(base_url, url.strip()) if base_url else url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').rstrip('.')
+        port = parts.port
+    except ValueError:
+        return None
+    if scheme not in ('http', 'https') or not host:
+        return None
+    netloc = host if port is None or (scheme, port) in (('http', 80), ('https', 443)) else f"{host}:{port}"
+
+    path = _normalize_percent_encoding(parts.path or '/')
+    normalized_path = posixpath.normpath(path)
+    if normalized_path.startswith('//'):
+        normalized_path = '/' + normalized_path.lstrip('/')
+    if path.endswith('/') and normalized_path != '/':
+        normalized_path += '/'
 
-    def extract_data_from_html_element(self, element, selector, attribute=None):
-        found_element = element.select_one(selector)
-        if found_element:
-            if attribute:
-                return found_element.get(attribute, None)
-            else:
-                return found_element.get_text(strip=True)
-        return None
-    
-    def extract_data_from_json_element(self, json_data, json_path):
+    query_pairs = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith(TRACKING_QUERY_PARAMS)]
+    return urlunsplit((scheme, netloc, normalized_path, urlencode(sorted(query_pairs)), ''))
+
+class CrawlFrontier:
+    """
+    Persistent crawl frontier in SQLite: a priority queue of URLs with seen-URL dedup on their canonical form,
+    depth / domain / page limits and allow / deny rules. Each entry also keeps the URL as it was found,
+    and that is the one fetched: canonicalization may change what the server sees (e.g. '?foo' becomes '?foo='). Lower priority values are crawled first
+    (by default the link depth, minus bonuses from `priority_patterns`). URLs that were in progress
+    when the process stopped or the crawl raised go back to the queue, so a large crawl resumes after a restart.
+    allowed_domains defaults to the domains of the seeds (subdomains included).
+    """
+    def __init__(self, frontier_file, allowed_domains=None, max_depth=3, max_pages=None, max_pages_per_domain=None,
+                 allow_patterns=None, deny_patterns=None, priority_patterns=None, max_attempts=3):
+        self.frontier_file = frontier_file
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_pages_per_domain = max_pages_per_domain
+        self.allow_patterns = [re.compile(pattern) for pattern in (allow_patterns or [])]
+        self.deny_patterns = [re.compile(pattern) for pattern in (deny_patterns or [])]
+        self.priority_patterns = [(re.compile(pattern), bonus) for pattern, bonus in (priority_patterns or {}).items()]
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(frontier_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS frontier (
+            url TEXT PRIMARY KEY, domain TEXT NOT NULL, depth INTEGER NOT NULL, priority REAL NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, added_at REAL NOT NULL,
+            fetch_url TEXT)""")
+        # Фронтиры, созданные до колонки fetch_url: для старых строк загружается канонический URL
+        if 'fetch_url' not in {row[1] for row in self.connection.execute("PRAGMA table_info(frontier)")}:
+            self.connection.execute("ALTER TABLE frontier ADD COLUMN fetch_url TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_frontier_queue ON frontier (state, priority)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_frontier_domain ON frontier (domain)")
+        with self.connection:
+            resumed = self.connection.execute("UPDATE frontier SET state = 'pending' WHERE state = 'in_progress'").rowcount
+        if resumed:
+            logging.info(f"Crawl frontier {frontier_file}: {resumed} interrupted URLs returned to the queue.")
+        # Счетчики для лимитов читаются один раз и дальше ведутся в памяти, а не через COUNT(*) на каждую ссылку
+        self.domain_counts = dict(self.connection.execute("SELECT domain, COUNT(*) FROM frontier GROUP BY domain").fetchall())
+        self.total_count = sum(self.domain_counts.values())
+        if allowed_domains:
+            self.allowed_domains = {domain.lower() for domain in allowed_domains}
+            self.seed_domains_only = False
+        else:
+            self.allowed_domains = {row[0] for row in self.connection.execute("SELECT DISTINCT domain FROM frontier WHERE depth = 0")}
+            self.seed_domains_only = True
+
+    def _is_allowed_domain(self, domain):
+        return any(domain == allowed or domain.endswith('.' + allowed) for allowed in self.allowed_domains)
+
+    def _priority(self, url, depth):
+        return depth - sum(bonus for pattern, bonus in self.priority_patterns if pattern.search(url))
+
+    def _admit(self, url, depth, fetch_url):
+        # Вызывается под self._lock
+        if depth > self.max_depth or urlsplit(url).path.lower().endswith(SKIPPED_LINK_EXTENSIONS):
+            return False
+        domain = urlsplit(url).hostname
+        if not self._is_allowed_domain(domain):
+            return False
+        if self.allow_patterns and not any(pattern.search(url) for pattern in self.allow_patterns):
+            return False
+        if any(pattern.search(url) for pattern in self.deny_patterns):
+            return False
+        if self.max_pages is not None and self.total_count >= self.max_pages:
+            return False
+        if self.max_pages_per_domain is not None and self.domain_counts.get(domain, 0) >= self.max_pages_per_domain:
+            return False
+        cursor = self.connection.execute("INSERT OR IGNORE INTO frontier (url, domain, depth, priority, added_at, fetch_url) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (url, domain, depth, self._priority(url, depth), time.time(), fetch_url))
+        if cursor.rowcount != 1:
+            return False
+        self.total_count += 1
+        self.domain_counts[domain] = self.domain_counts.get(domain, 0) + 1
+        return True
+
+    def add_seeds(self, urls):
+        added = 0
+        with self._lock:
+            with self.connection:
+                for url in urls:
+                    canonical_url = canonicalize_url(url)
+                    if canonical_url is None:
+                        logging.warning(f"Skipping invalid seed URL: {url}")
+                        continue
+                    if self.seed_domains_only:
+                        self.allowed_domains.add(urlsplit(canonical_url).hostname)
+                    added += self._admit(canonical_url, 0, urldefrag(url.strip())[0])
+        return added
+
+    def add_links(self, hrefs, page_url, page_depth):
         """
-        Extracts data from a JSON object using JMESPath.
-        json_path examples: "title", "data.items[0].name", "results[*].id"
+        Queues the links found on `page_url` whose canonical form is new and passes the rules. Returns the number queued.
         """
-        try:
-            return jmespath.search(json_path, json_data)
-        except Exception as e:
-            logging.warning(f"JMESPath error for path '{json_path}': {e}")
-            return None
+        added = 0
+        with self._lock:
+            with self.connection:
+                for href in hrefs:
+                    canonical_url = canonicalize_url(href, base_url=page_url)
+                    if canonical_url is not None and self._admit(canonical_url, page_depth + 1, urldefrag(urljoin(page_url, href.strip()))[0]):
+                        added += 1
+        METRICS.inc('crawl_links_total', added, result='admitted')
+        METRICS.inc('crawl_links_total', len(hrefs) - added, result='rejected')
+        return added
 
-    def extract_multiple_items(self, source_data, main_item_selector, item_fields_patterns, is_json=False):
-        all_extracted_items = []
-        if not source_data:
-            return all_extracted_items
+    def claim(self, limit):
+        """
+        Takes up to `limit` URLs with the best priority and marks them in progress. Returns [(url, fetch_url, depth), ...]:
+        `url` is the canonical key for release / mark_done / mark_failed, `fetch_url` is the URL to request.
+        """
+        with self._lock:
+            with self.connection:
+                rows = self.connection.execute("SELECT url, COALESCE(fetch_url, url), depth FROM frontier WHERE state = 'pending' "
+                                               "ORDER BY priority, rowid LIMIT ?", (limit,)).fetchall()
+                self.connection.executemany("UPDATE frontier SET state = 'in_progress' WHERE url = ?", ((url,) for url, _, _ in rows))
+        return rows
 
-        if is_json:
-            # Main item selector is now a JMESPath for the list of items
-            items_list = self.extract_data_from_json_element(source_data, main_item_selector)
-            if not isinstance(items_list, list):
-                logging.error(f"JSON main item selector '{main_item_selector}' did not return a list. Got: {type(items_list)}")
-                return all_extracted_items
-            
-            for item_data_dict in items_list:
-                item_data = {}
-                for field_name, (field_selector, _) in item_fields_patterns.items(): # Attribute is not used for JSON
-                    value = self.extract_data_from_json_element(item_data_dict, field_selector)
-                    if value is not None:
-                        item_data[field_name] = value
-                if item_data:
-                    all_extracted_items.append(item_data)
-        else: # HTML parsing
-            main_elements = source_data.select(main_item_selector)
-            for item_element in main_elements:
-                item_data = {}
-                for field_name, (field_selector, field_attribute) in item_fields_patterns.items():
-                    value = self.extract_data_from_html_element(item_element, field_selector, field_attribute)
-                    if value is not None:
-                        item_data[field_name] = value
-                if item_data:
-                    all_extracted_items.append(item_data)
-        return all_extracted_items
+    def release(self, urls):
+        """
+        Puts claimed URLs that were not finished back into the queue without counting an attempt.
+        """
+        with self._lock:
+            with self.connection:
+                self.connection.executemany("UPDATE frontier SET state = 'pending' WHERE url = ? AND state = 'in_progress'",
+                                            ((url,) for url in urls))
 
-    def follow_pagination(self, start_url, next_page_selector, max_pages=5, delay_between_pages=2):
-        all_soups = []
-        current_url = start_url
-        page_count = 0
+    def mark_done(self, url):
+        with self._lock:
+            with self.connection:
+                self.connection.execute("UPDATE frontier SET state = 'done' WHERE url = ?", (url,))
 
-        while current_url and page_count < max_pages:
-            logging.info(f"Parsing page {page_count + 1}: {current_url}")
-            html_content = self.fetch_html(current_url, delay=delay_between_pages)
-            if not html_content:
-                logging.error(f"Failed to get HTML for {current_url}. Aborting pagination.")
-                break
-            
-            soup = self.parse_html(html_content)
-            if not soup:
-                logging.error(f"Failed to parse HTML for {current_url}. Aborting pagination.")
-                break
+    def mark_failed(self, url):
+        with self._lock:
+            with self.connection:
+                self.connection.execute("""UPDATE frontier SET attempts = attempts + 1,
+                    state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE url = ?""", (self.max_attempts, url))
 
-            all_soups.append(soup)
-            page_count += 1
+    def pending_count(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM frontier WHERE state IN ('pending', 'in_progress')").fetchone()[0]
 
-            next_link_tag = soup.select_one(next_page_selector)
-            if next_link_tag and next_link_tag.has_attr('href'):
-                next_page_href = next_link_tag['href']
-                current_url = urljoin(current_url, next_page_href)
-                logging.info(f"Next page found: {current_url}")
-            else:
-                logging.info("Next page link not found. Finishing pagination.")
-                current_url = None
+    def clear(self):
+        with self._lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM frontier")
+            self.domain_counts = {}
+            self.total_count = 0
+            if self.seed_domains_only:
+                self.allowed_domains = set()
 
-        logging.info(f"Pagination parsing completed. Processed {page_count} pages.")
-        return all_soups
+    def stats(self):
+        with self._lock:
+            counts = dict(self.connection.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in ('pending', 'in_progress', 'done', 'failed')}
 
-    def close_driver(self):
-        if self.driver:
-            self.driver.quit()
-            logging.info("Selenium WebDriver closed.")
+    def stats_report(self):
+        stats = self.stats()
+        return f"Crawl frontier: {stats['done']} done, {stats['pending']} pending, {stats['in_progress']} in progress, {stats['failed']} failed."
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
 
 # --- НОВЫЕ КЛАССЫ И ФУНКЦИИ (без изменений, т.к. они для отправки, а не для парсинга) ---
 
 class ApiSender:
-    def __init__(self, api_url, headers=None):
+    def __init__(self, api_url, headers=None, batch_size=1, concurrency=1, pool_size=10):
+        """
+        batch_size > 1 sends items as JSON arrays of up to batch_size items (for targets that accept arrays).
+        concurrency > 1 sends items or batches in parallel over one pooled keep-alive session.
+        """
         self.api_url = api_url
         self.headers = headers if headers is not None else {'Content-Type': 'application/json'}
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.session = requests.Session()
+        adapter = InstrumentedHTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, self.concurrency))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         if not self.api_url:
             logging.error("API URL for sending is not set. API sending will not work.")
 
+    def build_payload(self, item_data):
+        # --- ВАЖНО: Адаптируйте payload под требования вашего целевого API ---
+        # Пример простого маппинга:
+        return {
+            "title": item_data.get("title", ""),
+            "link": item_data.get("link", ""),
+            "date": item_data.get("date", ""),
+            "image_src": item_data.get("image_src", "")
+            # Добавьте или переименуйте поля в соответствии с API
+        }
+
+    def _send_payload(self, payload_data, method):
+        started_at = time.perf_counter()
+        sent = self._send_payload_once(payload_data, method)
+        outcome = 'ok' if sent else 'error'
+        METRICS.observe('api_send_seconds', time.perf_counter() - started_at, outcome=outcome)
+        METRICS.inc('api_sent_items_total', len(payload_data) if isinstance(payload_data, list) else 1, outcome=outcome)
+        return sent
+
+    def _send_payload_once(self, payload_data, method):
+        try:
+            payload = json.dumps(payload_data, ensure_ascii=False)
+
+            logging.info(f"Sending data to API: {self.api_url} with payload (first 100 chars): {payload[:100]}...")
+            if method.upper() == 'POST':
+                response = self.session.post(self.api_url, data=payload.encode('utf-8'), headers=self.headers, timeout=15)
+            elif method.upper() == 'PUT':
+                # Для PUT может потребоваться ID элемента в URL, это сложнее.
+                # Если API поддерживает PUT для массового обновления или ID в теле запроса,
+                # то вам потребуется настроить это здесь.
+                logging.warning("PUT method for API is more complex and might require item IDs in URL or specific payload structure.")
+                response = self.session.put(self.api_url, data=payload.encode('utf-8'), headers=self.headers, timeout=15) # Пример, возможно потребуется доработка
+            else:
+                logging.error(f"Unsupported API method for sending: {method}")
+                return False
+
+            response.raise_for_status() # Вызывает HTTPError для плохих ответов (4xx, 5xx)
+            logging.info(f"Successfully sent data to API. Status: {response.status_code}. Response: {response.text[:100]}...")
+            return True
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error sending data to API: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logging.error(f"API Response Error ({e.response.status_code}): {e.response.text}")
+        except (TypeError, ValueError) as e:
+            logging.error(f"Error encoding JSON payload for API: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred during API send: {e}")
+        return False
+
+    def _send_unit(self, unit_items, method):
+        if self.batch_size > 1:
+            return self._send_payload([self.build_payload(item_data) for item_data in unit_items], method)
+        return self._send_payload(self.build_payload(unit_items[0]), method)
+
     def send_data(self, data_list, method='POST'):
         if not self.api_url:
             logging.error("Cannot send data, API URL for sending is not configured.")
@@ -230,52 +2215,361 @@ class ApiSender:
             logging.info("No data to send via API.")
             return []
 
+        # Единица отправки: один элемент или пачка до batch_size элементов
+        units = [data_list[start:start + self.batch_size] for start in range(0, len(data_list), self.batch_size)]
+        unit_results = [False] * len(units)
+        if self.concurrency > 1 and len(units) > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {executor.submit(self._send_unit, unit_items, method): index for index, unit_items in enumerate(units)}
+                for future in as_completed(futures):
+                    unit_results[futures[future]] = future.result()
+        else:
+            for index, unit_items in enumerate(units):
+                unit_results[index] = self._send_unit(unit_items, method)
+
+        # Успешными считаются только элементы из подтвержденных запросов, в исходном порядке
         successful_sends = []
-        for item_data in data_list:
-            try:
-                # --- ВАЖНО: Адаптируйте payload под требования вашего целевого API ---
-                # Пример простого маппинга:
-                payload_data = {
-                    "title": item_data.get("title", ""),
-                    "link": item_data.get("link", ""),
-                    "date": item_data.get("date", ""),
-                    "image_src": item_data.get("image_src", "")
-                    # Добавьте или переименуйте поля в соответствии с API
-                }
-                payload = json.dumps(payload_data, ensure_ascii=False)
-
-                logging.info(f"Sending data to API: {self.api_url} with payload (first 100 chars): {payload[:100]}...")
-                if method.upper() == 'POST':
-                    response = requests.post(self.api_url, data=payload, headers=self.headers, timeout=15)
-                elif method.upper() == 'PUT':
-                    # Для PUT может потребоваться ID элемента в URL, это сложнее.
-                    # Если API поддерживает PUT для массового обновления или ID в теле запроса,
-                    # то вам потребуется настроить это здесь.
-                    logging.warning("PUT method for API is more complex and might require item IDs in URL or specific payload structure.")
-                    response = requests.put(self.api_url, data=payload, headers=self.headers, timeout=15) # Пример, возможно потребуется доработка
-                else:
-                    logging.error(f"Unsupported API method for sending: {method}")
-                    continue
+        for unit_items, sent in zip(units, unit_results):
+            if sent:
+                successful_sends.extend(unit_items)
+        if self.batch_size > 1 or self.concurrency > 1:
+            logging.info(f"Delivered {len(successful_sends)}/{len(data_list)} items in {sum(unit_results)}/{len(units)} requests.")
+        return successful_sends
 
-                response.raise_for_status() # Вызывает HTTPError для плохих ответов (4xx, 5xx)
-                logging.info(f"Successfully sent data to API. Status: {response.status_code}. Response: {response.text[:100]}...")
-                successful_sends.append(item_data)
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Error sending data to API: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    logging.error(f"API Response Error ({e.response.status_code}): {e.response.text}")
-            except json.JSONDecodeError as e:
-                logging.error(f"Error encoding JSON payload for API: {e}")
+    def close(self):
+        self.session.close()
+
+class DeliveryOutbox:
+    """
+    Durable on-disk queue between extraction and ApiSender. Failed items are retried with
+    exponential backoff and moved to a dead-letter file (JSON Lines) after `max_attempts`.
+    A background drainer thread keeps delivering while scraping continues.
+    Each row remembers its target (api_url and method): set_sender only changes where new items go,
+    items already queued are still delivered to the endpoint they were collected for.
+    """
+    def __init__(self, outbox_file="delivery_outbox.sqlite3", dead_letter_file="delivery_dead_letter.jsonl",
+                 max_attempts=8, base_backoff=5, max_backoff=3600, drain_batch=500, on_delivered=None):
+        self.outbox_file = outbox_file
+        self.dead_letter_file = dead_letter_file
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.drain_batch = drain_batch
+        self.on_delivered = on_delivered
+        self.sender = None
+        self.method = 'POST'
+        self.senders = {}
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._drainer = None
+        self.connection = sqlite3.connect(outbox_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_json TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            api_url TEXT,
+            method TEXT)""")
+        # Очереди, созданные до появления колонок цели: старые строки остаются с NULL и уходят текущему отправителю
+        existing_columns = {row[1] for row in self.connection.execute("PRAGMA table_info(outbox)")}
+        for column in ('api_url', 'method'):
+            if column not in existing_columns:
+                self.connection.execute(f"ALTER TABLE outbox ADD COLUMN {column} TEXT")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt_at ON outbox (next_attempt_at)")
+        self.connection.commit()
+        logging.info(f"Delivery outbox {self.outbox_file} opened with {self.pending_count()} pending items.")
+
+    def enqueue(self, items):
+        if not items:
+            return 0
+        now = time.time()
+        with self._lock:
+            api_url = self.sender.api_url if self.sender is not None else None
+            method = self.method
+            with self.connection:
+                self.connection.executemany("INSERT INTO outbox (item_json, next_attempt_at, created_at, api_url, method) VALUES (?, ?, ?, ?, ?)",
+                                            ((json.dumps(item_data, ensure_ascii=False), now, now, api_url, method) for item_data in items))
+        self._wake_event.set()
+        return len(items)
+
+    def pending_count(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _backoff(self, attempts):
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return backoff * random.uniform(0.8, 1.2) # Джиттер, чтобы повторы не шли одной волной
+
+    def _write_dead_letters(self, rows):
+        try:
+            with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                for row_id, item_json, attempts in rows:
+                    f.write(json.dumps({'item': json.loads(item_json), 'attempts': attempts,
+                                        'failed_at': time.strftime('%Y-%m-%dT%H:%M:%S')}, ensure_ascii=False) + "\n")
+            return True
+        except IOError as e:
+            logging.error(f"Error writing dead-letter file {self.dead_letter_file}: {e}")
+            return False
+
+    def _deliverable_filter(self):
+        """
+        SQL condition (and its parameters) matching rows whose target has a sender; None when nothing can be sent.
+        Must be called with self._lock held.
+        """
+        conditions, params = [], []
+        if self.senders:
+            conditions.append(f"api_url IN ({', '.join('?' * len(self.senders))})")
+            params.extend(self.senders)
+        if self.sender is not None:
+            conditions.append("api_url IS NULL")
+        if not conditions:
+            return None
+        return f"({' OR '.join(conditions)})", params
+
+    def drain_once(self):
+        """
+        Sends every item that is due now to the target it was queued for. Returns (delivered, retried, dead_lettered) counts.
+        """
+        with self._lock:
+            deliverable = self._deliverable_filter()
+            if deliverable is None:
+                return 0, 0, 0
+            condition, params = deliverable
+            senders = dict(self.senders)
+            default_target = (self.sender.api_url, self.method) if self.sender is not None else None
+            rows = self.connection.execute(f"SELECT id, item_json, attempts, api_url, method FROM outbox "
+                                           f"WHERE next_attempt_at <= ? AND {condition} ORDER BY id LIMIT ?",
+                                           (time.time(), *params, self.drain_batch)).fetchall()
+        if not rows:
+            return 0, 0, 0
+
+        items = [json.loads(item_json) for _, item_json, _, _, _ in rows]
+        targets = {}
+        for (row_id, item_json, attempts, api_url, method), item_data in zip(rows, items):
+            target = (api_url, method or 'POST') if api_url is not None else default_target
+            targets.setdefault(target, []).append(item_data)
+        delivered_ids = set()
+        for (api_url, method), target_items in targets.items():
+            delivered_ids.update(id(item_data) for item_data in senders[api_url].send_data(target_items, method))
+        delivered_rows, retry_rows, dead_rows, delivered_items = [], [], [], []
+        now = time.time()
+        for (row_id, item_json, attempts, _, _), item_data in zip(rows, items):
+            if id(item_data) in delivered_ids:
+                delivered_rows.append((row_id,))
+                delivered_items.append(item_data)
+            elif attempts + 1 >= self.max_attempts:
+                dead_rows.append((row_id, item_json, attempts + 1))
+            else:
+                retry_rows.append((attempts + 1, now + self._backoff(attempts + 1), row_id))
+
+        if dead_rows and not self._write_dead_letters(dead_rows):
+            # Не удалось записать dead-letter: оставляем элементы в очереди на следующую попытку
+            retry_rows.extend((attempts, now + self.max_backoff, row_id) for row_id, _, attempts in dead_rows)
+            dead_rows = []
+        with self._lock:
+            with self.connection:
+                self.connection.executemany("DELETE FROM outbox WHERE id = ?", delivered_rows)
+                self.connection.executemany("DELETE FROM outbox WHERE id = ?", ((row_id,) for row_id, _, _ in dead_rows))
+                self.connection.executemany("UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?", retry_rows)
+
+        if delivered_items and self.on_delivered:
+            self.on_delivered(delivered_items)
+        if retry_rows or dead_rows:
+            logging.warning(f"Outbox: {len(delivered_rows)} delivered, {len(retry_rows)} scheduled for retry, "
+                            f"{len(dead_rows)} moved to {self.dead_letter_file}.")
+        return len(delivered_rows), len(retry_rows), len(dead_rows)
+
+    def set_sender(self, sender, method='POST'):
+        """
+        Makes `sender`/`method` the target for items enqueued from now on. The outbox owns the sender:
+        it replaces (and closes) the previous sender for the same api_url, and close() closes them all.
+        """
+        with self._lock:
+            previous_sender = self.senders.get(sender.api_url)
+            self.senders[sender.api_url] = sender
+            self.sender = sender
+            self.method = method
+        if previous_sender is not None and previous_sender is not sender:
+            # Запрос дренажа, идущий через старую сессию, дозавершится: urllib3 закрывает только простаивающие соединения
+            previous_sender.close()
+        self._wake_event.set()
+
+    def _next_due_in(self):
+        with self._lock:
+            deliverable = self._deliverable_filter()
+            if deliverable is None:
+                return None
+            condition, params = deliverable
+            row = self.connection.execute(f"SELECT MIN(next_attempt_at) FROM outbox WHERE {condition}", params).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def _drain_loop(self, idle_interval):
+        while not self._stop_event.is_set():
+            try:
+                delivered, retried, dead = self.drain_once()
+                if delivered or retried or dead:
+                    continue # Возможно, в очереди есть еще готовые элементы
             except Exception as e:
-                logging.error(f"An unexpected error occurred during API send: {e}")
-        return successful_sends
+                logging.error(f"Outbox drainer error: {e}")
+            due_in = self._next_due_in()
+            wait_for = idle_interval if due_in is None else min(idle_interval, due_in)
+            self._wake_event.wait(timeout=wait_for)
+            self._wake_event.clear()
 
-class DuplicateChecker:
-    def __init__(self, history_file="processed_items_history.json", id_field='link'):
+    def start(self, idle_interval=30):
+        if self._drainer and self._drainer.is_alive():
+            return
+        self._stop_event.clear()
+        self._drainer = threading.Thread(target=self._drain_loop, args=(idle_interval,), daemon=True)
+        self._drainer.start()
+        logging.info("Outbox drainer started.")
+
+    def stop(self, timeout=10):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._drainer:
+            self._drainer.join(timeout)
+            self._drainer = None
+            logging.info("Outbox drainer stopped.")
+
+    def close(self):
+        self.stop()
+        for sender in self.senders.values():
+            sender.close()
+        with self._lock:
+            self.connection.close()
+
+class BloomFilterSlice:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.bits_set = 0
+
+    def _positions(self, h1, h2):
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, h1, h2):
+        for position in self._positions(h1, h2):
+            byte_index, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte_index] & mask:
+                self.bits[byte_index] |= mask
+                self.bits_set += 1
+        self.count += 1
+
+    def might_contain(self, h1, h2):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(h1, h2))
+
+    def false_positive_rate(self):
+        return (self.bits_set / self.num_bits) ** self.num_hashes
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that adds a larger slice with a tighter error rate each time the current one is full,
+    so the overall false-positive rate stays below `error_rate` however many IDs are added.
+    """
+    def __init__(self, initial_capacity=100000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.slices = []
+        self._lock = threading.Lock()
+        self._add_slice()
+
+    def _add_slice(self):
+        index = len(self.slices)
+        capacity = self.initial_capacity * (self.growth ** index)
+        slice_error_rate = self.error_rate * (1 - self.tightening) * (self.tightening ** index)
+        self.slices.append(BloomFilterSlice(capacity, slice_error_rate))
+
+    @staticmethod
+    def _hashes(item_id):
+        digest = hashlib.blake2b(item_id.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item_id):
+        h1, h2 = self._hashes(item_id)
+        with self._lock:
+            if self.slices[-1].count >= self.slices[-1].capacity:
+                self._add_slice()
+            self.slices[-1].add(h1, h2)
+
+    def __contains__(self, item_id):
+        h1, h2 = self._hashes(item_id)
+        return any(bloom_slice.might_contain(h1, h2) for bloom_slice in self.slices)
+
+    def __len__(self):
+        return sum(bloom_slice.count for bloom_slice in self.slices)
+
+    def memory_bytes(self):
+        return sum(len(bloom_slice.bits) for bloom_slice in self.slices)
+
+    def save(self, path, **metadata):
+        """
+        Atomically writes the filter: one JSON header line followed by the raw bit arrays of all slices.
+        """
+        with self._lock:
+            header = dict(metadata, initial_capacity=self.initial_capacity, error_rate=self.error_rate,
+                          growth=self.growth, tightening=self.tightening,
+                          slices=[{'capacity': bloom_slice.capacity, 'error_rate': bloom_slice.error_rate,
+                                   'count': bloom_slice.count, 'bits_set': bloom_slice.bits_set}
+                                  for bloom_slice in self.slices])
+            bit_arrays = [bytes(bloom_slice.bits) for bloom_slice in self.slices]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            for bits in bit_arrays:
+                f.write(bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns (filter, metadata) saved by save(). Raises ValueError if the file is damaged.
+        """
+        with open(path, 'rb') as f:
+            try:
+                header = json.loads(f.readline())
+                bloom = cls(initial_capacity=header['initial_capacity'], error_rate=header['error_rate'],
+                            growth=header['growth'], tightening=header['tightening'])
+                bloom.slices = []
+                for slice_header in header.pop('slices'):
+                    bloom_slice = BloomFilterSlice(slice_header['capacity'], slice_header['error_rate'])
+                    bits = f.read(len(bloom_slice.bits))
+                    if len(bits) != len(bloom_slice.bits):
+                        raise ValueError("truncated bit array")
+                    bloom_slice.bits = bytearray(bits)
+                    bloom_slice.count = slice_header['count']
+                    bloom_slice.bits_set = slice_header['bits_set']
+                    bloom.slices.append(bloom_slice)
+            except (KeyError, TypeError, json.JSONDecodeError) as e:
+                raise ValueError(f"invalid Bloom filter header: {e}") from e
+        if not bloom.slices:
+            raise ValueError("no slices")
+        return bloom, header
+
+    def estimated_false_positive_rate(self):
+        not_false_positive = 1.0
+        for bloom_slice in self.slices:
+            not_false_positive *= 1 - bloom_slice.false_positive_rate()
+        return 1 - not_false_positive
+
+class JsonHistoryStore:
+    """
+    Original history format: the whole ID list as one indented JSON array, rewritten on every save.
+    """
+    def __init__(self, history_file):
         self.history_file = history_file
-        self.id_field = id_field
         self.processed_ids = self._load_history()
-        logging.info(f"Loaded {len(self.processed_ids)} processed items from {self.history_file}.")
 
     def _load_history(self):
         if os.path.exists(self.history_file):
@@ -296,6 +2590,289 @@ class DuplicateChecker:
         except IOError as e:
             logging.error(f"Error saving history file {self.history_file}: {e}")
 
+    def contains_many(self, item_ids):
+        return {item_id for item_id in item_ids if item_id in self.processed_ids}
+
+    def add_many(self, item_ids):
+        initial_count = len(self.processed_ids)
+        self.processed_ids.update(item_ids)
+        added = len(self.processed_ids) - initial_count
+        if added:
+            self._save_history()
+        return added
+
+    def iter_ids(self):
+        return iter(list(self.processed_ids))
+
+    def count(self):
+        return len(self.processed_ids)
+
+    def close(self):
+        pass
+
+class AppendOnlyHistoryStore:
+    """
+    One ID per line, appended on every save. The log is rewritten (compacted) only when
+    duplicate lines from several writers make it `compact_ratio` times larger than the ID set.
+    Saves are cheap, but every ID is still loaded into an in-memory set at startup, so memory
+    grows with the history just like the 'json' backend; use 'sqlite' for large histories.
+    """
+    def __init__(self, history_file, compact_ratio=2.0):
+        self.history_file = history_file
+        self.compact_ratio = compact_ratio
+        self.processed_ids = set()
+        self.log_lines = 0
+        self._lock = threading.Lock()
+        if os.path.exists(self.history_file):
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    item_id = line.rstrip('\n')
+                    if item_id:
+                        self.processed_ids.add(item_id)
+                        self.log_lines += 1
+        self._maybe_compact()
+
+    def contains_many(self, item_ids):
+        return {item_id for item_id in item_ids if item_id in self.processed_ids}
+
+    def add_many(self, item_ids):
+        with self._lock:
+            new_ids = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in self.processed_ids]
+            if not new_ids:
+                return 0
+            try:
+                with open(self.history_file, 'a', encoding='utf-8') as f:
+                    f.write(''.join(f"{item_id}\n" for item_id in new_ids))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except IOError as e:
+                logging.error(f"Error appending to history file {self.history_file}: {e}")
+                return 0
+            self.processed_ids.update(new_ids)
+            self.log_lines += len(new_ids)
+            return len(new_ids)
+
+    def _maybe_compact(self):
+        if self.processed_ids and self.log_lines > self.compact_ratio * len(self.processed_ids):
+            self.compact()
+
+    def compact(self):
+        temp_file = self.history_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(''.join(f"{item_id}\n" for item_id in self.processed_ids))
+            os.replace(temp_file, self.history_file)
+            self.log_lines = len(self.processed_ids)
+            logging.info(f"Compacted history log {self.history_file} to {self.log_lines} IDs.")
+        except IOError as e:
+            logging.error(f"Error compacting history file {self.history_file}: {e}")
+
+    def iter_ids(self):
+        return iter(list(self.processed_ids))
+
+    def count(self):
+        return len(self.processed_ids)
+
+    def close(self):
+        pass
+
+class SqliteHistoryStore:
+    """
+    IDs in an indexed SQLite table. Nothing is loaded at startup; lookups and inserts are per batch.
+    Each ID keeps the time it was first seen, so old IDs can be expired.
+    """
+    LOOKUP_CHUNK = 500 # Ниже лимита SQLite на число параметров запроса
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+        self._lock = threading.Lock()
+        self.migrated = False
+        self.connection = sqlite3.connect(history_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS processed_items (item_id TEXT PRIMARY KEY, seen_at REAL NOT NULL DEFAULT 0) WITHOUT ROWID")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(processed_items)")]
+        if 'seen_at' not in columns:
+            self.connection.execute("ALTER TABLE processed_items ADD COLUMN seen_at REAL NOT NULL DEFAULT 0")
+            # Время первой встречи старых ID неизвестно: считаем их увиденными сейчас, иначе TTL удалит их все сразу
+            self.connection.execute("UPDATE processed_items SET seen_at = ? WHERE seen_at = 0", (time.time(),))
+            self.migrated = True
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_processed_items_seen_at ON processed_items (seen_at)")
+        self.connection.commit()
+
+    def contains_many(self, item_ids):
+        item_ids = list(item_ids)
+        found = set()
+        with self._lock:
+            for start in range(0, len(item_ids), self.LOOKUP_CHUNK):
+                chunk = item_ids[start:start + self.LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(f"SELECT item_id FROM processed_items WHERE item_id IN ({placeholders})", chunk)
+                found.update(row[0] for row in rows)
+        return found
+
+    def add_many(self, item_ids):
+        with self._lock:
+            before = self.connection.total_changes
+            with self.connection:
+                seen_at = time.time()
+                self.connection.executemany("INSERT OR IGNORE INTO processed_items (item_id, seen_at) VALUES (?, ?)",
+                                            ((item_id, seen_at) for item_id in item_ids))
+            return self.connection.total_changes - before
+
+    def expire(self, max_age_seconds):
+        with self._lock:
+            with self.connection:
+                cursor = self.connection.execute("DELETE FROM processed_items WHERE seen_at < ?", (time.time() - max_age_seconds,))
+            return cursor.rowcount
+
+    def iter_ids(self, seen_since=None):
+        # Отдельный курсор, чтобы не держать все ID в памяти
+        cursor = self.connection.cursor()
+        if seen_since is None:
+            cursor.execute("SELECT item_id FROM processed_items")
+        else:
+            cursor.execute("SELECT item_id FROM processed_items WHERE seen_at >= ?", (seen_since,))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(10000)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+
+    def count(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM processed_items").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+# 'json' и 'log' держат все ID в памяти (set), 'sqlite' - только текущую пачку.
+# Для больших историй нужен 'sqlite': DuplicateChecker(..., backend='sqlite', migrate_from=<старый файл>)
+HISTORY_BACKENDS = {
+    'json': JsonHistoryStore,
+    'log': AppendOnlyHistoryStore,
+    'sqlite': SqliteHistoryStore,
+}
+
+class DuplicateChecker:
+    BLOOM_CATCH_UP_MARGIN = 300 # секунд
+    LARGE_IN_MEMORY_HISTORY = 1000000 # ID; больше - предупреждаем и советуем 'sqlite'
+
+    def __init__(self, history_file="processed_items_history.json", id_field='link', backend='json', migrate_from=None,
+                 bloom_capacity=None, bloom_error_rate=0.001, ttl_seconds=None):
+        """
+        backend: 'json' (whole file rewritten per save), 'log' (append-only with compaction)
+        or 'sqlite' (nothing loaded at startup). 'json' and 'log' keep every ID in memory, so
+        only 'sqlite' bounds memory for large histories. `migrate_from` imports IDs from an old
+        'json' or 'log' history file the first time a new store is created.
+        bloom_capacity (sqlite only) enables a scalable Bloom filter in front of the store: IDs it has
+        never seen skip the store lookup. ttl_seconds (sqlite only) expires IDs older than the TTL.
+        """
+        if backend not in HISTORY_BACKENDS:
+            logging.error(f"Unsupported history backend: {backend}. Falling back to 'json'.")
+            backend = 'json'
+        if ttl_seconds and backend != 'sqlite':
+            logging.error(f"TTL expiry needs the 'sqlite' history backend, not '{backend}'. TTL disabled.")
+            ttl_seconds = None
+        if bloom_capacity and backend != 'sqlite':
+            # 'json' и 'log' и так держат все ID в set: фильтр добавил бы только память и ложные срабатывания
+            logging.error(f"Bloom prefilter needs the 'sqlite' history backend, not '{backend}'. Prefilter disabled.")
+            bloom_capacity = None
+        self.history_file = history_file
+        self.id_field = id_field
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom = None
+        self.bloom_expired_ids = 0 # Удаленные из хранилища ID, которые еще числятся в фильтре
+        # Фильтр сохраняется рядом с историей, чтобы старт не требовал прохода по всем ID
+        self.bloom_file = f"{history_file}.bloom"
+        self.last_expiry_at = 0
+        self.counters = {'checked': 0, 'duplicates': 0, 'bloom_skips': 0, 'bloom_false_positives': 0, 'expired': 0}
+        is_new_store = not os.path.exists(history_file)
+        self.store = HISTORY_BACKENDS[backend](history_file)
+        if is_new_store and migrate_from and migrate_from != history_file and os.path.exists(migrate_from):
+            migrated = self.store.add_many(self._read_history_ids(migrate_from))
+            logging.info(f"Migrated {migrated} processed items from {migrate_from} to {history_file}.")
+        if backend == 'sqlite':
+            logging.info(f"Opened processed items history {self.history_file} (sqlite).")
+        else:
+            stored_ids = self.store.count()
+            logging.info(f"Loaded {stored_ids} processed items from {self.history_file}.")
+            if stored_ids > self.LARGE_IN_MEMORY_HISTORY:
+                logging.warning(f"History {self.history_file} keeps {stored_ids} IDs in memory with the '{backend}' backend. "
+                                f"Use backend='sqlite' with migrate_from='{self.history_file}' to bound memory.")
+        if self.bloom_capacity:
+            # Полная пересборка - только для нового или мигрированного хранилища либо без сохраненного фильтра
+            if is_new_store or getattr(self.store, 'migrated', False) or not self._load_bloom():
+                self._rebuild_bloom()
+        if self.ttl_seconds:
+            self.expire_old_ids()
+
+    @staticmethod
+    def _read_history_ids(history_file):
+        with open(history_file, 'r', encoding='utf-8') as f:
+            is_json = f.read(64).lstrip().startswith('[')
+        if is_json:
+            return JsonHistoryStore(history_file).processed_ids
+        # Журнал 'log' только читаем: без компактизации старого файла
+        return AppendOnlyHistoryStore(history_file, compact_ratio=float('inf')).processed_ids
+
+    def _rebuild_bloom(self):
+        self.bloom = ScalableBloomFilter(initial_capacity=self.bloom_capacity, error_rate=self.bloom_error_rate)
+        self.bloom_expired_ids = 0
+        for item_id in self.store.iter_ids():
+            self.bloom.add(item_id)
+        logging.info(f"Built Bloom prefilter over {len(self.bloom)} IDs ({self.bloom.memory_bytes() / 1024:.0f} KiB).")
+
+    def _load_bloom(self):
+        if not os.path.exists(self.bloom_file):
+            return False
+        try:
+            bloom, metadata = ScalableBloomFilter.load(self.bloom_file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load Bloom prefilter from {self.bloom_file}: {e}. Rebuilding it.")
+            return False
+        if (bloom.initial_capacity, bloom.error_rate) != (self.bloom_capacity, self.bloom_error_rate) or 'saved_at' not in metadata:
+            return False
+        # Догоняем ID, записанные после сохранения фильтра (например, если процесс упал до close()).
+        # Запас по времени покрывает гонку записи с сохранением и небольшие сдвиги часов
+        caught_up = 0
+        for item_id in self.store.iter_ids(seen_since=metadata['saved_at'] - self.BLOOM_CATCH_UP_MARGIN):
+            if item_id not in bloom:
+                bloom.add(item_id)
+                caught_up += 1
+        self.bloom = bloom
+        self.bloom_expired_ids = metadata.get('expired_ids', 0)
+        logging.info(f"Loaded Bloom prefilter over {len(bloom)} IDs from {self.bloom_file} ({caught_up} added since it was saved).")
+        return True
+
+    def save_bloom(self):
+        if self.bloom is not None:
+            self.bloom.save(self.bloom_file, saved_at=time.time(), expired_ids=self.bloom_expired_ids)
+
+    def expire_old_ids(self):
+        """
+        Deletes IDs older than ttl_seconds. The Bloom prefilter is rebuilt once expired IDs make up
+        half of it, so memory stays bounded without a full scan after every expiry.
+        """
+        if not self.ttl_seconds:
+            return 0
+        self.last_expiry_at = time.time()
+        expired = self.store.expire(self.ttl_seconds)
+        if expired:
+            self.counters['expired'] += expired
+            logging.info(f"Expired {expired} IDs older than {self.ttl_seconds}s from history.")
+            if self.bloom is not None:
+                # Удаленные ID в фильтре дают лишь ложные срабатывания, а не пропуски
+                self.bloom_expired_ids += expired
+                if self.bloom_expired_ids * 2 > len(self.bloom):
+                    self._rebuild_bloom()
+        return expired
+
     def get_item_id(self, item):
         item_id = item.get(self.id_field)
         if item_id:
@@ -312,29 +2889,77 @@ class DuplicateChecker:
         return None
 
     def filter_new_items(self, items):
-        new_items = []
+        identified_items = []
         for item in items:
             item_id = self.get_item_id(item)
             if item_id:
-                if item_id not in self.processed_ids:
-                    new_items.append(item)
+                identified_items.append((item_id, item))
             else:
                 logging.warning(f"Skipping duplicate check for item due to no identifiable ID: {item}")
-        return new_items
+        item_ids = [item_id for item_id, _ in identified_items]
+        if self.bloom is not None:
+            # Если фильтр Блума не видел ID, он точно новый — в хранилище не идем
+            candidate_ids = [item_id for item_id in item_ids if item_id in self.bloom]
+            self.counters['bloom_skips'] += len(item_ids) - len(candidate_ids)
+        else:
+            candidate_ids = item_ids
+        with METRICS.timer('dedupe_lookup_seconds', backend=self.backend):
+            known_ids = self.store.contains_many(candidate_ids)
+        duplicate_count = sum(1 for item_id in item_ids if item_id in known_ids)
+        self.counters['checked'] += len(item_ids)
+        self.counters['duplicates'] += duplicate_count
+        if self.bloom is not None:
+            self.counters['bloom_false_positives'] += len(set(candidate_ids) - known_ids)
+        history = os.path.basename(self.history_file)
+        METRICS.inc('dedupe_checked_items_total', len(item_ids), history=history)
+        METRICS.inc('dedupe_duplicate_items_total', duplicate_count, history=history)
+        METRICS.inc('dedupe_bloom_skips_total', len(item_ids) - len(candidate_ids), history=history)
+        return [item for item_id, item in identified_items if item_id not in known_ids]
 
     def mark_as_processed(self, items):
         if not items:
             return
-        initial_count = len(self.processed_ids)
-        for item in items:
-            item_id = self.get_item_id(item)
-            if item_id:
-                self.processed_ids.add(item_id)
-        if len(self.processed_ids) > initial_count:
-            self._save_history()
-            logging.info(f"Added {len(self.processed_ids) - initial_count} new IDs to history.")
+        item_ids = [item_id for item_id in (self.get_item_id(item) for item in items) if item_id]
+        added = self.store.add_many(item_ids)
+        if self.bloom is not None:
+            for item_id in item_ids:
+                self.bloom.add(item_id)
+        if added:
+            logging.info(f"Added {added} new IDs to history.")
         else:
             logging.info("No new unique IDs to add to history.")
+        if self.ttl_seconds and time.time() - self.last_expiry_at >= self.ttl_seconds / 4:
+            self.expire_old_ids()
+
+    def stats(self):
+        """
+        Counters and memory figures for sizing the prefilter. observed_false_positive_rate is the
+        share of new IDs the Bloom filter wrongly reported as possibly seen.
+        """
+        stats = dict(self.counters)
+        stats['stored_ids'] = self.store.count()
+        if self.bloom is not None:
+            new_ids = stats['bloom_skips'] + stats['bloom_false_positives']
+            stats['bloom_ids'] = len(self.bloom)
+            stats['bloom_slices'] = len(self.bloom.slices)
+            stats['bloom_memory_bytes'] = self.bloom.memory_bytes()
+            stats['estimated_false_positive_rate'] = self.bloom.estimated_false_positive_rate()
+            stats['observed_false_positive_rate'] = stats['bloom_false_positives'] / new_ids if new_ids else 0.0
+        return stats
+
+    def stats_report(self):
+        stats = self.stats()
+        report = (f"Duplicate check: {stats['checked']} checked, {stats['duplicates']} duplicates, "
+                  f"{stats['stored_ids']} IDs stored, {stats['expired']} expired")
+        if self.bloom is not None:
+            report += (f"; Bloom: {stats['bloom_ids']} IDs in {stats['bloom_slices']} slices, "
+                       f"{stats['bloom_memory_bytes'] / 1024:.0f} KiB, {stats['bloom_skips']} store lookups skipped, "
+                       f"FPR observed {stats['observed_false_positive_rate']:.4%} / estimated {stats['estimated_false_positive_rate']:.4%}")
+        return report
+
+    def close(self):
+        self.save_bloom()
+        self.store.close()
 
 
 def save_data_to_csv(data_list, filename="output.csv"):
@@ -365,6 +2990,312 @@ def save_data_to_json(data_list, filename="output.json"):
         logging.error(f"Error saving JSON file {filename}: {e}")
 
 
+class StreamingExporter(ABC):
+    """
+    Base for exporters that write items as pages are extracted. The file is created on the first
+    non-empty batch and flushed after every batch, so a crashed run leaves its partial output on disk.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.output_file = None
+        self.count = 0
+
+    @abstractmethod
+    def _open(self):
+        """Creates the output file (sets self.output_file) and writes any header."""
+
+    @abstractmethod
+    def _write(self, items):
+        """Writes one non-empty batch of items."""
+
+    def write_items(self, items):
+        if not items:
+            return
+        try:
+            if self.output_file is None:
+                self._open()
+            self._write(items)
+            self.output_file.flush()
+            self.count += len(items)
+        except IOError as e:
+            logging.error(f"Error writing to {self.filename}: {e}")
+
+    def close(self):
+        if self.output_file is None:
+            logging.warning(f"No data to save to {self.filename}.")
+            return
+        self.output_file.close()
+        self.output_file = None
+        logging.info(f"Data successfully saved to {self.filename} ({self.count} items)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class StreamingCsvWriter(StreamingExporter):
+    """
+    Incremental CSV: the header comes from the configured field names instead of a scan over all items.
+    """
+    def __init__(self, filename, fieldnames):
+        super().__init__(filename)
+        self.fieldnames = list(fieldnames)
+        self.dict_writer = None
+
+    def _open(self):
+        self.output_file = open(self.filename, 'w', newline='', encoding='utf-8')
+        self.dict_writer = csv.DictWriter(self.output_file, fieldnames=self.fieldnames, extrasaction='ignore')
+        self.dict_writer.writeheader()
+
+    def _write(self, items):
+        self.dict_writer.writerows(items)
+
+class JsonLinesWriter(StreamingExporter):
+    """
+    One JSON object per line; every complete line is a valid record even if the run stops midway.
+    """
+    def _open(self):
+        self.output_file = open(self.filename, 'w', encoding='utf-8')
+
+    def _write(self, items):
+        self.output_file.write(''.join(json.dumps(item_data, ensure_ascii=False) + "\n" for item_data in items))
+
+class JsonArrayWriter(StreamingExporter):
+    """
+    The format of save_data_to_json (one indented JSON array) written incrementally.
+    The closing bracket is written on close(), so unlike JSON Lines a crashed run leaves an incomplete array.
+    """
+    def _open(self):
+        self.output_file = open(self.filename, 'w', encoding='utf-8')
+        self.output_file.write("[\n")
+
+    def _write(self, items):
+        chunks = []
+        for index, item_data in enumerate(items):
+            item_json = json.dumps(item_data, ensure_ascii=False, indent=4)
+            separator = ",\n" if self.count or index else ""
+            chunks.append(separator + "\n".join("    " + line for line in item_json.split("\n")))
+        self.output_file.write(''.join(chunks))
+
+    def close(self):
+        if self.output_file is not None:
+            self.output_file.write("\n]")
+        super().close()
+
+class ColumnarWriter(StreamingExporter):
+    """
+    Parquet or Arrow IPC file with one typed column per configured field. Rows are buffered and
+    written as a row group (Parquet) or record batch (Arrow) every `row_group_size` items.
+    field_types maps field names to 'string', 'int', 'float', 'bool', 'timestamp' or 'auto' (the default).
+    'auto' columns get their type from the values of the first batch. A later value that does not fit
+    its column's type widens that column to string (row groups already on disk are rewritten once), so
+    no value is ever dropped; empty strings in non-string columns are stored as nulls.
+    """
+    FORMATS = ('parquet', 'arrow')
+    TYPES = ('auto', 'string', 'int', 'float', 'bool', 'timestamp')
+    INT_PATTERN = re.compile(r'-?(?:0|[1-9]\d*)')
+    FLOAT_PATTERN = re.compile(r'-?(?:0|[1-9]\d*)?\.\d+(?:[eE][-+]?\d+)?|-?(?:0|[1-9]\d*)(?:\.\d*)?[eE][-+]?\d+')
+    TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?')
+
+    def __init__(self, filename, fieldnames, field_types=None, file_format='parquet', row_group_size=50000, compression='zstd'):
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed. Columnar export is not available.")
+        if file_format not in self.FORMATS:
+            raise ValueError(f"Unsupported columnar format: {file_format}. Use 'parquet' or 'arrow'.")
+        super().__init__(filename)
+        self.fieldnames = list(fieldnames)
+        self.field_types = {name: (field_types or {}).get(name) or 'auto' for name in self.fieldnames}
+        for type_name in self.field_types.values():
+            if type_name != 'auto':
+                self._arrow_type(type_name)
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = None
+        self.buffered_rows = []
+        self.arrow_writer = None
+
+    @staticmethod
+    def _arrow_type(type_name):
+        arrow_types = {
+            'string': pa.string(),
+            'int': pa.int64(),
+            'float': pa.float64(),
+            'bool': pa.bool_(),
+            'timestamp': pa.timestamp('us'),
+        }
+        if type_name not in arrow_types:
+            raise ValueError(f"Unsupported column type: {type_name}")
+        return arrow_types[type_name]
+
+    @staticmethod
+    def _convert(value, type_name):
+        """Value converted to the column type; raises TypeError/ValueError when it does not fit."""
+        if value is None:
+            return None
+        if type_name == 'string':
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        if isinstance(value, str):
+            value = value.strip()
+            if value == '':
+                return None
+        if type_name == 'int':
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(f"{value!r} is not an integer")
+            return int(value)
+        if type_name == 'float':
+            return float(value)
+        if type_name == 'bool':
+            if isinstance(value, bool):
+                return value
+            flag = str(value).lower()
+            if flag in ('1', 'true', 'yes'):
+                return True
+            if flag in ('0', 'false', 'no'):
+                return False
+            raise ValueError(f"{value!r} is not a boolean")
+        if type_name == 'timestamp':
+            return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+        raise ValueError(f"Unsupported column type: {type_name}")
+
+    @classmethod
+    def _value_type(cls, value):
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        if isinstance(value, datetime):
+            return 'timestamp'
+        if not isinstance(value, str):
+            return 'string'
+        value = value.strip()
+        if cls.INT_PATTERN.fullmatch(value):
+            return 'int'
+        if cls.FLOAT_PATTERN.fullmatch(value):
+            return 'float'
+        if value.lower() in ('true', 'false'):
+            return 'bool'
+        if cls.TIMESTAMP_PATTERN.fullmatch(value):
+            try:
+                datetime.fromisoformat(value)
+                return 'timestamp'
+            except ValueError:
+                pass
+        return 'string'
+
+    @classmethod
+    def infer_type(cls, values):
+        """Narrowest column type that holds every non-empty value; int and float mix into float."""
+        value_types = {cls._value_type(value) for value in values if value is not None and value != ''}
+        if value_types == {'int', 'float'}:
+            return 'float'
+        if len(value_types) == 1:
+            return value_types.pop()
+        return 'string'
+
+    def _resolve_schema(self, items):
+        # Типы 'auto' определяются по первой пачке: схема Parquet фиксируется при создании файла
+        for name in self.fieldnames:
+            if self.field_types[name] == 'auto':
+                self.field_types[name] = self.infer_type(item.get(name) for item in items)
+        self.schema = pa.schema([(name, self._arrow_type(self.field_types[name])) for name in self.fieldnames])
+        logging.info(f"Column types for {self.filename}: {self.field_types}")
+
+    def _open(self):
+        if self.file_format == 'parquet':
+            self.arrow_writer = pq.ParquetWriter(self.filename, self.schema, compression=self.compression)
+        else:
+            self.output_file = pa.OSFile(self.filename, 'wb')
+            self.arrow_writer = pa.ipc.new_file(self.output_file, self.schema)
+
+    def _write_batch(self, batch):
+        if self.file_format == 'parquet':
+            self.arrow_writer.write_batch(batch, row_group_size=self.row_group_size)
+        else:
+            self.arrow_writer.write_batch(batch)
+
+    def _column_values(self, name):
+        type_name = self.field_types[name]
+        try:
+            return [self._convert(row.get(name), type_name) for row in self.buffered_rows]
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Column '{name}' in {self.filename} does not fit type '{type_name}' ({e}). Storing it as string.")
+            self.field_types[name] = 'string'
+            return [self._convert(row.get(name), 'string') for row in self.buffered_rows]
+
+    def _rewrite_written_rows(self):
+        # Схема файла фиксирована: записанные группы строк переписываются в файл с расширенной схемой
+        self.arrow_writer.close()
+        if self.output_file is not None:
+            self.output_file.close()
+        written_file = f"{self.filename}.widening"
+        os.replace(self.filename, written_file)
+        try:
+            self._open()
+            if self.file_format == 'parquet':
+                with pq.ParquetFile(written_file) as parquet_file:
+                    for batch in parquet_file.iter_batches(batch_size=self.row_group_size):
+                        self._write_batch(batch.cast(self.schema))
+            else:
+                with pa.memory_map(written_file) as source:
+                    reader = pa.ipc.open_file(source)
+                    for index in range(reader.num_record_batches):
+                        self._write_batch(reader.get_batch(index).cast(self.schema))
+        finally:
+            os.remove(written_file)
+        logging.info(f"Column types for {self.filename} widened: {self.field_types}")
+
+    def _flush_row_group(self):
+        if not self.buffered_rows:
+            return
+        previous_types = dict(self.field_types)
+        values = {name: self._column_values(name) for name in self.fieldnames}
+        if self.field_types != previous_types:
+            self.schema = pa.schema([(name, self._arrow_type(self.field_types[name])) for name in self.fieldnames])
+            if self.arrow_writer is not None:
+                self._rewrite_written_rows()
+        if self.arrow_writer is None:
+            self._open()
+        columns = [pa.array(values[name], type=self.schema.field(name).type) for name in self.fieldnames]
+        self._write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        self.buffered_rows = []
+
+    def _write(self, items):
+        self.buffered_rows.extend(items)
+        if len(self.buffered_rows) >= self.row_group_size:
+            self._flush_row_group()
+
+    def write_items(self, items):
+        # Буфер сбрасывается группами строк, а не после каждой пачки
+        if not items:
+            return
+        try:
+            if self.schema is None:
+                self._resolve_schema(items)
+            self._write(items)
+            self.count += len(items)
+        except (IOError, pa.ArrowException) as e:
+            logging.error(f"Error writing to {self.filename}: {e}")
+
+    def close(self):
+        if self.arrow_writer is None and not self.buffered_rows:
+            logging.warning(f"No data to save to {self.filename}.")
+            return
+        try:
+            self._flush_row_group()
+            self.arrow_writer.close()
+            if self.output_file is not None:
+                self.output_file.close()
+            logging.info(f"Data successfully saved to {self.filename} ({self.count} items)")
+        except (IOError, pa.ArrowException) as e:
+            logging.error(f"Error closing {self.filename}: {e}")
+        self.output_file = None
+        self.arrow_writer = None
+
+
 if __name__ == "__main__":
     logging.info("This file is intended to be imported by parser_gui.py.")
     logging.info("Running a simple test for API Sender and Duplicate Checker:")
@@ -403,4 +3334,4 @@ if __name__ == "__main__":
         logging.info(f"  New: {item.get('title')}")
     
     duplicate_checker.mark_as_processed(filtered_items)
-    logging.info(f"Current processed IDs: {duplicate_checker.processed_ids}")
\ No newline at end of file
+    logging.info(f"Current processed IDs: {duplicate_checker.store.count()}")
\ No newline at end of file